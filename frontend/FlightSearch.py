@@ -1,87 +1,219 @@
+import copy
 import requests
-from random import randint
-import pandas as pd
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import timedelta
+from heapq import heappop, heappush
+from itertools import count, islice
 import re
 import os
-import networkx as nx
-from networkx.algorithms.shortest_paths.weighted import dijkstra_path
-import matplotlib.pyplot as plt
-import google.generativeai as genai
+from .lazy import LazyModule
+from .locks import ReadWriteLock, reads_graph
+from .lower_bounds import AirportLowerBounds
+from .normalize import normalize_flights
+from .airport_codes import llm_answer_cache, match_airport_codes, normalize_query, resolver_stats
+from .aviationstack import AVIATIONSTACK_URL, AviationStackClient
+from .connection_scan import ConnectionScan
+from .csr_graph import CSRFlightGraph, epoch_ns
+from .fare_matrix import FareMatrix
+from .flight_table import compact_flights, concat_flights
+from .instrumentation import increment, stage, timed_stage
+from .k_cheapest import CheapestPaths
+from .pareto import pareto_search
+from .response_cache import DEFAULT_TTL, ResponseCache
+from .route_map import render_route_map, route_summary
+from .search_graph import CSRSearchGraph, NetworkxSearchGraph
+from .snapshot import load_fare_matrix, load_snapshot, save_fare_matrix, save_snapshot
+
+# Bibliotecas pesadas, importadas só quando usadas: a maioria das requisições não
+# desenha rotas nem chama o Gemini
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+nx = LazyModule('networkx')
+genai = LazyModule('google.generativeai')
+
+# Tempo mínimo de conexão entre dois voos no mesmo aeroporto
+MIN_CONNECTION_TIME = timedelta(hours=1)
+
+# Status dos voos cancelados, que ficam fora do grafo
+CANCELLED_STATUS = 'cancelled'
+
+# Estratégias disponíveis em FlightSearch.find_cheapest_path
+SEARCH_MODES = ('super_source', 'pairwise')
+
+# Implementações do grafo temporal: networkx ou arrays NumPy (CSR)
+GRAPH_BACKENDS = ('networkx', 'csr')
+
+# Atributos que apply_flight_delta monta em uma cópia e troca de uma vez no FlightSearch
+STAGED_ATTRIBUTES = ('df_flights', 'time_aware_graph', 'csr_graph', '_airport_times', '_lower_bounds',
+                     'graph_version')
+
+# Modelo do Gemini usado na extração de códigos de aeroporto
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
+
+_gemini_models = {}
+_gemini_lock = threading.Lock()
+
+
+def share_graph(graph):
+    """Cópia de um DiGraph que compartilha os atributos de nós e arestas com o original.
+
+    Copia só os dicionários de adjacência (~20x mais rápido que graph.copy()); quem
+    altera a cópia deve substituir os atributos de uma aresta, não alterá-los.
+    """
+    shared = graph.__class__()
+    shared.graph.update(graph.graph)
+    shared._node.update(graph._node)
+    shared._adj.update((node, dict(neighbors)) for node, neighbors in graph._adj.items())
+    shared._pred.update((node, dict(predecessors)) for node, predecessors in graph._pred.items())
+    return shared
+
+
+def shared_gemini_model(api_key):
+    """Modelo Gemini do processo, configurado uma única vez no primeiro uso (None sem chave)"""
+    if not api_key:
+        return None
+    with _gemini_lock:
+        model = _gemini_models.get(api_key)
+        if model is None:
+            genai.configure(api_key=api_key)
+            model = _gemini_models[api_key] = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return model
+
 
 class FlightSearch:
-    def __init__(self, df_flights=None):
+    def __init__(self, df_flights=None, backend='networkx'):
+        if backend not in GRAPH_BACKENDS:
+            raise ValueError(f"Unknown graph backend: {backend}")
         self.api_key = os.getenv('AviationStack_api_key')
         self.google_api_key = os.getenv('GOOGLE_API_KEY')
-        self.url = "http://api.aviationstack.com/v1/flights"
+        self.url = os.getenv('AVIATIONSTACK_URL', AVIATIONSTACK_URL)
+        # Cache em disco das páginas da API (vazio desliga) e modo replay, que só usa o cache
+        self.response_cache_dir = os.getenv('AVIATIONSTACK_CACHE_DIR') or None
+        self.response_cache_ttl = int(os.getenv('AVIATIONSTACK_CACHE_TTL', DEFAULT_TTL))
+        self.replay = os.getenv('AVIATIONSTACK_REPLAY', 'false').lower() in ('1', 'true', 'yes')
         self.df_flights = df_flights
+        self.backend = backend
         self.time_aware_graph = None
-        self.gemini_model = None
-        self._initialize_gemini()
-
-    def _initialize_gemini(self):
-        """Inicializa o modelo Gemini para processamento de linguagem natural"""
-        if self.google_api_key:
-            genai.configure(api_key=self.google_api_key)
-            self.gemini_model = genai.GenerativeModel('gemini-2.5-flash-lite')
-
-    def fetch_flights(self):
-        """Busca dados de voos da API AviationStack"""
-        params = {'access_key': self.api_key}
+        self.csr_graph = None
+        self._search_graph = None
+        self._lower_bounds = None
+        self._fare_matrix = None
+        self._fare_matrix_lock = threading.Lock()
+        self._airport_times = None
+        self._connection_scan = None
+        self._known_airport_codes = None
+        self._gemini_model = None
+        # Buscas leem o grafo em paralelo; apply_flight_delta o troca sozinho
+        self.graph_lock = ReadWriteLock()
+        # Serializa as atualizações, montadas fora do graph_lock
+        self._delta_lock = threading.Lock()
+        # Incrementado a cada construção ou atualização do grafo
+        self.graph_version = 0
+        # Imagens do mapa de rotas por (graph_version, formato)
+        self._route_maps = {}
+
+    @property
+    def gemini_model(self):
+        """Modelo Gemini para processamento de linguagem natural, criado só quando necessário"""
+        if self._gemini_model is None:
+            self._gemini_model = shared_gemini_model(self.google_api_key)
+        return self._gemini_model
+
+    @gemini_model.setter
+    def gemini_model(self, model):
+        self._gemini_model = model
+
+    def fetch_flights(self, build_graph=True, max_pages=None):
+        """Busca dados de voos da API AviationStack, percorrendo todas as páginas"""
         try:
-            response = requests.get(self.url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            flight_list = []
-            if 'data' in data and data['data']:
-                for flight in data['data']:
-                    flight_data = self._extract_flight_data(flight)
-                    if all(flight_data.values()):
-                        flight_list.append(flight_data)
-            
-            self.df_flights = pd.DataFrame(flight_list)
-            self._process_flight_data()
-            return self.df_flights
+            frames = list(self.iter_flight_pages(max_pages=max_pages))
+            df_flights = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            self.df_flights = df_flights
+            self._process_flight_data(build_graph=build_graph)
+            return df_flights
             
         except requests.exceptions.RequestException as e:
             print(f"Error fetching data from AviationStack API: {e}")
             print("Please ensure your API key is correct and you are subscribed to the service.")
             return None
 
-    def _extract_flight_data(self, flight):
-        """Extrai dados relevantes de um voo"""
-        return {
-            'flight_iata': flight.get('flight', {}).get('iata', ''),
-            'flight_icao': flight.get('flight', {}).get('icao', ''),
-            'airline_name': flight.get('airline', {}).get('name'),
-            'airline_iata': flight.get('airline', {}).get('iata', ''),
-            'airline_icao': flight.get('airline', {}).get('icao', ''),
-            'flight_number': flight.get('flight', {}).get('number'),
-            'departure_airport': flight.get('departure', {}).get('airport'),
-            'departure_scheduled': flight.get('departure', {}).get('scheduled'),
-            'departure_iata': flight.get('departure', {}).get('iata'),
-            'arrival_airport': flight.get('arrival', {}).get('airport'),
-            'arrival_iata': flight.get('arrival', {}).get('iata'),
-            'arrival_scheduled': flight.get('arrival', {}).get('scheduled'),
-            'status': flight.get('flight_status', 'scheduled'),
-            'preco': randint(0, 100000) / 100  # Preço simulado
-        }
-
-    def _process_flight_data(self):
-        """Processa os dados dos voos para análise"""
+    def iter_flight_pages(self, max_pages=None, max_workers=4, cache=None):
+        """Gera um DataFrame por página da API, à medida que as páginas chegam.
+
+        cache (padrão: response_cache()) é o ResponseCache usado pelo cliente.
+        """
+        if cache is None:
+            cache = self.response_cache()
+        client = AviationStackClient(self.api_key, url=self.url, max_pages=max_pages, max_workers=max_workers,
+                                     cache=cache)
+        try:
+            for page in client.iter_pages():
+                yield self._page_to_dataframe(page)
+        finally:
+            client.close()
+
+    def response_cache(self):
+        """Cache em disco das páginas da API, ou None se AVIATIONSTACK_CACHE_DIR não está definido"""
+        if self.response_cache_dir is None:
+            if self.replay:
+                raise ValueError("Replay mode requires a response cache directory (AVIATIONSTACK_CACHE_DIR)")
+            return None
+        return ResponseCache(self.response_cache_dir, ttl=self.response_cache_ttl, replay=self.replay)
+
+    def _page_to_dataframe(self, page):
+        """Extrai os voos completos de uma página da API"""
+        return normalize_flights(page.get('data') or [])
+
+    @classmethod
+    def from_snapshot(cls, directory, version):
+        """Cria um FlightSearch (backend CSR) a partir do snapshot de uma versão dos dados, ou None"""
+        loaded = load_snapshot(directory, version)
+        if loaded is None:
+            return None
+        fs = cls(loaded[1], backend='csr')
+        fs.csr_graph = loaded[0]
+        fs._fare_matrix = load_fare_matrix(directory, version)
+        print(f"Time-aware CSR graph loaded from snapshot in {directory}.")
+        return fs
+
+    def save_snapshot(self, directory, version):
+        """Grava o grafo (no formato CSR) e os voos em um snapshot versionado; retorna o caminho"""
+        if self.df_flights is None or self.df_flights.empty:
+            raise ValueError("No flights loaded to snapshot")
+        return save_snapshot(self, directory, version)
+
+    def _process_flight_data(self, build_graph=True):
+        """Processa os dados dos voos para análise, guardando-os no formato compacto (ver compact_flights)"""
+        self._known_airport_codes = None
+        self._connection_scan = None
         if self.df_flights is not None and not self.df_flights.empty:
-            self.df_flights['departure_scheduled'] = pd.to_datetime(self.df_flights['departure_scheduled'])
-            self.df_flights['arrival_scheduled'] = pd.to_datetime(self.df_flights['arrival_scheduled'])
-            
-            # Mostra os primeiros registros processados
-            processed = self.df_flights[['departure_airport', 'arrival_airport', 'preco', 'departure_scheduled', 'arrival_scheduled']]
-            print("Processed Flights Data:")
-            print(processed.head())
+            with stage('process_flights'):
+                self.df_flights = compact_flights(self.df_flights)
+
+                # Mostra os primeiros registros processados
+                processed = self.df_flights[['departure_iata', 'arrival_iata', 'preco', 'departure_scheduled', 'arrival_scheduled']]
+                print("Processed Flights Data:")
+                print(processed.head())
             
-            self._create_time_aware_graph()
+            if build_graph:
+                self._create_time_aware_graph()
 
+    @timed_stage('graph_build')
     def _create_time_aware_graph(self):
         """Cria um grafo temporal das rotas de voo considerando conexões possíveis"""
+        self._search_graph = None
+        self._fare_matrix = None
+        self._airport_times = None
+        self.graph_version += 1
+        # Os limites inferiores do A* são recalculados junto com o grafo
+        self._lower_bounds = AirportLowerBounds.from_flights(self.df_flights)
+        if self.backend == 'csr':
+            self.csr_graph = CSRFlightGraph.from_flights(self.df_flights)
+            print("Time-aware CSR graph created with airport-time nodes, including possible connections.")
+            return
+
         self.time_aware_graph = nx.DiGraph()
         
         # Primeiro, adiciona todos os voos diretos
@@ -90,40 +222,261 @@ class FlightSearch:
             destination_node = (row['arrival_iata'], row['arrival_scheduled'])
             self.time_aware_graph.add_edge(origin_node, destination_node, 
                                          weight=row['preco'],
-                                         flight_number=row['flight_number'])
+                                         flight_number=row['flight_number'],
+                                         flight_id=row.get('id'))
         
-        # Depois, procura por conexões possíveis
-        nodes = list(self.time_aware_graph.nodes())
-        for node1 in nodes:
-            airport1, time1 = node1
-            for node2 in nodes:
-                airport2, time2 = node2
-                # Se os aeroportos são os mesmos e há pelo menos 1 hora de diferença
-                if (airport1 == airport2 and 
-                    time1 < time2 and 
-                    (time2 - time1).total_seconds() >= 3600):  # 1 hora em segundos
-                    # Adiciona uma aresta de conexão com peso zero
-                    self.time_aware_graph.add_edge(node1, node2, 
-                                                 weight=0,
-                                                 is_connection=True)
+        # Depois, adiciona as conexões possíveis em cada aeroporto
+        self._add_connection_edges()
         
         print("Time-aware graph created with airport-time nodes, including possible connections.")
 
-    def plot_routes(self):
-        """Plota o grafo de rotas de voo"""
-        if self.time_aware_graph:
-            plt.figure(figsize=(20, 10))
-            pos = nx.spring_layout(self.time_aware_graph)
-            nx.draw(self.time_aware_graph, pos, with_labels=False, 
-                   node_size=700, node_color='skyblue', 
-                   edge_color='black', width=3.0, alpha=0.5)
-            edge_labels = nx.get_edge_attributes(self.time_aware_graph, 'weight')
-            nx.draw_networkx_edge_labels(self.time_aware_graph, pos, 
-                                       edge_labels=edge_labels, font_color='red')
-            plt.title("Rotas de voo")
-            plt.show()
+    def _add_connection_edges(self):
+        """Adiciona as arestas de espera agrupando os nós por aeroporto e ordenando por horário.
+
+        Um nó alcança, esperando, todos os nós do mesmo aeroporto com pelo menos
+        MIN_CONNECTION_TIME de diferença. Em vez de ligar cada par de nós, cada nó
+        é ligado apenas aos nós dentro da janela [t0, t0 + MIN_CONNECTION_TIME),
+        onde t0 é o primeiro horário permitido; os nós posteriores continuam
+        alcançáveis a partir de t0. A alcançabilidade (e portanto o custo mínimo)
+        é a mesma da regra original, com construção O(N log N).
+        """
+        times_by_airport = defaultdict(list)
+        for airport, time in self.time_aware_graph.nodes():
+            times_by_airport[airport].append(time)
+
+        connection_edges = []
+        for airport, times in times_by_airport.items():
+            times.sort()
+            for i, time in enumerate(times):
+                window = self._connection_window(times, i)
+                if window is None:
+                    # Os nós seguintes também não têm conexões possíveis
+                    break
+                connection_edges.extend(((airport, time), (airport, times[j])) for j in window)
+
+        self.time_aware_graph.add_edges_from(connection_edges, weight=0, is_connection=True)
+        # Linhas do tempo de cada aeroporto, mantidas por apply_flight_delta
+        self._airport_times = times_by_airport
+
+    @staticmethod
+    def _connection_window(times, i):
+        """Índices dos nós alcançados esperando a partir de times[i], ou None se não há conexão"""
+        first = bisect_left(times, times[i] + MIN_CONNECTION_TIME, i + 1)
+        if first == len(times):
+            return None
+        return range(first, bisect_left(times, times[first] + MIN_CONNECTION_TIME, first))
 
+    def apply_flight_delta(self, inserted=None, updated=None, cancelled=None):
+        """Aplica ao grafo voos inseridos, atualizados e cancelados, sem reconstruí-lo.
+
+        inserted e updated são DataFrames no formato de df_flights, com a coluna 'id'
+        (um voo atualizado que ainda não está no grafo é inserido); cancelled é uma lista
+        de ids. Voos com status 'cancelled' também saem do grafo. No backend networkx só
+        as linhas do tempo dos aeroportos afetados (nós e arestas de espera) são refeitas;
+        os arrays do backend CSR não mudam de tamanho, então esse grafo é reconstruído.
+        Retorna o novo graph_version.
+
+        As alterações são feitas em uma cópia (no networkx, só a estrutura de adjacência é
+        copiada; os atributos das arestas são compartilhados), que substitui o grafo atual
+        sob graph_lock.writing() apenas no fim. Quem guardou o search_graph anterior, como
+        iter_cheapest_paths e build_fare_matrix, continua lendo um grafo que não muda.
+        """
+        changed = [frame for frame in (inserted, updated) if frame is not None and not frame.empty]
+        changed = pd.concat(changed, ignore_index=True) if changed else pd.DataFrame(columns=['id'])
+        changed = changed.drop_duplicates(subset='id', keep='last')
+        if not changed.empty:
+            changed['departure_scheduled'] = pd.to_datetime(changed['departure_scheduled'])
+            changed['arrival_scheduled'] = pd.to_datetime(changed['arrival_scheduled'])
+        removed_ids = set(cancelled or ())
+        if 'status' in changed:
+            is_cancelled = changed['status'] == CANCELLED_STATUS
+            removed_ids.update(changed.loc[is_cancelled, 'id'])
+            changed = changed[~is_cancelled]
+
+        with self._delta_lock:
+            df_flights = self.df_flights
+            if df_flights is None or df_flights.empty:
+                df_flights = changed.iloc[:0]
+            elif 'id' not in df_flights:
+                raise ValueError("Flight deltas require an 'id' column in df_flights")
+            replaced = df_flights['id'].isin(removed_ids | set(changed['id']))
+            old_rows = df_flights[replaced]
+
+            # O grafo novo é montado em uma cópia, fora da trava; o atual nunca é alterado
+            staged = copy.copy(self)
+            if changed.empty:
+                staged.df_flights = df_flights[~replaced].reset_index(drop=True)
+            else:
+                staged.df_flights = concat_flights([df_flights[~replaced], changed])
+            staged._lower_bounds = None
+            if staged.df_flights.empty:
+                staged.time_aware_graph = None
+                staged.csr_graph = None
+                staged.graph_version += 1
+            elif self.backend == 'csr' or not self.time_aware_graph or self._airport_times is None:
+                staged._create_time_aware_graph()
+            else:
+                staged.time_aware_graph = share_graph(self.time_aware_graph)
+                staged._airport_times = {airport: list(times) for airport, times in self._airport_times.items()}
+                staged._patch_time_aware_graph(old_rows, changed)
+                staged.graph_version += 1
+
+            with self.graph_lock.writing():
+                for name in STAGED_ATTRIBUTES:
+                    setattr(self, name, getattr(staged, name))
+                self._known_airport_codes = None
+                self._connection_scan = None
+                self._search_graph = None
+                self._fare_matrix = None
+        return self.graph_version
+
+    def _patch_time_aware_graph(self, removed, added):
+        """Remove e adiciona arestas de voo e refaz só as esperas afetadas nas linhas do tempo"""
+        graph = self.time_aware_graph
+        df = self.df_flights
+        departure_ns = arrival_ns = None
+        touched = set()
+        created = set()
+        uncovered = []
+
+        def flight_nodes(row):
+            return (row['departure_iata'], row['departure_scheduled']), (row['arrival_iata'], row['arrival_scheduled'])
+
+        for row in removed.to_dict('records'):
+            origin_node, destination_node = flight_nodes(row)
+            edge_data = graph.get_edge_data(origin_node, destination_node)
+            if edge_data is None or edge_data.get('flight_id') != row['id']:
+                # A aresta pertence a outro voo entre os mesmos nós
+                continue
+            graph.remove_edge(origin_node, destination_node)
+            touched.update((origin_node, destination_node))
+            # Outro voo entre os mesmos nós, antes encoberto por este, volta a valer
+            if departure_ns is None:
+                departure_ns = epoch_ns(df['departure_scheduled'])
+                arrival_ns = epoch_ns(df['arrival_scheduled'])
+                departure_iata = df['departure_iata'].to_numpy()
+                arrival_iata = df['arrival_iata'].to_numpy()
+            same_times = np.flatnonzero((departure_ns == row['departure_scheduled'].value)
+                                        & (arrival_ns == row['arrival_scheduled'].value))
+            same_nodes = [position for position in same_times
+                          if departure_iata[position] == row['departure_iata']
+                          and arrival_iata[position] == row['arrival_iata']]
+            if same_nodes:
+                uncovered.append(same_nodes[-1])
+        if uncovered:
+            added = pd.concat([df.iloc[uncovered], added])
+
+        for row in added.to_dict('records'):
+            origin_node, destination_node = flight_nodes(row)
+            created.update(node for node in (origin_node, destination_node) if node not in graph)
+            if graph.has_edge(origin_node, destination_node):
+                # add_edge alteraria o dicionário da aresta, compartilhado com o grafo anterior
+                graph.remove_edge(origin_node, destination_node)
+            graph.add_edge(origin_node, destination_node, weight=row['preco'], flight_number=row['flight_number'],
+                           flight_id=row['id'])
+            touched.update((origin_node, destination_node))
+
+        # Nós que ficaram sem voos saem do grafo, junto com suas esperas
+        deleted = {node for node in touched - created
+                   if not any(not edge_data.get('is_connection')
+                              for adjacency in (graph.adj[node], graph.pred[node])
+                              for edge_data in adjacency.values())}
+        graph.remove_nodes_from(deleted)
+
+        changed_times = defaultdict(set)
+        for airport, time in created | deleted:
+            changed_times[airport].add(time)
+        for airport, times_changed in changed_times.items():
+            self._patch_airport_connections(airport, times_changed, {node[1] for node in created if node[0] == airport})
+
+    def _patch_airport_connections(self, airport, times_changed, times_created):
+        """Atualiza a linha do tempo de um aeroporto e refaz as esperas que dependem dos horários alterados.
+
+        A espera a partir de s só muda se algum horário alterado c está em [s + 1h, t0 + 1h),
+        onde t0 é o primeiro nó a partir de s + 1h. Se p é o último horário não alterado até
+        c - 1h, todo s <= p - 1h alcança p antes de c; basta refazer os nós em (p - 1h, c - 1h].
+        """
+        graph = self.time_aware_graph
+        times = self._airport_times.setdefault(airport, [])
+        for time in times_changed - times_created:
+            del times[bisect_left(times, time)]
+        for time in times_created:
+            insort(times, time)
+
+        sources = set(times_created)
+        for time in times_changed:
+            i = bisect_right(times, time - MIN_CONNECTION_TIME) - 1
+            while i >= 0 and times[i] in times_changed:
+                i -= 1
+            first = bisect_right(times, times[i] - MIN_CONNECTION_TIME) if i >= 0 else 0
+            sources.update(times[first:bisect_right(times, time - MIN_CONNECTION_TIME)])
+
+        connection_edges = []
+        for time in sources:
+            node = (airport, time)
+            graph.remove_edges_from([(node, neighbor) for neighbor, edge_data in graph.adj[node].items()
+                                     if edge_data.get('is_connection')])
+            window = self._connection_window(times, bisect_left(times, time))
+            if window is not None:
+                connection_edges.extend((node, (airport, times[j])) for j in window)
+        graph.add_edges_from(connection_edges, weight=0, is_connection=True)
+
+    @reads_graph
+    def plot_routes(self, fmt='png'):
+        """Mapa das rotas entre aeroportos (bytes de uma imagem PNG ou SVG).
+
+        O grafo é reduzido a um nó por aeroporto, com o número de voos e a menor tarifa
+        de cada rota. A imagem fica em cache até o grafo mudar (graph_version).
+        """
+        key = (self.graph_version, fmt)
+        image = self._route_maps.get(key)
+        if image is None:
+            with stage('route_map'):
+                image = render_route_map(route_summary(self.df_flights), fmt)
+            self._route_maps = {cached: value for cached, value in self._route_maps.items()
+                                if cached[0] == self.graph_version}
+            self._route_maps[key] = image
+        return image
+
+    def known_airport_codes(self):
+        """Retorna os códigos IATA presentes nos voos carregados"""
+        if self._known_airport_codes is None:
+            if self.df_flights is None or self.df_flights.empty:
+                self._known_airport_codes = frozenset()
+            else:
+                self._known_airport_codes = frozenset(
+                    set(self.df_flights['departure_iata'].dropna()) | set(self.df_flights['arrival_iata'].dropna()))
+        return self._known_airport_codes
+
+    @timed_stage('airport_codes')
     def extract_airport_codes(self, text):
+        """Extrai códigos de aeroporto de texto.
+
+        Tenta, em ordem: códigos IATA conhecidos escritos no próprio texto, respostas
+        anteriores do modelo para o mesmo texto normalizado e, só então, o Gemini.
+        """
+        codes = match_airport_codes(text, self.known_airport_codes())
+        if codes:
+            resolver_stats.record('regex')
+            increment('airport_codes_regex')
+            return codes
+
+        cache_key = normalize_query(text)
+        codes = llm_answer_cache.get(cache_key)
+        if codes:
+            resolver_stats.record('cache')
+            increment('airport_codes_cache_hit')
+            return codes
+
+        increment('airport_codes_cache_miss')
+        codes = self._extract_airport_codes_with_gemini(text)
+        resolver_stats.record('llm' if codes[0] and codes[1] else None)
+        if codes[0] and codes[1]:
+            llm_answer_cache.set(cache_key, codes)
+        return codes
+
+    @timed_stage('gemini')
+    def _extract_airport_codes_with_gemini(self, text):
         """Extrai códigos de aeroporto de texto usando o modelo Gemini"""
         if not self.gemini_model:
             print("Gemini model not initialized. Check your Google API key.")
@@ -153,57 +506,212 @@ class FlightSearch:
             print(f"An error occurred while calling the Gemini API: {e}")
             return None, None
 
-    def find_cheapest_path(self, start_airport_code, destination_airport_code):
-        """Encontra o caminho mais barato entre dois aeroportos, considerando conexões"""
+    @timed_stage('cheapest_path')
+    @reads_graph
+    def find_cheapest_path(self, start_airport_code, destination_airport_code, mode='super_source',
+                           depart_after=None, depart_before=None, heuristic=True, stats=None):
+        """Encontra o caminho mais barato entre dois aeroportos, considerando conexões.
+
+        No modo 'super_source' (padrão) roda um único Dijkstra a partir de todos os nós
+        do aeroporto de origem, como se houvesse uma super-origem ligada a eles com custo
+        zero, e para assim que o primeiro nó do aeroporto de destino é fixado. O modo
+        'pairwise' mantém a busca antiga, um Dijkstra por par (origem, destino).
+
+        depart_after e depart_before (inclusivos) limitam o horário do primeiro voo; só
+        são aceitos no modo 'super_source'. Nesse modo, com heuristic=True, a busca é um
+        A* guiado pelos limites inferiores de tarifa entre aeroportos (lower_bounds), com
+        o mesmo resultado do Dijkstra. stats, se dado, recebe 'nodes_expanded'.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        has_window = depart_after is not None or depart_before is not None
+        if has_window and mode != 'super_source':
+            raise ValueError("Departure windows are only supported in the 'super_source' search mode")
+
+        if self.backend == 'csr':
+            return self._find_cheapest_path_csr(start_airport_code, destination_airport_code, mode,
+                                                depart_after, depart_before, heuristic, stats)
+
         if not self.time_aware_graph:
             print("Graph not created. Fetch flights first.")
             return None, None
 
-        possible_start_nodes = [node for node in self.time_aware_graph.nodes() if node[0] == start_airport_code]
-        possible_destination_nodes = [node for node in self.time_aware_graph.nodes() if node[0] == destination_airport_code]
+        search_graph = self.search_graph()
+        possible_start_nodes = list(search_graph.airport_nodes(start_airport_code))
+        possible_destination_nodes = list(search_graph.airport_nodes(destination_airport_code))
 
         if not possible_start_nodes or not possible_destination_nodes:
             print(f"One or both airports not found: {start_airport_code} or {destination_airport_code}")
             return None, None
 
+        if mode == 'pairwise':
+            return self._find_cheapest_path_pairwise(possible_start_nodes, possible_destination_nodes)
+
+        if has_window:
+            possible_start_nodes = [node for node in possible_start_nodes
+                                    if (depart_after is None or node[1] >= depart_after)
+                                    and (depart_before is None or node[1] <= depart_before)]
+        bounds = self.lower_bounds().to(destination_airport_code) if heuristic else None
+        path = self._dijkstra_to_airport(possible_start_nodes, destination_airport_code, bounds, stats)
+        if path is None:
+            return None, float('inf')
+        return self._build_itinerary(path)
+
+    def _find_cheapest_path_csr(self, start_airport_code, destination_airport_code, mode,
+                                depart_after=None, depart_before=None, heuristic=True, stats=None):
+        """Busca do caminho mais barato sobre o grafo CSR"""
+        if mode != 'super_source':
+            raise ValueError("The CSR backend only supports the 'super_source' search mode")
+
+        if self.csr_graph is None:
+            print("Graph not created. Fetch flights first.")
+            return None, None
+
+        possible_start_nodes = self.csr_graph.airport_nodes(start_airport_code)
+        if not possible_start_nodes or not self.csr_graph.airport_nodes(destination_airport_code):
+            print(f"One or both airports not found: {start_airport_code} or {destination_airport_code}")
+            return None, None
+
+        possible_start_nodes = self.csr_graph.airport_nodes(start_airport_code, depart_after, depart_before)
+        bounds = None
+        if heuristic:
+            bounds = self.lower_bounds().to_array(destination_airport_code, self.csr_graph.airports)
+        edges = self.csr_graph.shortest_path(possible_start_nodes, destination_airport_code, bounds, stats)
+        if edges is None:
+            return None, float('inf')
+        return self._build_edges_itinerary(edges)
+
+    @timed_stage('pareto')
+    @reads_graph
+    def find_pareto_paths(self, start_airport_code, destination_airport_code, max_labels=100000):
+        """Encontra, em uma única busca, os itinerários não dominados em preço, duração e escalas.
+
+        Retorna uma lista de opções ordenada por preço, cada uma com 'itinerary', 'cost',
+        'duration_hours' e 'stops'. A busca para ao criar max_labels rótulos, devolvendo
+        as opções encontradas até ali.
+        """
+        search_graph = self.search_graph()
+        if search_graph is None:
+            print("Graph not created. Fetch flights first.")
+            return []
+
+        source_nodes = search_graph.airport_nodes(start_airport_code)
+        target_nodes = set(search_graph.airport_nodes(destination_airport_code))
+        if not source_nodes or not target_nodes:
+            print(f"One or both airports not found: {start_airport_code} or {destination_airport_code}")
+            return []
+
+        results, truncated = pareto_search(search_graph, source_nodes, target_nodes, max_labels)
+        if truncated:
+            print(f"Pareto search stopped after {max_labels} labels; options may be incomplete.")
+
+        options = []
+        for _, duration, flights, edges in sorted(results, key=lambda result: result[:3]):
+            itinerary, cost = self._build_edges_itinerary(edges)
+            options.append({
+                'itinerary': itinerary,
+                'cost': cost,
+                'duration_hours': duration / 3.6e12,
+                'stops': flights - 1,
+            })
+        return options
+
+    def iter_cheapest_paths(self, start_airport_code, destination_airport_code, max_expansions=200000,
+                            time_budget=None, depart_after=None, depart_before=None):
+        """Gera (itinerário, custo) dos itinerários entre dois aeroportos, do mais barato ao mais caro.
+
+        Itinerários com a mesma sequência de voos aparecem uma vez só. A geração para ao
+        atingir max_expansions nós expandidos ou time_budget segundos. depart_after e
+        depart_before limitam o horário do primeiro voo, como em find_cheapest_path.
+
+        O gerador percorre o search_graph da versão atual no momento da chamada, que
+        apply_flight_delta não altera, sem segurar a leitura do grafo: pode ser consumido
+        no ritmo de um cliente lento sem atrasar as atualizações.
+        """
+        with self.graph_lock.reading():
+            search_graph = self.search_graph()
+        return self._iter_cheapest_paths(search_graph, start_airport_code, destination_airport_code,
+                                         max_expansions, time_budget, depart_after, depart_before)
+
+    def _iter_cheapest_paths(self, search_graph, start_airport_code, destination_airport_code, max_expansions,
+                             time_budget, depart_after, depart_before):
+        if search_graph is None:
+            print("Graph not created. Fetch flights first.")
+            return
+
+        source_nodes = search_graph.airport_nodes(start_airport_code)
+        target_nodes = search_graph.airport_nodes(destination_airport_code)
+        if not source_nodes or not target_nodes:
+            print(f"One or both airports not found: {start_airport_code} or {destination_airport_code}")
+            return
+
+        if depart_after is not None or depart_before is not None:
+            start_ns = -float('inf') if depart_after is None else epoch_ns([depart_after])[0]
+            end_ns = float('inf') if depart_before is None else epoch_ns([depart_before])[0]
+            source_nodes = [node for node in source_nodes if start_ns <= search_graph.time_ns(node) <= end_ns]
+
+        paths = CheapestPaths(search_graph, source_nodes, target_nodes, max_expansions, time_budget)
+        for _, edges in paths:
+            yield self._build_edges_itinerary(edges, search_graph)
+        if paths.exhausted:
+            print(f"K-cheapest search stopped after {paths.expanded} expansions; results may be incomplete.")
+
+    def find_k_cheapest_paths(self, start_airport_code, destination_airport_code, k, max_expansions=200000,
+                              time_budget=None, depart_after=None, depart_before=None):
+        """Encontra até k itinerários mais baratos, como lista de (itinerário, custo) em ordem de preço"""
+        paths = self.iter_cheapest_paths(start_airport_code, destination_airport_code, max_expansions,
+                                         time_budget, depart_after, depart_before)
+        try:
+            return list(islice(paths, k))
+        finally:
+            paths.close()
+
+    def connection_scan(self):
+        """Retorna as conexões ordenadas por horário usadas nas buscas CSA, criando-as no primeiro uso"""
+        if self._connection_scan is None and self.df_flights is not None and not self.df_flights.empty:
+            self._connection_scan = ConnectionScan(self.df_flights)
+        return self._connection_scan
+
+    @reads_graph
+    def find_earliest_arrival_path(self, start_airport_code, destination_airport_code, depart_after=None):
+        """Encontra a viagem que chega mais cedo ao destino (Connection Scan Algorithm).
+
+        Retorna o itinerário e o custo no mesmo formato de find_cheapest_path.
+        """
+        connection_scan = self.connection_scan()
+        if connection_scan is None:
+            print("No flights loaded. Fetch flights first.")
+            return None, None
+        rows = connection_scan.earliest_arrival(start_airport_code, destination_airport_code, depart_after)
+        if rows is None:
+            return None, float('inf')
+        return self._build_rows_itinerary(rows)
+
+    @reads_graph
+    def find_latest_departure_path(self, start_airport_code, destination_airport_code, arrive_by=None):
+        """Encontra a viagem que sai mais tarde e ainda chega ao destino até arrive_by (CSA).
+
+        Retorna o itinerário e o custo no mesmo formato de find_cheapest_path.
+        """
+        connection_scan = self.connection_scan()
+        if connection_scan is None:
+            print("No flights loaded. Fetch flights first.")
+            return None, None
+        rows = connection_scan.latest_departure(start_airport_code, destination_airport_code, arrive_by)
+        if rows is None:
+            return None, float('inf')
+        return self._build_rows_itinerary(rows)
+
+    def _find_cheapest_path_pairwise(self, possible_start_nodes, possible_destination_nodes):
+        """Busca antiga: um Dijkstra completo para cada par de nós de origem e destino"""
         min_cost = float('inf')
         best_itinerary = None
 
         for start_node in possible_start_nodes:
             for end_node in possible_destination_nodes:
                 try:
-                    current_path = dijkstra_path(self.time_aware_graph, source=start_node, target=end_node, weight='weight')
-                    
-                    # Calcula custo e constrói itinerário
-                    current_cost = 0
-                    current_itinerary = []
-                    
-                    for i in range(len(current_path) - 1):
-                        node1 = current_path[i]
-                        node2 = current_path[i + 1]
-                        edge_data = self.time_aware_graph[node1][node2]
-                        
-                        current_cost += edge_data['weight']
-                        
-                        # Se não é uma conexão, é um voo
-                        if not edge_data.get('is_connection', False):
-                            flight_info = {
-                                'from': node1[0],
-                                'to': node2[0],
-                                'departure': node1[1],
-                                'arrival': node2[1],
-                                'flight_number': edge_data.get('flight_number'),
-                                'price': edge_data['weight']
-                            }
-                            current_itinerary.append(flight_info)
-                        else:
-                            # É uma conexão
-                            layover_time = (node2[1] - node1[1]).total_seconds() / 3600  # em horas
-                            current_itinerary.append({
-                                'connection': True,
-                                'airport': node1[0],
-                                'duration': f"{layover_time:.1f} horas"
-                            })
+                    current_path = nx.dijkstra_path(self.time_aware_graph, source=start_node, target=end_node, weight='weight')
+                    current_itinerary, current_cost = self._build_itinerary(current_path)
 
                     if current_cost < min_cost:
                         min_cost = current_cost
@@ -212,4 +720,246 @@ class FlightSearch:
                 except (nx.NetworkXNoPath, nx.NodeNotFound):
                     continue
 
-        return best_itinerary, min_cost
\ No newline at end of file
+        return best_itinerary, min_cost
+
+    def _dijkstra_to_airport(self, source_nodes, destination_airport_code, bounds=None, stats=None):
+        """Dijkstra com múltiplas origens que para no primeiro nó do aeroporto de destino.
+
+        Com bounds (limite inferior de custo de cada aeroporto até o destino), vira A*:
+        a fila é ordenada por custo + limite, aeroportos sem caminho até o destino são
+        ignorados e rótulos cujo custo + limite passa do melhor custo já visto no
+        destino são podados. stats, se dado, recebe 'nodes_expanded'.
+        """
+        adjacency = self.time_aware_graph.adj
+        counter = count()
+        heap = []
+        tentative = {}
+        predecessors = {}
+        settled = set()
+        inf = float('inf')
+        best_cost = inf
+        expanded = 0
+
+        for node in source_nodes:
+            if bounds is not None and bounds.get(node[0], inf) == inf:
+                continue
+            tentative[node] = 0
+            predecessors[node] = None
+            heappush(heap, (bounds[node[0]] if bounds is not None else 0, next(counter), node))
+
+        while heap:
+            _, _, node = heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            expanded += 1
+            cost = tentative[node]
+
+            if node[0] == destination_airport_code:
+                if stats is not None:
+                    stats['nodes_expanded'] = expanded
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = predecessors[node]
+                return path[::-1]
+
+            is_source = predecessors[node] is None
+            for neighbor, edge_data in adjacency[node].items():
+                if neighbor in settled:
+                    continue
+                if is_source and edge_data.get('is_connection'):
+                    # Esperar na origem equivale a partir de outro nó de origem, que já é uma fonte;
+                    # com janela de partida, evita sair depois do fim da janela
+                    continue
+                new_cost = cost + edge_data['weight']
+                if neighbor in tentative and new_cost >= tentative[neighbor]:
+                    continue
+                if bounds is None:
+                    estimate = new_cost
+                else:
+                    bound = bounds.get(neighbor[0], inf)
+                    if bound == inf:
+                        # Aeroporto sem caminho até o destino; com best_cost ainda infinito,
+                        # a comparação abaixo não o descartaria
+                        continue
+                    if new_cost + bound > best_cost:
+                        continue
+                    estimate = new_cost + bound
+                    if neighbor[0] == destination_airport_code:
+                        best_cost = min(best_cost, new_cost)
+                tentative[neighbor] = new_cost
+                predecessors[neighbor] = node
+                heappush(heap, (estimate, next(counter), neighbor))
+
+        if stats is not None:
+            stats['nodes_expanded'] = expanded
+        return None
+
+    def lower_bounds(self):
+        """Limites inferiores de tarifa entre aeroportos (heurística do A*), calculados no primeiro uso"""
+        if self._lower_bounds is None and self.df_flights is not None and not self.df_flights.empty:
+            self._lower_bounds = AirportLowerBounds.from_flights(self.df_flights)
+        return self._lower_bounds
+
+    def fare_matrix(self):
+        """Tabela de tarifas mínimas entre todos os pares de aeroportos, calculada no primeiro uso.
+
+        A varredura roda neste processo, sem fork, e só um thread a calcula. As
+        requisições não a chamam: usam a tabela já pronta (ver refresh_fare_matrix).
+        """
+        if self._fare_matrix is None:
+            with self._fare_matrix_lock:
+                if self._fare_matrix is None:
+                    self.build_fare_matrix(processes=1)
+        return self._fare_matrix
+
+    @timed_stage('fare_matrix')
+    def build_fare_matrix(self, processes=None):
+        """(Re)calcula a tabela de tarifas mínimas com uma varredura por aeroporto de origem.
+
+        processes é o número de processos da varredura (padrão: um por núcleo). Com mais
+        de um, a varredura usa fork: chame assim só de processos de um único thread, como
+        os comandos de gerenciamento (snapshot_graph) e os benchmarks.
+
+        A varredura roda sobre o search_graph da versão atual, que apply_flight_delta
+        não altera, sem segurar a leitura do grafo; a tabela só é guardada se o grafo
+        não mudou nesse meio tempo.
+        """
+        with self.graph_lock.reading():
+            search_graph = self.search_graph()
+            airports = self.known_airport_codes()
+            graph_version = self.graph_version
+        fare_matrix = None
+        if search_graph is not None:
+            fare_matrix = FareMatrix.from_search_graph(search_graph, airports, processes)
+        with self.graph_lock.reading():
+            if self.graph_version == graph_version:
+                self._fare_matrix = fare_matrix
+        return fare_matrix
+
+    def cheapest_fare(self, start_airport_code, destination_airport_code, depart_after=None, depart_before=None,
+                      live=False):
+        """Menor tarifa entre dois aeroportos, sem montar o itinerário.
+
+        Sem janela de partida, é uma consulta em O(1) à fare_matrix; com depart_after ou
+        depart_before, com live ou enquanto a fare_matrix não está pronta (ela nunca é
+        calculada aqui; ver refresh_fare_matrix), roda find_cheapest_path. Retorna inf
+        se não há caminho e None se um dos aeroportos não existe.
+        """
+        fare_matrix = None
+        if not live and depart_after is None and depart_before is None:
+            fare_matrix = self._fare_matrix
+        if fare_matrix is None:
+            _, cost = self.find_cheapest_path(start_airport_code, destination_airport_code,
+                                              depart_after=depart_after, depart_before=depart_before)
+            return cost
+        return fare_matrix.fare(start_airport_code, destination_airport_code)
+
+    def refresh_fare_matrix(self, snapshot=None):
+        """Calcula em um thread de fundo a fare_matrix ainda ausente ou descartada por apply_flight_delta.
+
+        Até ela ficar pronta, cheapest_fare responde com buscas ao vivo. Com snapshot
+        (diretório, versão dos dados), a tabela pronta é acrescentada a esse snapshot,
+        para que os demais workers a mapeiem em vez de recalculá-la. Retorna o thread.
+        """
+        def build():
+            fare_matrix = self.fare_matrix()
+            if fare_matrix is not None and snapshot is not None:
+                try:
+                    save_fare_matrix(fare_matrix, *snapshot)
+                except OSError as e:
+                    print(f"Could not save fare matrix to {snapshot[0]}: {e}")
+
+        thread = threading.Thread(target=build, name='fare-matrix', daemon=True)
+        thread.start()
+        return thread
+
+    @reads_graph
+    def cheapest_fare_itinerary(self, start_airport_code, destination_airport_code):
+        """Itinerário mais barato guardado na fare_matrix, no formato de find_cheapest_path.
+
+        Enquanto a fare_matrix não está pronta, vem de find_cheapest_path.
+        """
+        fare_matrix = self._fare_matrix
+        if fare_matrix is None:
+            return self.find_cheapest_path(start_airport_code, destination_airport_code)
+        rows = fare_matrix.itinerary_rows_for(start_airport_code, destination_airport_code)
+        if rows is None:
+            cost = fare_matrix.fare(start_airport_code, destination_airport_code)
+            return None, cost
+        return self._build_rows_itinerary(rows)
+
+    def search_graph(self):
+        """Retorna a interface de busca comum ao backend em uso, ou None se o grafo não existe"""
+        if self._search_graph is None:
+            if self.backend == 'csr' and self.csr_graph is not None:
+                self._search_graph = CSRSearchGraph(self.csr_graph, self.df_flights)
+            elif self.backend == 'networkx' and self.time_aware_graph:
+                self._search_graph = NetworkxSearchGraph(self.time_aware_graph, self.df_flights)
+        return self._search_graph
+
+    def _build_itinerary(self, path):
+        """Calcula o custo e monta o itinerário de um caminho de nós do grafo temporal"""
+        search_graph = NetworkxSearchGraph(self.time_aware_graph)
+        return self._itinerary_from_legs([search_graph.leg(edge) for edge in zip(path, path[1:])])
+
+    def _build_edges_itinerary(self, edges, search_graph=None):
+        """Calcula o custo e monta o itinerário de um caminho de arestas da interface de busca"""
+        if search_graph is None:
+            search_graph = self.search_graph()
+        return self._itinerary_from_legs([search_graph.leg(edge) for edge in edges])
+
+    def _build_rows_itinerary(self, rows):
+        """Calcula o custo e monta o itinerário de uma sequência de voos (linhas do df_flights)"""
+        legs = []
+        previous_arrival = None
+        for row_index in rows:
+            row = self.df_flights.iloc[row_index]
+            departure = (row['departure_iata'], row['departure_scheduled'])
+            arrival = (row['arrival_iata'], row['arrival_scheduled'])
+            if previous_arrival is not None:
+                legs.append((previous_arrival, departure, True, None, None, 0))
+            legs.append((departure, arrival, False, row['flight_number'], row.get('id'), row['preco']))
+            previous_arrival = arrival
+        return self._itinerary_from_legs(legs)
+
+    def _itinerary_from_legs(self, legs):
+        """Monta o itinerário a partir de trechos (nó de saída, nó de chegada, é conexão, voo, id, preço).
+
+        Esperas consecutivas no mesmo aeroporto são agrupadas em uma única conexão.
+        """
+        cost = 0
+        itinerary = []
+        layover_start = None
+
+        for node1, node2, is_connection, flight_number, flight_id, price in legs:
+            cost += price
+
+            # Se não é uma conexão, é um voo
+            if not is_connection:
+                layover_start = None
+                itinerary.append({
+                    'from': node1[0],
+                    'to': node2[0],
+                    'departure': node1[1],
+                    'arrival': node2[1],
+                    'flight_number': flight_number,
+                    'flight_id': flight_id,
+                    'price': price
+                })
+                continue
+
+            # É uma conexão; esperas consecutivas substituem a anterior
+            if layover_start is None:
+                layover_start = node1[1]
+            else:
+                itinerary.pop()
+            layover_time = (node2[1] - layover_start).total_seconds() / 3600  # em horas
+            itinerary.append({
+                'connection': True,
+                'airport': node1[0],
+                'duration': f"{layover_time:.1f} horas"
+            })
+
+        return itinerary, cost
@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+# Palavras de três letras maiúsculas que podem ser códigos IATA. Em minúsculas, palavras
+# comuns ("the", "for", "sao") coincidiriam com códigos conhecidos
+IATA_CODE_PATTERN = re.compile(r'\b[A-Z]{3}\b')
+
+# Palavras que indicam que o código seguinte é o destino
+DESTINATION_MARKERS = {'para', 'pra', 'ate', 'to'}
+
+# Artigos aceitos entre o marcador e o código: "até o GIG"
+ARTICLES = {'o', 'a', 'os', 'as', 'the'}
+
+# Setas entre origem e destino: "GRU → GIG"
+ROUTE_ARROWS = {'→', '->'}
+
+RESOLVER_TIERS = ('regex', 'cache', 'llm')
+
+
+def normalize_query(text):
+    """Normaliza o texto da busca para usar como chave de cache"""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def _marker_before(text):
+    """Última palavra do texto, ignorando artigos"""
+    words = re.findall(r'\w+', normalize_query(text))
+    while words and words[-1] in ARTICLES:
+        words.pop()
+    return words[-1] if words else None
+
+
+def match_airport_codes(text, known_codes):
+    """Encontra origem e destino no texto sem chamar o modelo.
+
+    Só responde quando há exatamente dois códigos conhecidos distintos, em maiúsculas,
+    em uma das formas que fixam a ordem: "GRU → GIG" ou um marcador de destino logo
+    antes do segundo código ("de GRU para GIG"). Nos demais casos ("chegar em GIG
+    saindo de GRU") retorna None para que o próximo nível decida.
+    """
+    matches = []
+    for match in IATA_CODE_PATTERN.finditer(text):
+        if match.group() in known_codes and match.group() not in [found.group() for found in matches]:
+            matches.append(match)
+    if len(matches) != 2:
+        return None
+
+    first, second = matches
+    if _marker_before(text[:first.start()]) in DESTINATION_MARKERS:
+        return None
+    if (text[first.end():second.start()].strip() in ROUTE_ARROWS
+            or _marker_before(text[:second.start()]) in DESTINATION_MARKERS):
+        return first.group(), second.group()
+    return None
+
+
+class TTLCache:
+    """Cache LRU com expiração por tempo, seguro para uso entre threads"""
+
+    def __init__(self, maxsize=1024, ttl=24 * 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ResolverStats:
+    """Contadores de acerto de cada nível do resolvedor de códigos de aeroporto"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, tier):
+        with self._lock:
+            self._counts['lookups'] += 1
+            if tier:
+                self._counts[tier] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts.get('lookups', 0)
+        stats = {'lookups': lookups}
+        for tier in RESOLVER_TIERS:
+            hits = counts.get(tier, 0)
+            stats[tier] = {'hits': hits, 'hit_rate': hits / lookups if lookups else 0.0}
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# Respostas anteriores do modelo, compartilhadas por todas as requisições do processo
+llm_answer_cache = TTLCache()
+resolver_stats = ResolverStats()
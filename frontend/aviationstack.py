@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .response_cache import ResponseCacheMiss
+
+AVIATIONSTACK_URL = "http://api.aviationstack.com/v1/flights"
+
+# Códigos HTTP em que vale a pena tentar de novo, com espera exponencial
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class AviationStackError(requests.exceptions.RequestException):
+    """Erro retornado no corpo de uma resposta da API AviationStack"""
+
+
+class AviationStackClient:
+    """Cliente da API AviationStack que percorre a paginação limit/offset.
+
+    Usa uma única requests.Session com pool de conexões e novas tentativas com
+    backoff em 429/5xx (respeitando Retry-After). A primeira página é buscada
+    sozinha para descobrir o total; as demais são buscadas em paralelo, com no
+    máximo max_workers requisições simultâneas, e entregues conforme chegam.
+
+    Com cache (um ResponseCache), as páginas gravadas são reaproveitadas ou
+    revalidadas com requisições condicionais antes de baixar tudo de novo.
+    """
+
+    def __init__(self, api_key, url=AVIATIONSTACK_URL, limit=100, max_workers=4, max_pages=None,
+                 timeout=10, retries=5, backoff_factor=0.5, params=None, cache=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.url = url
+        self.limit = limit
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.params = params or {}
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=['GET'], respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch_page(self, offset=0):
+        """Busca uma página da API a partir do offset informado"""
+        params = {**self.params, 'access_key': self.api_key, 'limit': self.limit, 'offset': offset}
+        cached = None
+        headers = {}
+        if self.cache is not None:
+            cached = self.cache.get(self.url, params)
+            if cached is not None and (self.cache.replay or self.cache.is_fresh(cached)):
+                self.cache.count('hits')
+                return cached.page
+            if self.cache.replay:
+                raise ResponseCacheMiss(f"Page at offset {offset} is not in the response cache")
+            if cached is not None:
+                headers = cached.conditional_headers()
+
+        response = self.session.get(self.url, params=params, headers=headers, timeout=self.timeout)
+        if cached is not None and response.status_code == 304:
+            self.cache.count('revalidated')
+            self.cache.touch(self.url, params, cached)
+            return cached.page
+        response.raise_for_status()
+        page = response.json()
+        if 'error' in page:
+            raise AviationStackError(page['error'].get('message', page['error']))
+        if self.cache is not None:
+            self.cache.count('misses')
+            self.cache.put(self.url, params, page, response.headers)
+        return page
+
+    def page_offsets(self, first_page):
+        """Calcula os offsets das páginas restantes a partir da paginação da primeira"""
+        pagination = first_page.get('pagination') or {}
+        total = pagination.get('total') or 0
+        # A API pode limitar o tamanho da página abaixo do pedido
+        step = pagination.get('limit') or self.limit
+        offsets = range(step, total, step)
+        if self.max_pages is not None:
+            offsets = offsets[:max(self.max_pages - 1, 0)]
+        return offsets
+
+    def iter_pages(self):
+        """Gera as páginas da API à medida que chegam (fora de ordem após a primeira)"""
+        first_page = self.fetch_page(0)
+        yield first_page
+
+        offsets = self.page_offsets(first_page)
+        if not offsets:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = [executor.submit(self.fetch_page, offset) for offset in offsets]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def close(self):
+        self.session.close()
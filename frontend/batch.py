@@ -0,0 +1,192 @@
+import atexit
+import copy
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+from .FlightSearch import FlightSearch
+from .serializers import serialize_search_error, serialize_search_result
+
+# FlightSearch usado pelas consultas nos processos do pool. Com 'fork' os filhos
+# herdam o grafo do processo pai (páginas compartilhadas por copy-on-write); com
+# 'spawn' cada filho mapeia o snapshot do grafo em memória.
+_worker_search = None
+
+
+def _init_worker(snapshot):
+    global _worker_search
+    if snapshot is not None:
+        _worker_search = FlightSearch.from_snapshot(*snapshot)
+
+
+def search_one(flight_search, index, query):
+    """Executa uma consulta do lote e devolve o resultado serializável"""
+    try:
+        itinerary, cost = flight_search.find_cheapest_path(
+            query['origin'], query['destination'],
+            depart_after=query['depart_after'], depart_before=query['depart_before'])
+    except (TypeError, ValueError) as e:
+        return serialize_search_error(index, query, str(e))
+    return serialize_search_result(index, query, itinerary, cost)
+
+
+def _run_query(task):
+    index, query = task
+    return os.getpid(), search_one(_worker_search, index, query)
+
+
+class BatchSearchPool:
+    """Pool de processos que responde consultas de caminho mais barato sobre um mesmo grafo.
+
+    O grafo é construído uma vez no processo pai e compartilhado: herdado via fork
+    ou mapeado a partir de um snapshot (snapshot=(diretório, versão)) pelos processos
+    criados com start_method ('spawn' ou 'forkserver'). Sem nenhum dos dois, as
+    consultas rodam no próprio processo.
+
+    fork só é seguro em um processo de um único thread (benchmarks, comandos de
+    gerenciamento); no servidor web os pools vêm de batch_pool_for, que não usa fork.
+    """
+
+    def __init__(self, flight_search, processes=None, snapshot=None, start_method=None):
+        global _worker_search
+        self.flight_search = flight_search
+        self.graph_version = flight_search.graph_version
+        self.processes = processes or os.cpu_count() or 1
+        # Processos do pool que já responderam consultas
+        self.worker_pids = set()
+        self._pool = None
+
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        if self.processes > 1 and start_method == 'fork':
+            # Os filhos são criados agora e herdam este FlightSearch
+            _worker_search = flight_search
+            self._pool = multiprocessing.get_context('fork').Pool(self.processes, _init_worker, (None,))
+        elif self.processes > 1 and snapshot is not None:
+            self._pool = multiprocessing.get_context(start_method).Pool(self.processes, _init_worker, (snapshot,))
+
+    def imap(self, queries):
+        """Gera os resultados das consultas na ordem em que terminam (cada um traz seu 'index').
+
+        As consultas são entregues ao pool já na chamada; um pool encerrado depois
+        disso (ver _start_pool) ainda responde todas elas.
+        """
+        tasks = list(enumerate(queries))
+        pool = self._pool
+        if pool is not None:
+            chunksize = max(1, len(tasks) // (self.processes * 8))
+            try:
+                return self._worker_results(pool.imap_unordered(_run_query, tasks, chunksize))
+            except ValueError:
+                # O pool foi encerrado antes de receber as consultas
+                pass
+        return (search_one(self.flight_search, index, query) for index, query in tasks)
+
+    def _worker_results(self, results):
+        for pid, result in results:
+            self.worker_pids.add(pid)
+            yield result
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def serves(self, flight_search):
+        return self.flight_search is flight_search and self.graph_version == flight_search.graph_version
+
+
+# Os workers do servidor web vêm de um forkserver (processo limpo, de um único thread)
+# ou de spawn, nunca de um fork do worker web, que tem outros threads no meio de requisições
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool_lock = threading.Lock()
+_current_pool = None
+_pending = None  # (flight_search, graph_version) do pool em criação
+_snapshot_dir = None  # snapshots gravados para o pool quando não há FLIGHT_SEARCH_SNAPSHOT_DIR
+
+
+def _save_worker_snapshot(flight_search, graph_version):
+    """Grava o grafo de uma versão em um diretório temporário do processo, para os workers do pool.
+
+    Retorna (diretório, versão), ou None se o grafo já mudou de versão.
+    """
+    global _snapshot_dir
+    with flight_search.graph_lock.reading():
+        # As atualizações trocam o grafo em vez de alterá-lo: a cópia rasa fica consistente
+        frozen = copy.copy(flight_search)
+    if frozen.graph_version != graph_version or frozen.df_flights is None or frozen.df_flights.empty:
+        return None
+    with _pool_lock:
+        if _snapshot_dir is None:
+            _snapshot_dir = tempfile.mkdtemp(prefix='voe-conosco-batch-')
+        directory = _snapshot_dir
+    version = ('batch', id(flight_search), graph_version)
+    frozen.save_snapshot(directory, version)
+    return directory, version
+
+
+def _start_pool(flight_search, graph_version, processes, snapshot):
+    """Cria o pool de um grafo fora da requisição e o publica; o anterior é encerrado em seguida"""
+    global _current_pool, _pending
+    pool = None
+    try:
+        if snapshot is None:
+            snapshot = _save_worker_snapshot(flight_search, graph_version)
+        if snapshot is not None:
+            pool = BatchSearchPool(flight_search, processes, snapshot, start_method=WORKER_START_METHOD)
+    finally:
+        with _pool_lock:
+            if pool is None or _pending != (flight_search, graph_version) or pool.graph_version != graph_version:
+                # Um grafo mais novo foi pedido enquanto este pool era criado (ou a criação falhou)
+                old = pool
+                if _pending == (flight_search, graph_version):
+                    _pending = None
+            else:
+                old, _current_pool, _pending = _current_pool, pool, None
+        if old is not None:
+            old.close()
+
+
+def batch_pool_for(flight_search, processes=None, snapshot=None):
+    """Pool do processo para o grafo atual.
+
+    Os processos do pool mapeiam o snapshot do grafo (snapshot=(diretório, versão));
+    sem ele, o grafo é gravado em um diretório temporário do processo. O pool de cada
+    versão é criado em um thread de fundo na primeira consulta em lote; enquanto isso,
+    como o cache do grafo, o pool da versão anterior continua respondendo, e só o
+    primeiro lote do processo roda nele mesmo. Com processes=1, as consultas sempre
+    rodam no próprio processo.
+    """
+    global _pending
+    processes = processes or os.cpu_count() or 1
+    with _pool_lock:
+        if _current_pool is not None and _current_pool.serves(flight_search):
+            return _current_pool
+        key = (flight_search, flight_search.graph_version)
+        start = processes > 1 and _pending != key
+        if start:
+            _pending = key
+        previous = _current_pool
+    if start:
+        threading.Thread(target=_start_pool, args=(flight_search, key[1], processes, snapshot),
+                         name='batch-pool', daemon=True).start()
+    if previous is not None:
+        return previous
+    return BatchSearchPool(flight_search, processes=1)
+
+
+@atexit.register
+def close_batch_pool():
+    """Encerra o pool do processo, se existir, e remove os snapshots gravados para ele"""
+    global _current_pool, _pending, _snapshot_dir
+    with _pool_lock:
+        pool, _current_pool, _pending = _current_pool, None, None
+        directory, _snapshot_dir = _snapshot_dir, None
+    if pool is not None:
+        pool.close()
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
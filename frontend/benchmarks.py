@@ -0,0 +1,428 @@
+import io
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from .aviationstack import AVIATIONSTACK_URL, AviationStackClient
+from .batch import BatchSearchPool
+from .FlightSearch import FlightSearch, GRAPH_BACKENDS, SEARCH_MODES
+from .flight_table import compact_flights, memory_by_column
+from .graph_cache import FlightGraphCache, flight_graph_cache
+from .ingestion import upsert_flights
+from .lazy import LazyModule
+from .lower_bounds import AirportLowerBounds
+from .models import flights
+from .normalize import iter_flight_batches, normalize_flights
+from .response_cache import ResponseCache
+from .route_map import ROUTE_MAP_FORMATS, airport_layout, route_summary
+from .synthetic import HUB_AIRPORTS, REGIONAL_AIRPORTS, api_pages, generate_flights
+
+pd = LazyModule('pandas')
+
+# Escalas da malha sintética usadas por bench_scales
+SCALES = (1000, 10000, 100000, 1000000)
+
+# Voos por dia na malha sintética; a malha cresce em dias, não em densidade
+FLIGHTS_PER_DAY = 5000
+
+# Módulos pesados que não deveriam ser carregados só por importar as views
+HEAVY_MODULES = ('numpy', 'pandas', 'networkx', 'matplotlib.pyplot', 'google.generativeai')
+
+# Script executado em um interpretador novo por bench_startup
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'voe_conosco.settings')
+django.setup()
+import frontend.urls
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'loaded': [name for name in %r if name in sys.modules]}))
+"""
+
+# Pares consultados em bench_scales: hub-a-hub e entre dois aeroportos regionais
+SCALE_QUERIES = {'hub': ('GRU', 'GIG'), 'regional': ('POA', 'BEL')}
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Executa func repeat vezes e retorna o melhor tempo em segundos e o último resultado"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def traced(func, *args, **kwargs):
+    """Executa func uma vez com tracemalloc e retorna o tempo, o pico de memória alocada e o resultado"""
+    tracemalloc.start()
+    try:
+        seconds, result = timed(func, *args, **kwargs)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes, result
+
+
+def peak_rss_bytes():
+    """Pico de memória residente do processo até agora"""
+    # ru_maxrss vem em kilobytes no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def temporary_test_database():
+    """Cria um banco de teste descartável, como o test runner, para medir a view"""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def build_flight_search(n_flights, seed=42, backend='networkx'):
+    """Cria um FlightSearch com o grafo temporal construído sobre voos sintéticos"""
+    fs = FlightSearch(generate_flights(n_flights, seed=seed), backend=backend)
+    fs._create_time_aware_graph()
+    return fs
+
+
+def bench_hub_query(n_flights=300, origin='GRU', destination='GIG'):
+    """Compara a busca por pares com o Dijkstra único em uma consulta hub-a-hub"""
+    fs = build_flight_search(n_flights)
+    result = {
+        'name': 'hub_query',
+        'n_flights': n_flights,
+        'origin_nodes': sum(1 for node in fs.time_aware_graph if node[0] == origin),
+        'destination_nodes': sum(1 for node in fs.time_aware_graph if node[0] == destination),
+    }
+    for mode in SEARCH_MODES:
+        seconds, (_, cost) = timed(fs.find_cheapest_path, origin, destination, mode=mode)
+        result[mode] = {'seconds': seconds, 'cost': float(cost)}
+    result['speedup'] = result['pairwise']['seconds'] / result['super_source']['seconds']
+    return result
+
+
+def bench_backends(n_flights=20000, queries=(('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'MAO'), ('FLN', 'VCP'))):
+    """Compara os backends networkx e CSR: construção, memória por aresta e latência de busca"""
+    df_flights = generate_flights(n_flights, days=3)
+    result = {'name': 'backends', 'n_flights': n_flights}
+    for backend in GRAPH_BACKENDS:
+        fs = FlightSearch(df_flights, backend=backend)
+        tracemalloc.start()
+        build_seconds, _ = timed(fs._create_time_aware_graph)
+        graph_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        n_edges = fs.csr_graph.n_edges if backend == 'csr' else fs.time_aware_graph.number_of_edges()
+        query_seconds = {}
+        costs = {}
+        for origin, destination in queries:
+            seconds, (_, cost) = timed(fs.find_cheapest_path, origin, destination, repeat=3)
+            query_seconds[f'{origin}-{destination}'] = seconds
+            costs[f'{origin}-{destination}'] = float(cost)
+        result[backend] = {
+            'build_seconds': build_seconds,
+            'edges': n_edges,
+            'bytes_per_edge': graph_bytes / n_edges,
+            'query_seconds': query_seconds,
+            'costs': costs,
+        }
+    result['same_costs'] = result['networkx']['costs'] == result['csr']['costs']
+    return result
+
+
+def bench_csa(n_flights=20000, queries=(('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'MAO'), ('FLN', 'VCP'))):
+    """Compara o CSA (chegada mais cedo) com o Dijkstra (mais barato) sobre os mesmos voos"""
+    df_flights = generate_flights(n_flights, days=3)
+    result = {'name': 'csa', 'n_flights': n_flights}
+
+    fs = FlightSearch(df_flights)
+    build_seconds, _ = timed(fs.connection_scan)
+    result['csa'] = {'build_seconds': build_seconds, 'query_seconds': {}}
+    for origin, destination in queries:
+        seconds, _ = timed(fs.find_earliest_arrival_path, origin, destination, repeat=3)
+        result['csa']['query_seconds'][f'{origin}-{destination}'] = seconds
+
+    for backend in GRAPH_BACKENDS:
+        fs = FlightSearch(df_flights, backend=backend)
+        build_seconds, _ = timed(fs._create_time_aware_graph)
+        result[f'dijkstra_{backend}'] = {'build_seconds': build_seconds, 'query_seconds': {}}
+        for origin, destination in queries:
+            seconds, _ = timed(fs.find_cheapest_path, origin, destination, repeat=3)
+            result[f'dijkstra_{backend}']['query_seconds'][f'{origin}-{destination}'] = seconds
+    return result
+
+
+def bench_scales(n_flights=None, scales=SCALES, backend='networkx', view=True, trace_memory=True):
+    """Mede cada etapa da busca em malhas sintéticas de tamanhos crescentes.
+
+    Para cada escala: geração dos voos, _process_flight_data (sem o grafo),
+    _create_time_aware_graph, find_cheapest_path em um par hub e um regional e, com
+    view=True, a requisição /search/ pelo test client (a primeira inclui carregar os
+    voos do banco e construir o grafo). A view grava os voos no banco atual, então deve
+    rodar em um banco de teste (temporary_test_database). Com trace_memory, as etapas
+    de preparo rodam sob tracemalloc e reportam o pico alocado, o que as deixa mais lentas.
+    """
+    if n_flights:
+        scales = (n_flights,)
+    result = {'name': 'scales', 'backend': backend, 'trace_memory': trace_memory, 'scales': []}
+    stage = traced if trace_memory else timed
+
+    for scale in scales:
+        days = max(1, scale // FLIGHTS_PER_DAY)
+        entry = {'n_flights': scale, 'days': days}
+
+        def record(name, measurement):
+            entry[name] = {'seconds': measurement[0]}
+            if trace_memory:
+                entry[name]['peak_bytes'] = measurement[1]
+            return measurement[-1]
+
+        df_flights = record('generate', stage(generate_flights, scale, days=days))
+        fs = FlightSearch(df_flights.copy(), backend=backend)
+        record('process_flight_data', stage(fs._process_flight_data, build_graph=False))
+        record('create_time_aware_graph', stage(fs._create_time_aware_graph))
+        if backend == 'csr':
+            entry['graph'] = {'nodes': fs.csr_graph.n_nodes, 'edges': fs.csr_graph.n_edges}
+        else:
+            entry['graph'] = {'nodes': fs.time_aware_graph.number_of_nodes(),
+                              'edges': fs.time_aware_graph.number_of_edges()}
+
+        for kind, (origin, destination) in SCALE_QUERIES.items():
+            seconds, (_, cost) = timed(fs.find_cheapest_path, origin, destination, repeat=3)
+            entry[f'{kind}_query'] = {'pair': f'{origin}-{destination}', 'seconds': seconds, 'cost': float(cost)}
+        del fs
+
+        if view:
+            entry.update(bench_search_view(df_flights, backend))
+        entry['peak_rss_bytes'] = peak_rss_bytes()
+        result['scales'].append(entry)
+    return result
+
+
+def bench_search_view(df_flights, backend='networkx'):
+    """Grava os voos no banco atual e mede /search/ pelo test client, com o cache frio e quente"""
+    flights.objects.all().delete()
+    ingest_seconds, _ = timed(upsert_flights, df_flights)
+    origin, destination = SCALE_QUERIES['hub']
+    client = Client()
+    result = {'ingest': {'seconds': ingest_seconds, 'rows': flights.objects.count()}}
+
+    with override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None, FLIGHT_SEARCH_BACKEND=backend):
+        flight_graph_cache.invalidate()
+        try:
+            for name in ('search_view_cold', 'search_view_warm'):
+                seconds, response = timed(client.get, '/search/', {'query': f'{origin} para {destination}'})
+                result[name] = {'seconds': seconds, 'status': response.status_code}
+        finally:
+            flight_graph_cache.invalidate()
+    return result
+
+
+def bench_startup(n_flights=None, repeat=5):
+    """Tempo de boot de um worker: django.setup() e import das URLs, em interpretadores novos.
+
+    Reporta o melhor tempo entre repeat execuções e quais módulos pesados foram
+    carregados só pelo import.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT % (HEAVY_MODULES,)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'name': 'startup',
+        'seconds': min(run['seconds'] for run in runs),
+        'heavy_modules_loaded': runs[-1]['loaded'],
+    }
+
+
+def bench_astar(n_flights=20000, queries=(('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'MAO'), ('FLN', 'VCP'))):
+    """Compara Dijkstra e A* (limites inferiores por aeroporto): nós expandidos e latência"""
+    df_flights = generate_flights(n_flights, days=3)
+    result = {'name': 'astar', 'n_flights': n_flights}
+    for backend in GRAPH_BACKENDS:
+        fs = FlightSearch(df_flights, backend=backend)
+        fs._create_time_aware_graph()
+        bounds_seconds, _ = timed(AirportLowerBounds.from_flights, df_flights)
+        backend_result = {'lower_bounds_seconds': bounds_seconds, 'queries': {}}
+        for origin, destination in queries:
+            query_result = {}
+            for name, heuristic in (('dijkstra', False), ('astar', True)):
+                stats = {}
+                seconds, (_, cost) = timed(fs.find_cheapest_path, origin, destination, heuristic=heuristic,
+                                           stats=stats, repeat=3)
+                query_result[name] = {'seconds': seconds, 'nodes_expanded': stats.get('nodes_expanded'),
+                                      'cost': float(cost)}
+            backend_result['queries'][f'{origin}-{destination}'] = query_result
+        result[backend] = backend_result
+    return result
+
+
+def bench_batch(n_flights=20000, n_queries=400, backend='csr'):
+    """Vazão (consultas/s) do pool de busca em lote com 1, 2, 4, ... processos, até o número de núcleos"""
+    fs = build_flight_search(n_flights, backend=backend)
+    pairs = list(itertools.permutations(HUB_AIRPORTS + REGIONAL_AIRPORTS, 2))
+    queries = [{'origin': origin, 'destination': destination, 'depart_after': None, 'depart_before': None}
+               for origin, destination in itertools.islice(itertools.cycle(pairs), n_queries)]
+    result = {'name': 'batch', 'n_flights': n_flights, 'n_queries': n_queries, 'backend': backend,
+              'queries_per_second': {}}
+
+    processes = 1
+    while processes <= (os.cpu_count() or 1):
+        pool = BatchSearchPool(fs, processes)
+        try:
+            seconds, _ = timed(lambda: list(pool.imap(queries)))
+        finally:
+            pool.close()
+        result['queries_per_second'][processes] = n_queries / seconds
+        processes *= 2
+    return result
+
+
+def bench_fare_matrix(n_flights=20000, backend='csr'):
+    """Tempo de construção da tabela de tarifas mínimas e consulta O(1) contra a busca ao vivo"""
+    fs = build_flight_search(n_flights, backend=backend)
+    pairs = list(itertools.permutations(sorted(fs.known_airport_codes()), 2))
+    result = {'name': 'fare_matrix', 'n_flights': n_flights, 'backend': backend, 'n_pairs': len(pairs),
+              'build_seconds': {}}
+
+    processes = 1
+    while processes <= (os.cpu_count() or 1):
+        result['build_seconds'][processes], fare_matrix = timed(fs.build_fare_matrix, processes)
+        processes *= 2
+    result['nbytes'] = fare_matrix.nbytes
+
+    lookup_seconds, _ = timed(lambda: [fs.cheapest_fare(origin, destination) for origin, destination in pairs])
+    sample = pairs[::max(1, len(pairs) // 20)]
+    live_seconds, _ = timed(lambda: [fs.find_cheapest_path(origin, destination) for origin, destination in sample])
+    result['lookup_seconds_per_query'] = lookup_seconds / len(pairs)
+    result['live_seconds_per_query'] = live_seconds / len(sample)
+    return result
+
+
+def bench_delta(n_flights=100000, n_changed=50, backend='networkx'):
+    """Atualização incremental do grafo (inserções, alterações de preço e cancelamentos) contra a reconstrução.
+
+    Os dois tempos são de FlightGraphCache.get() inteiro, como numa requisição: a
+    construção do grafo na primeira versão dos dados e a atualização na seguinte.
+    """
+    df_flights = generate_flights(n_flights)
+    df_flights['id'] = range(1, n_flights + 1)
+    inserted = generate_flights(n_changed, seed=7)
+    inserted['id'] = range(n_flights + 1, n_flights + n_changed + 1)
+    updated = df_flights.sample(n_changed, random_state=7)
+    updated['preco'] = updated['preco'] + 10
+    cancelled = df_flights['id'].sample(n_changed, random_state=8).tolist()
+
+    version = 1
+    cache = FlightGraphCache(loader=lambda: df_flights, version_loader=lambda: version, backend=backend,
+                             delta_loader=lambda old, new: (pd.concat([inserted, updated]), cancelled))
+    with override_settings(FLIGHT_SEARCH_SNAPSHOT_DIR=''):
+        rebuild_seconds, fs = timed(cache.get)
+        version = 2
+        delta_seconds, updated_fs = timed(cache.get)
+    if updated_fs is not fs:
+        raise RuntimeError("The graph cache rebuilt the graph instead of applying the delta")
+    return {'name': 'delta', 'n_flights': n_flights, 'backend': backend, 'n_changed': 3 * n_changed,
+            'rebuild_seconds': rebuild_seconds, 'delta_seconds': delta_seconds}
+
+
+def bench_response_cache(n_flights=20000, limit=100):
+    """Grava as páginas da API no cache em disco e mede a ingestão reproduzida a partir dele (modo replay)"""
+    pages = api_pages(generate_flights(n_flights), limit=limit)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ResponseCache(directory, replay=True)
+        start = time.perf_counter()
+        for page in pages:
+            cache.put(AVIATIONSTACK_URL, {'limit': limit, 'offset': page['pagination']['offset']}, page)
+        store_seconds = time.perf_counter() - start
+
+        client = AviationStackClient('benchmark', limit=limit, cache=cache)
+        replay_seconds, replayed = timed(lambda: list(client.iter_pages()))
+        client.close()
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {'name': 'response_cache', 'n_flights': n_flights, 'pages': len(replayed),
+            'store_seconds': store_seconds, 'replay_seconds': replay_seconds,
+            'replay_pages_per_second': len(replayed) / replay_seconds,
+            'json_bytes': sum(len(json.dumps(page)) for page in pages), 'disk_bytes': disk_bytes}
+
+
+def bench_normalize(n_flights=100000, batch_size=10000):
+    """Vazão da normalização dos voos da API: documento inteiro (json.loads) contra leitura incremental"""
+    dump = json.dumps(api_pages(generate_flights(n_flights), limit=n_flights)[0]).encode()
+
+    def whole_document():
+        return normalize_flights(json.loads(dump)['data'])
+
+    def incremental():
+        return sum(len(df_flights) for df_flights in iter_flight_batches(io.BytesIO(dump), batch_size=batch_size))
+
+    results = {'name': 'normalize', 'n_flights': n_flights, 'dump_bytes': len(dump), 'batch_size': batch_size}
+    for name, func in (('whole_document', whole_document), ('incremental', incremental)):
+        seconds, _ = timed(func)
+        _, peak, _ = traced(func)
+        results[name] = {'seconds': seconds, 'flights_per_second': n_flights / seconds, 'peak_bytes': peak}
+    return results
+
+
+def bench_flight_table(n_flights=1000000):
+    """Memória da tabela de voos no formato carregado do banco contra o formato compacto do FlightSearch"""
+    df_flights = generate_flights(n_flights, days=max(1, n_flights // FLIGHTS_PER_DAY))
+    df_flights.insert(0, 'id', range(1, n_flights + 1))
+    compact_seconds, compact = timed(compact_flights, df_flights)
+    before, after = memory_by_column(df_flights), memory_by_column(compact)
+    return {'name': 'flight_table', 'n_flights': n_flights, 'compact_seconds': compact_seconds,
+            'before_bytes': sum(before.values()), 'after_bytes': sum(after.values()),
+            'before_by_column': before, 'after_by_column': after}
+
+
+def bench_route_map(n_flights=100000):
+    """Mapa de rotas agregado por aeroporto: agregação, layout, desenho em PNG/SVG e leitura do cache"""
+    fs = FlightSearch(compact_flights(generate_flights(n_flights, days=max(1, n_flights // FLIGHTS_PER_DAY))))
+    summary_seconds, routes = timed(route_summary, fs.df_flights)
+    airport_layout.cache_clear()
+    results = {'name': 'route_map', 'n_flights': n_flights, 'routes': len(routes), 'summary_seconds': summary_seconds}
+    for fmt in ROUTE_MAP_FORMATS:
+        seconds, image = timed(fs.plot_routes, fmt)
+        results[fmt] = {'seconds': seconds, 'bytes': len(image)}
+    results['layout_cache'] = airport_layout.cache_info()._asdict()
+    results['cached_seconds'], _ = timed(fs.plot_routes, 'png', repeat=5)
+    return results
+
+
+BENCHMARKS = {
+    'hub_query': bench_hub_query,
+    'backends': bench_backends,
+    'csa': bench_csa,
+    'scales': bench_scales,
+    'startup': bench_startup,
+    'batch': bench_batch,
+    'astar': bench_astar,
+    'fare_matrix': bench_fare_matrix,
+    'delta': bench_delta,
+    'response_cache': bench_response_cache,
+    'normalize': bench_normalize,
+    'flight_table': bench_flight_table,
+    'route_map': bench_route_map,
+}
@@ -0,0 +1,125 @@
+from .csr_graph import MIN_CONNECTION_NS, epoch_ns
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+
+class ConnectionScan:
+    """Connection Scan Algorithm (CSA) sobre os voos do df_flights.
+
+    Cada voo é uma conexão (aeroporto de saída, horário de saída, aeroporto de chegada,
+    horário de chegada). As conexões ficam em arrays ordenados por horário de partida
+    (e, separadamente, por horário de chegada), e cada consulta é uma varredura linear,
+    sem heap e sem grafo. Entre dois voos é exigido MIN_CONNECTION_TIME; na origem,
+    qualquer partida a partir do horário pedido serve.
+    """
+
+    def __init__(self, df_flights):
+        codes, airports = pd.factorize(
+            pd.concat([df_flights['departure_iata'], df_flights['arrival_iata']], ignore_index=True), sort=True)
+        n_flights = len(df_flights)
+        departure_time = epoch_ns(df_flights['departure_scheduled'])
+        arrival_time = epoch_ns(df_flights['arrival_scheduled'])
+
+        # Voos com chegada antes da partida quebrariam a varredura em ordem de tempo
+        rows = np.flatnonzero(arrival_time > departure_time)
+        by_departure = rows[np.lexsort((arrival_time[rows], departure_time[rows]))]
+        by_arrival = rows[np.lexsort((departure_time[rows], arrival_time[rows]))]
+
+        self.airport_index = {code: index for index, code in enumerate(airports)}
+        self.departure_airport = codes[:n_flights].astype('int32')
+        self.arrival_airport = codes[n_flights:].astype('int32')
+        self.departure_time = departure_time
+        self.arrival_time = arrival_time
+        self.by_departure = by_departure
+        self.by_arrival = by_arrival
+        self.sorted_departure_time = departure_time[by_departure]
+        self.sorted_arrival_time = arrival_time[by_arrival]
+
+    def _columns(self):
+        """memoryviews das colunas: acesso por elemento rápido, sem copiar os arrays"""
+        return (memoryview(self.departure_airport), memoryview(self.arrival_airport),
+                memoryview(self.departure_time), memoryview(self.arrival_time))
+
+    def earliest_arrival(self, origin, destination, depart_after=None):
+        """Voos (linhas do df_flights) da viagem que chega mais cedo, ou None"""
+        origin = self.airport_index.get(origin)
+        destination = self.airport_index.get(destination)
+        if origin is None or destination is None or origin == destination:
+            return None
+
+        departure_airport, arrival_airport, departure_time, arrival_time = self._columns()
+        earliest = [np.inf] * len(self.airport_index)
+        incoming = [-1] * len(self.airport_index)
+        earliest[origin] = -np.inf if depart_after is None else epoch_ns([depart_after])[0]
+
+        start = 0
+        if depart_after is not None:
+            start = int(np.searchsorted(self.sorted_departure_time, earliest[origin], side='left'))
+
+        for row in memoryview(self.by_departure)[start:]:
+            departs = departure_time[row]
+            if departs >= earliest[destination]:
+                # Nenhuma conexão posterior chega antes da melhor chegada já encontrada
+                break
+            airport = departure_airport[row]
+            ready = earliest[airport] if airport == origin else earliest[airport] + MIN_CONNECTION_NS
+            if ready > departs:
+                continue
+            arrives = arrival_time[row]
+            if arrives < earliest[arrival_airport[row]]:
+                earliest[arrival_airport[row]] = arrives
+                incoming[arrival_airport[row]] = row
+
+        if incoming[destination] < 0:
+            return None
+
+        journey = []
+        airport = destination
+        while airport != origin:
+            row = incoming[airport]
+            journey.append(row)
+            airport = departure_airport[row]
+        return journey[::-1]
+
+    def latest_departure(self, origin, destination, arrive_by=None):
+        """Voos (linhas do df_flights) da viagem que sai mais tarde chegando a tempo, ou None"""
+        origin = self.airport_index.get(origin)
+        destination = self.airport_index.get(destination)
+        if origin is None or destination is None or origin == destination:
+            return None
+
+        departure_airport, arrival_airport, departure_time, arrival_time = self._columns()
+        latest = [-np.inf] * len(self.airport_index)
+        outgoing = [-1] * len(self.airport_index)
+        latest[destination] = np.inf if arrive_by is None else epoch_ns([arrive_by])[0]
+
+        end = len(self.by_arrival)
+        if arrive_by is not None:
+            end = int(np.searchsorted(self.sorted_arrival_time, latest[destination], side='right'))
+
+        for row in memoryview(self.by_arrival)[:end][::-1]:
+            arrives = arrival_time[row]
+            if arrives <= latest[origin]:
+                # Conexões anteriores partem antes da melhor partida já encontrada
+                break
+            airport = arrival_airport[row]
+            deadline = latest[airport] if airport == destination else latest[airport] - MIN_CONNECTION_NS
+            if arrives > deadline:
+                continue
+            departs = departure_time[row]
+            if departs > latest[departure_airport[row]]:
+                latest[departure_airport[row]] = departs
+                outgoing[departure_airport[row]] = row
+
+        if outgoing[origin] < 0:
+            return None
+
+        journey = []
+        airport = origin
+        while airport != destination:
+            row = outgoing[airport]
+            journey.append(row)
+            airport = arrival_airport[row]
+        return journey
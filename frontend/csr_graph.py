@@ -0,0 +1,244 @@
+from heapq import heapify, heappop, heappush
+
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Tempo mínimo de conexão, em nanossegundos (mesma regra do grafo networkx)
+MIN_CONNECTION_NS = 3600 * 10**9
+
+
+def epoch_ns(values):
+    """Converte uma coluna de horários em nanossegundos desde a época (UTC)"""
+    return pd.to_datetime(values, utc=True).values.astype('datetime64[ns]').view('int64')
+
+
+def column_timezone(values):
+    """Fuso horário de uma coluna de horários, ou None para horários sem fuso"""
+    dtype = getattr(values, 'dtype', None)
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return dtype.tz
+    if dtype is not None and dtype.kind == 'M':
+        return None
+    return 'UTC'
+
+
+class CSRFlightGraph:
+    """Grafo temporal compacto em arrays NumPy, no formato CSR.
+
+    Aeroportos e horários são internados em ids inteiros: os nós ficam ordenados por
+    (aeroporto, horário), de modo que os nós de um aeroporto ocupam o intervalo
+    airport_offsets[a]:airport_offsets[a + 1]. As arestas que saem do nó u ficam em
+    offsets[u]:offsets[u + 1] nos arrays targets, price, flight_row e is_connection;
+    flight_row é a linha do voo em df_flights (-1 nas conexões).
+    """
+
+    def __init__(self, airports, node_airport, node_time, offsets, targets, price, flight_row,
+                 is_connection, tz=None):
+        self.airports = airports
+        self.airport_index = {code: index for index, code in enumerate(airports.tolist())}
+        self.node_airport = node_airport
+        self.node_time = node_time
+        self.airport_offsets = np.searchsorted(node_airport, np.arange(len(airports) + 1))
+        self.offsets = offsets
+        self.targets = targets
+        self.price = price
+        self.flight_row = flight_row
+        self.is_connection = is_connection
+        self.tz = tz
+
+    @classmethod
+    def from_flights(cls, df_flights):
+        """Constrói o grafo a partir do df_flights do FlightSearch"""
+        n_flights = len(df_flights)
+        codes, airports = pd.factorize(
+            pd.concat([df_flights['departure_iata'], df_flights['arrival_iata']], ignore_index=True), sort=True)
+        times = np.concatenate([epoch_ns(df_flights['departure_scheduled']),
+                                epoch_ns(df_flights['arrival_scheduled'])])
+
+        # Nós únicos ordenados por (aeroporto, horário)
+        nodes, inverse = np.unique(np.stack([codes.astype('int64'), times], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        node_airport = nodes[:, 0].astype('int32')
+        node_time = nodes[:, 1]
+
+        # Voos: como no networkx, um segundo voo entre os mesmos nós substitui o primeiro
+        flights = pd.DataFrame({'source': inverse[:n_flights], 'target': inverse[n_flights:]})
+        flights = flights.drop_duplicates(keep='last')
+        flight_source = flights['source'].to_numpy()
+        flight_target = flights['target'].to_numpy()
+        flight_row = flights.index.to_numpy()
+        flight_price = pd.to_numeric(df_flights['preco']).to_numpy(dtype='float64')[flight_row]
+
+        wait_source, wait_target = cls._connection_edges(node_airport, node_time, len(airports))
+
+        source = np.concatenate([flight_source, wait_source])
+        order = np.argsort(source, kind='stable')
+        offsets = np.zeros(len(nodes) + 1, dtype='int64')
+        np.cumsum(np.bincount(source, minlength=len(nodes)), out=offsets[1:])
+
+        return cls(
+            airports=np.asarray(airports, dtype='U'),
+            node_airport=node_airport,
+            node_time=node_time,
+            offsets=offsets,
+            targets=np.concatenate([flight_target, wait_target])[order].astype('int32'),
+            price=np.concatenate([flight_price, np.zeros(len(wait_source))])[order],
+            flight_row=np.concatenate([flight_row, np.full(len(wait_source), -1)])[order].astype('int32'),
+            is_connection=np.concatenate([np.zeros(len(flight_source), dtype=bool),
+                                          np.ones(len(wait_source), dtype=bool)])[order],
+            tz=column_timezone(df_flights['departure_scheduled']),
+        )
+
+    @staticmethod
+    def _connection_edges(node_airport, node_time, n_airports):
+        """Arestas de espera com a mesma janela de FlightSearch._add_connection_edges"""
+        airport_offsets = np.searchsorted(node_airport, np.arange(n_airports + 1))
+        sources = []
+        targets = []
+        for airport in range(n_airports):
+            start, end = airport_offsets[airport], airport_offsets[airport + 1]
+            times = node_time[start:end]
+            first = np.searchsorted(times, times + MIN_CONNECTION_NS, side='left')
+            has_connection = first < len(times)
+            window_end = np.full(len(times), len(times))
+            window_end[has_connection] = np.searchsorted(
+                times, times[first[has_connection]] + MIN_CONNECTION_NS, side='left')
+            counts = np.where(has_connection, window_end - first, 0)
+            total = counts.sum()
+            if not total:
+                continue
+            # Para cada nó i, os alvos são first[i], first[i] + 1, ..., window_end[i] - 1
+            repeated_first = np.repeat(first, counts)
+            position = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            sources.append(np.repeat(np.arange(len(times)), counts) + start)
+            targets.append(repeated_first + position + start)
+        if not sources:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='int64')
+        return np.concatenate(sources), np.concatenate(targets)
+
+    @property
+    def n_nodes(self):
+        return len(self.node_time)
+
+    @property
+    def n_edges(self):
+        return len(self.targets)
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelos arrays do grafo"""
+        arrays = (self.airports, self.node_airport, self.node_time, self.airport_offsets, self.offsets,
+                  self.targets, self.price, self.flight_row, self.is_connection)
+        return sum(array.nbytes for array in arrays)
+
+    def airport_nodes(self, code, start=None, end=None):
+        """Intervalo de ids dos nós de um aeroporto (vazio se o aeroporto não existe).
+
+        start e end (inclusivos) restringem o intervalo aos nós nesse período; como os
+        nós de um aeroporto estão ordenados por horário, basta uma busca binária.
+        """
+        airport = self.airport_index.get(code)
+        if airport is None:
+            return range(0)
+        first, last = int(self.airport_offsets[airport]), int(self.airport_offsets[airport + 1])
+        if start is not None or end is not None:
+            times = self.node_time[first:last]
+            if end is not None:
+                last = first + int(np.searchsorted(times, epoch_ns([end])[0], side='right'))
+            if start is not None:
+                first += int(np.searchsorted(times, epoch_ns([start])[0], side='left'))
+        return range(first, max(first, last))
+
+    def airport_code(self, node):
+        """Código IATA do aeroporto de um nó"""
+        return str(self.airports[self.node_airport[node]])
+
+    def timestamp(self, node):
+        """Horário de um nó como pandas.Timestamp, no fuso da coluna original"""
+        return pd.Timestamp(int(self.node_time[node]), tz='UTC').tz_convert(self.tz)
+
+    def shortest_path(self, source_nodes, target_airport, bounds=None, stats=None):
+        """Dijkstra com heap a partir de vários nós, parando no primeiro nó do aeroporto alvo.
+
+        Com bounds (limite inferior de custo de cada aeroporto até o alvo, na ordem de
+        airports), vira A*, com a mesma poda de FlightSearch._dijkstra_to_airport.
+        Retorna a lista de ids das arestas do caminho, ou None se não há caminho;
+        stats, se dado, recebe 'nodes_expanded'.
+        """
+        target_airport = self.airport_index.get(target_airport)
+        if target_airport is None:
+            return None
+        if bounds is None:
+            bounds = [0.0] * len(self.airports)
+        else:
+            bounds = bounds.tolist()
+        node_airport = memoryview(self.node_airport)
+
+        # memoryviews dão acesso por elemento rápido aos arrays, sem copiá-los
+        offsets, targets, price = memoryview(self.offsets), memoryview(self.targets), memoryview(self.price)
+        is_connection = memoryview(self.is_connection)
+        first_target, last_target = self.airport_offsets[target_airport], self.airport_offsets[target_airport + 1]
+        inf = float('inf')
+        distance = [inf] * self.n_nodes
+        predecessor_edge = [-1] * self.n_nodes
+        settled = bytearray(self.n_nodes)
+        best_cost = inf
+        expanded = 0
+
+        heap = []
+        for node in source_nodes:
+            bound = bounds[node_airport[node]]
+            if bound != inf:
+                distance[node] = 0.0
+                heap.append((bound, node))
+        heapify(heap)
+
+        while heap:
+            _, node = heappop(heap)
+            if settled[node]:
+                continue
+            settled[node] = 1
+            expanded += 1
+            cost = distance[node]
+
+            if first_target <= node < last_target:
+                if stats is not None:
+                    stats['nodes_expanded'] = expanded
+                edges = []
+                while predecessor_edge[node] >= 0:
+                    edge = predecessor_edge[node]
+                    edges.append(edge)
+                    node = self.edge_source(edge)
+                return edges[::-1]
+
+            is_source = predecessor_edge[node] < 0
+            for edge in range(offsets[node], offsets[node + 1]):
+                if is_source and is_connection[edge]:
+                    # Esperar na origem equivale a partir de outro nó de origem
+                    continue
+                neighbor = targets[edge]
+                new_cost = cost + price[edge]
+                if new_cost < distance[neighbor]:
+                    bound = bounds[node_airport[neighbor]]
+                    if bound == inf:
+                        # Aeroporto sem caminho até o alvo: enquanto best_cost também é
+                        # infinito, a poda abaixo não o descartaria
+                        continue
+                    estimate = new_cost + bound
+                    if estimate > best_cost:
+                        continue
+                    if first_target <= neighbor < last_target and new_cost < best_cost:
+                        best_cost = new_cost
+                    distance[neighbor] = new_cost
+                    predecessor_edge[neighbor] = edge
+                    heappush(heap, (estimate, neighbor))
+
+        if stats is not None:
+            stats['nodes_expanded'] = expanded
+        return None
+
+    def edge_source(self, edge):
+        """Nó de origem de uma aresta (busca binária em offsets)"""
+        return int(np.searchsorted(self.offsets, edge, side='right') - 1)
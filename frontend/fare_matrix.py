@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+from heapq import heapify, heappop, heappush
+from itertools import count
+
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+
+# Interface de busca usada pelos processos da varredura; herdada do processo pai via fork
+_worker_search_graph = None
+
+
+def cheapest_from_airport(search_graph, origin, n_airports=None):
+    """Dijkstra com múltiplas origens a partir de todos os nós de um aeroporto, sem alvo.
+
+    O primeiro nó fixado de cada aeroporto dá a tarifa mínima até ele, com a mesma regra
+    de find_cheapest_path (esperar na origem não conta como conexão); a busca para
+    quando os n_airports aeroportos foram alcançados. Retorna
+    {aeroporto: (tarifa, linhas do df_flights dos voos do itinerário)}.
+    """
+    counter = count()
+    distance = {}
+    predecessor = {}
+    heap = []
+    for node in search_graph.airport_nodes(origin):
+        distance[node] = 0
+        predecessor[node] = None
+        heap.append((0, next(counter), node))
+    heapify(heap)
+
+    settled = set()
+    reached = {}
+    while heap:
+        cost, _, node = heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        airport = search_graph.airport(node)
+        if airport not in reached:
+            reached[airport] = (cost, node)
+            if len(reached) == n_airports:
+                break
+
+        is_source = predecessor[node] is None
+        for neighbor, price, is_connection, edge in search_graph.out_edges(node):
+            if is_source and is_connection:
+                continue
+            new_cost = cost + price
+            if new_cost < distance.get(neighbor, float('inf')):
+                distance[neighbor] = new_cost
+                predecessor[neighbor] = (node, edge, is_connection)
+                heappush(heap, (new_cost, next(counter), neighbor))
+
+    fares = {}
+    for airport, (cost, node) in reached.items():
+        rows = []
+        while predecessor[node] is not None:
+            node, edge, is_connection = predecessor[node]
+            if not is_connection:
+                rows.append(search_graph.flight_row(edge))
+        fares[airport] = (float(cost), rows[::-1])
+    return fares
+
+
+def _sweep_airport(task):
+    origin, n_airports = task
+    return origin, cheapest_from_airport(_worker_search_graph, origin, n_airports)
+
+
+class FareMatrix:
+    """Tarifa mínima entre todos os pares de aeroportos, para consultas em O(1).
+
+    fares[i, j] é a menor tarifa de airports[i] até airports[j] (inf sem caminho) e
+    itinerary_ids[i, j] o id do itinerário correspondente (-1 sem caminho). Os
+    itinerários ficam em formato CSR: as linhas do df_flights do itinerário k são
+    itinerary_rows[itinerary_offsets[k]:itinerary_offsets[k + 1]].
+    """
+
+    def __init__(self, airports, fares, itinerary_ids, itinerary_offsets, itinerary_rows):
+        self.airports = airports
+        self.airport_index = {code: index for index, code in enumerate(airports.tolist())}
+        self.fares = fares
+        self.itinerary_ids = itinerary_ids
+        self.itinerary_offsets = itinerary_offsets
+        self.itinerary_rows = itinerary_rows
+
+    @classmethod
+    def from_search_graph(cls, search_graph, airports, processes=None):
+        """Varre o grafo com um Dijkstra por aeroporto de origem.
+
+        Com processes > 1 e fork disponível, as origens são divididas entre processos
+        que herdam o grafo já construído; caso contrário, a varredura roda aqui mesmo.
+        fork só é seguro em um processo de um único thread, nunca em um worker web.
+        """
+        global _worker_search_graph
+        airports = sorted(airports)
+        processes = min(processes or os.cpu_count() or 1, len(airports))
+        if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            _worker_search_graph = search_graph
+            try:
+                with multiprocessing.get_context('fork').Pool(processes) as pool:
+                    sweeps = pool.map(_sweep_airport, [(origin, len(airports)) for origin in airports],
+                                      max(1, len(airports) // (processes * 4)))
+            finally:
+                _worker_search_graph = None
+        else:
+            sweeps = [(origin, cheapest_from_airport(search_graph, origin, len(airports))) for origin in airports]
+
+        airport_index = {code: index for index, code in enumerate(airports)}
+        fares = np.full((len(airports), len(airports)), np.inf)
+        itinerary_ids = np.full((len(airports), len(airports)), -1, dtype='int32')
+        itinerary_offsets = [0]
+        itinerary_rows = []
+        for origin, reached in sweeps:
+            for destination, (fare, rows) in reached.items():
+                cell = airport_index[origin], airport_index[destination]
+                fares[cell] = fare
+                itinerary_ids[cell] = len(itinerary_offsets) - 1
+                itinerary_rows.extend(rows)
+                itinerary_offsets.append(len(itinerary_rows))
+
+        return cls(np.asarray(airports, dtype='U'), fares, itinerary_ids,
+                   np.asarray(itinerary_offsets, dtype='int64'), np.asarray(itinerary_rows, dtype='int64'))
+
+    def _cell(self, origin, destination):
+        origin_index = self.airport_index.get(origin)
+        destination_index = self.airport_index.get(destination)
+        if origin_index is None or destination_index is None:
+            return None
+        return origin_index, destination_index
+
+    def fare(self, origin, destination):
+        """Tarifa mínima de origin até destination (inf sem caminho, None se um aeroporto não existe)"""
+        cell = self._cell(origin, destination)
+        if cell is None:
+            return None
+        return float(self.fares[cell])
+
+    def itinerary_rows_for(self, origin, destination):
+        """Linhas do df_flights do itinerário mais barato, ou None se não há caminho"""
+        cell = self._cell(origin, destination)
+        if cell is None or self.itinerary_ids[cell] < 0:
+            return None
+        itinerary_id = self.itinerary_ids[cell]
+        start, end = self.itinerary_offsets[itinerary_id], self.itinerary_offsets[itinerary_id + 1]
+        return self.itinerary_rows[start:end].tolist()
+
+    @property
+    def nbytes(self):
+        """Memória ocupada pelos arrays da tabela"""
+        return sum(array.nbytes for array in (self.fares, self.itinerary_ids, self.itinerary_offsets,
+                                              self.itinerary_rows))
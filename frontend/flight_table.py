@@ -0,0 +1,79 @@
+from .lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+# Colunas do df_flights usadas pelas buscas, pelos grafos e pelos itinerários; as demais
+# (nomes de aeroportos e companhias, códigos ICAO, status) ficam só no banco
+SEARCH_COLUMNS = ('id', 'flight_number', 'departure_iata', 'arrival_iata', 'departure_scheduled',
+                  'arrival_scheduled', 'preco')
+
+# Colunas de aeroporto, guardadas como Categorical com as mesmas categorias
+AIRPORT_COLUMNS = ('departure_iata', 'arrival_iata')
+
+
+def _is_categorical(values):
+    return isinstance(values.dtype, pd.CategoricalDtype)
+
+
+def _as_categorical(values, categories):
+    if _is_categorical(values) and values.cat.categories.equals(categories):
+        return values
+    return pd.Series(pd.Categorical(values, categories=categories), index=values.index, name=values.name)
+
+
+def _airport_categories(df_flights):
+    departure, arrival = (df_flights[column] for column in AIRPORT_COLUMNS)
+    if (_is_categorical(departure) and _is_categorical(arrival)
+            and departure.cat.categories.equals(arrival.cat.categories)):
+        return departure.cat.categories
+    codes = pd.concat([departure.astype(object), arrival.astype(object)], ignore_index=True).dropna()
+    return pd.Index(pd.unique(codes)).sort_values()
+
+
+def compact_flights(df_flights):
+    """Tabela de voos no formato compacto guardado pelo FlightSearch.
+
+    Só as SEARCH_COLUMNS presentes são mantidas. Os códigos de aeroporto e os números de
+    voo, que se repetem muito, viram pandas.Categorical (códigos inteiros mais uma cópia
+    de cada texto); os horários ficam em datetime64 (int64 em nanossegundos) e o preço
+    em float64, mesmo vindo como Decimal do ORM. Colunas que já estão no formato
+    compacto não são copiadas.
+    """
+    columns = {}
+    if 'id' in df_flights:
+        columns['id'] = df_flights['id'].astype('int64', copy=False)
+    flight_number = df_flights['flight_number']
+    columns['flight_number'] = flight_number if _is_categorical(flight_number) else flight_number.astype('category')
+    airports = _airport_categories(df_flights)
+    for column in AIRPORT_COLUMNS:
+        columns[column] = _as_categorical(df_flights[column], airports)
+    for column in ('departure_scheduled', 'arrival_scheduled'):
+        columns[column] = pd.to_datetime(df_flights[column])
+    columns['preco'] = pd.to_numeric(df_flights['preco']).astype('float64', copy=False)
+    return pd.DataFrame(columns, index=df_flights.index, copy=False)
+
+
+def concat_flights(frames):
+    """Concatena tabelas de voos no formato compacto.
+
+    As categorias de cada coluna são unidas antes, senão pandas.concat devolveria as
+    colunas Categorical como texto.
+    """
+    frames = [compact_flights(frame) for frame in frames]
+    groups = (('flight_number',), AIRPORT_COLUMNS)
+    for group in groups:
+        categories = frames[0][group[0]].cat.categories
+        for frame in frames[1:]:
+            for column in group:
+                categories = categories.union(frame[column].cat.categories)
+        for frame in frames:
+            for column in group:
+                if not frame[column].cat.categories.equals(categories):
+                    frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def memory_by_column(df_flights):
+    """Bytes ocupados por coluna, contando os textos dos objetos Python e das categorias"""
+    usage = df_flights.memory_usage(index=False, deep=True)
+    return {column: int(nbytes) for column, nbytes in usage.items()}
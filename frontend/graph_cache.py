@@ -0,0 +1,257 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Subquery
+from django.utils import timezone
+
+from .FlightSearch import CANCELLED_STATUS, FlightSearch
+from .instrumentation import increment, stage
+from .lazy import LazyModule
+from .models import FlightDeletions, flights
+
+pd = LazyModule('pandas')
+
+# Acima desta fração de voos alterados, reconstruir o grafo é mais barato que atualizá-lo
+MAX_DELTA_FRACTION = 0.2
+
+# Colunas da tabela flights usadas para montar o df_flights do FlightSearch
+FLIGHT_COLUMNS = [
+    'id', 'flight_iata', 'flight_icao', 'airline_name', 'airline_iata', 'airline_icao',
+    'flight_number', 'departure_airport', 'departure_iata', 'departure_scheduled',
+    'arrival_airport', 'arrival_iata', 'arrival_scheduled', 'status', 'preco',
+]
+
+
+def flights_data_version():
+    """Retorna um token barato que muda sempre que a tabela flights muda.
+
+    O maior id detecta inserções, o maior updated_at atualizações de linhas existentes
+    (os dois lidos pelos índices, sem varrer a tabela) e o contador de FlightDeletions,
+    remoções.
+    """
+    latest = flights.objects.filter(updated_at__isnull=False).order_by('-updated_at').values('updated_at')[:1]
+    token = (FlightDeletions.objects.filter(pk=1)
+             .annotate(max_id=Subquery(flights.objects.order_by('-id').values('id')[:1]),
+                       updated_at=Subquery(latest))
+             .values_list('count', 'max_id', 'updated_at').first())
+    if token is None:
+        # Banco sem a linha do contador (criada pela migração): nenhuma remoção registrada
+        stats = flights.objects.aggregate(max_id=Max('id'), updated_at=Max('updated_at'))
+        return 0, stats['max_id'], stats['updated_at']
+    return token
+
+
+def load_flights_dataframe(window_start=None, window_hours=None):
+    """Carrega os voos em um DataFrame no formato do FlightSearch.
+
+    Com window_hours, carrega só os voos que partem em [window_start, window_start +
+    window_hours) (window_start padrão: agora), usando o índice de departure_scheduled.
+    As linhas vêm de values_list e são montadas direto em colunas tipadas. Voos
+    cancelados ficam de fora.
+    """
+    queryset = flights.objects.exclude(status=CANCELLED_STATUS)
+    if window_hours is not None:
+        window_start = window_start or timezone.now()
+        queryset = queryset.filter(departure_scheduled__gte=window_start,
+                                   departure_scheduled__lt=window_start + timedelta(hours=window_hours))
+
+    with stage('db_read'):
+        rows = list(queryset.values_list(*FLIGHT_COLUMNS))
+    with stage('dataframe'):
+        return _rows_to_dataframe(rows)
+
+
+def _rows_to_dataframe(rows):
+    """Monta o DataFrame tipado a partir das linhas de values_list(*FLIGHT_COLUMNS)"""
+    columns = dict(zip(FLIGHT_COLUMNS, zip(*rows))) if rows else {name: [] for name in FLIGHT_COLUMNS}
+    df_flights = pd.DataFrame(columns, columns=FLIGHT_COLUMNS)
+    df_flights['id'] = df_flights['id'].astype('int64')
+    df_flights['departure_scheduled'] = pd.to_datetime(df_flights['departure_scheduled'], utc=True)
+    df_flights['arrival_scheduled'] = pd.to_datetime(df_flights['arrival_scheduled'], utc=True)
+    df_flights['preco'] = pd.to_numeric(df_flights['preco']).astype('float64')
+    return df_flights
+
+
+def search_window_start():
+    """Início da janela de busca, arredondado para a hora.
+
+    Faz parte do token de versão do cache, então o grafo acompanha a janela deslizante
+    com no máximo uma reconstrução por hora.
+    """
+    return timezone.now().replace(minute=0, second=0, microsecond=0)
+
+
+def load_search_window():
+    """Carrega os voos da janela de busca configurada em FLIGHT_SEARCH_WINDOW_HOURS"""
+    window_hours = settings.FLIGHT_SEARCH_WINDOW_HOURS
+    if window_hours is None:
+        return load_flights_dataframe()
+    return load_flights_dataframe(search_window_start(), window_hours)
+
+
+def search_window_version():
+    """Token de versão dos dados e da janela de busca"""
+    if settings.FLIGHT_SEARCH_WINDOW_HOURS is None:
+        return flights_data_version()
+    return flights_data_version(), search_window_start(), settings.FLIGHT_SEARCH_WINDOW_HOURS
+
+
+def load_flights_delta(old_version, new_version):
+    """Voos alterados entre duas versões de search_window_version, como (DataFrame, ids removidos).
+
+    Traz as linhas com updated_at a partir do da versão anterior; as que saíram da
+    janela de busca são devolvidas como removidas (as canceladas o FlightSearch
+    reconhece pelo status). Retorna None quando a variação não pode ser aplicada
+    incrementalmente: a janela andou ou houve remoções no banco.
+    """
+    window_hours = settings.FLIGHT_SEARCH_WINDOW_HOURS
+    window_start = None
+    if window_hours is not None:
+        (old_version, old_start, old_hours), (new_version, window_start, new_hours) = old_version, new_version
+        if (old_start, old_hours) != (window_start, new_hours):
+            return None
+    (old_deletions, _, old_updated_at), (new_deletions, _, _) = old_version, new_version
+    if old_updated_at is None or old_deletions != new_deletions:
+        return None
+
+    with stage('db_read'):
+        rows = list(flights.objects.filter(updated_at__gte=old_updated_at).values_list(*FLIGHT_COLUMNS))
+    changed = _rows_to_dataframe(rows)
+
+    if window_start is None:
+        return changed, []
+    in_window = ((changed['departure_scheduled'] >= window_start)
+                 & (changed['departure_scheduled'] < window_start + timedelta(hours=window_hours)))
+    return changed[in_window], changed.loc[~in_window, 'id'].tolist()
+
+
+class FlightGraphCache:
+    """Cache do grafo temporal compartilhado pelas requisições de um processo.
+
+    O grafo é construído uma vez por worker e reconstruído apenas quando o token de
+    versão dos dados muda. Enquanto uma reconstrução está em andamento, as demais
+    requisições continuam sendo atendidas com o grafo anterior; só a primeira
+    construção faz as requisições esperarem.
+
+    Com snapshot_dir (padrão: settings.FLIGHT_SEARCH_SNAPSHOT_DIR), o grafo de cada
+    versão é gravado em disco por quem o constrói primeiro, e os demais workers apenas
+    mapeiam o snapshot em memória em vez de reconstruí-lo. Snapshots usam o backend CSR.
+
+    Com delta_loader (sem snapshots), uma nova versão dos dados é aplicada ao grafo
+    atual com FlightSearch.apply_flight_delta quando a variação é pequena; a
+    reconstrução completa fica para quando a janela anda ou há remoções no banco.
+
+    A tabela de tarifas mínimas entre aeroportos nunca é calculada no caminho das
+    requisições: vem do snapshot (gravada por snapshot_graph) ou, com
+    FLIGHT_SEARCH_FARE_MATRIX, é calculada em segundo plano logo depois de cada
+    construção e acrescentada ao snapshot, se houver. Uma atualização incremental a
+    descarta e a recalcula da mesma forma; até lá, /api/fare/ usa a busca ao vivo.
+    """
+
+    def __init__(self, loader=load_search_window, version_loader=search_window_version, backend=None,
+                 snapshot_dir=None, delta_loader=None):
+        self.loader = loader
+        self.version_loader = version_loader
+        self.delta_loader = delta_loader
+        self.backend = backend
+        self.snapshot_dir = snapshot_dir
+        self._build_lock = threading.Lock()
+        self._version = None
+        self._flight_search = None
+
+    def get(self):
+        """Retorna um FlightSearch com o grafo construído para a versão atual dos dados"""
+        with stage('db_version'):
+            version = self.version_loader()
+        flight_search = self._flight_search
+        if flight_search is not None and self._version == version:
+            increment('graph_cache_hit')
+            return flight_search
+
+        if flight_search is not None:
+            if not self._build_lock.acquire(blocking=False):
+                # Outro thread está reconstruindo; serve o grafo anterior
+                increment('graph_cache_stale')
+                return flight_search
+        else:
+            self._build_lock.acquire()
+
+        try:
+            if self._flight_search is None or self._version != version:
+                if self._update(version):
+                    increment('graph_cache_delta')
+                else:
+                    increment('graph_cache_miss')
+                    self._flight_search = self._build(version)
+                self._version = version
+            else:
+                increment('graph_cache_hit')
+            return self._flight_search
+        finally:
+            self._build_lock.release()
+
+    @property
+    def version(self):
+        """Token de versão dos dados do grafo atual (None antes da primeira construção)"""
+        return self._version
+
+    def invalidate(self):
+        """Descarta o grafo atual, forçando uma reconstrução na próxima chamada"""
+        with self._build_lock:
+            self._flight_search = None
+            self._version = None
+
+    def _update(self, version):
+        """Aplica ao grafo atual só os voos alterados desde a versão anterior; False se é preciso reconstruí-lo"""
+        fs = self._flight_search
+        if (self.delta_loader is None or fs is None or fs.df_flights is None or fs.df_flights.empty
+                or self.snapshot_dir or settings.FLIGHT_SEARCH_SNAPSHOT_DIR):
+            return False
+        with stage('db_delta'):
+            delta = self.delta_loader(self._version, version)
+        if delta is None:
+            return False
+        changed, removed_ids = delta
+        if len(changed) + len(removed_ids) > MAX_DELTA_FRACTION * len(fs.df_flights):
+            return False
+        had_fare_matrix = fs._fare_matrix is not None
+        with stage('graph_delta'):
+            fs.apply_flight_delta(updated=changed, cancelled=removed_ids)
+        if had_fare_matrix or settings.FLIGHT_SEARCH_FARE_MATRIX:
+            fs.refresh_fare_matrix()
+        return True
+
+    def _build(self, version):
+        fs = self._load(version)
+        if settings.FLIGHT_SEARCH_FARE_MATRIX and fs._fare_matrix is None and fs.search_graph() is not None:
+            snapshot_dir = self.snapshot_dir or settings.FLIGHT_SEARCH_SNAPSHOT_DIR
+            fs.refresh_fare_matrix(snapshot=(snapshot_dir, version) if snapshot_dir else None)
+        return fs
+
+    def _load(self, version):
+        """Carrega o grafo de uma versão do snapshot ou o constrói a partir do loader"""
+        snapshot_dir = self.snapshot_dir or settings.FLIGHT_SEARCH_SNAPSHOT_DIR
+        if not snapshot_dir:
+            fs = FlightSearch(self.loader(), backend=self.backend or settings.FLIGHT_SEARCH_BACKEND)
+            fs._process_flight_data()
+            return fs
+
+        with stage('snapshot_load'):
+            fs = FlightSearch.from_snapshot(snapshot_dir, version)
+        if fs is not None:
+            increment('graph_snapshot_hit')
+            return fs
+
+        increment('graph_snapshot_miss')
+        fs = FlightSearch(self.loader(), backend='csr')
+        fs._process_flight_data()
+        if fs.df_flights is not None and not fs.df_flights.empty:
+            try:
+                with stage('snapshot_save'):
+                    fs.save_snapshot(snapshot_dir, version)
+            except OSError as e:
+                print(f"Could not save graph snapshot to {snapshot_dir}: {e}")
+        return fs
+
+flight_graph_cache = FlightGraphCache(delta_loader=load_flights_delta)
@@ -0,0 +1,54 @@
+import pandas as pd
+from django.db import transaction
+
+from .models import flights
+
+# Identidade de um voo: um mesmo número de voo pode operar em vários dias e trechos
+UPSERT_UNIQUE_FIELDS = ['flight_iata', 'departure_iata', 'departure_date']
+
+# Campos atualizados quando um voo já existe; o preço simulado é mantido
+UPSERT_UPDATE_FIELDS = [
+    'flight_icao', 'flight_number', 'airline_name', 'airline_iata', 'airline_icao',
+    'departure_airport', 'departure_scheduled', 'arrival_airport', 'arrival_iata',
+    'arrival_scheduled', 'status', 'updated_at',
+]
+
+INGESTED_COLUMNS = [
+    'flight_iata', 'flight_icao', 'flight_number', 'airline_name', 'airline_iata',
+    'airline_icao', 'departure_airport', 'departure_iata', 'departure_scheduled',
+    'arrival_airport', 'arrival_iata', 'arrival_scheduled', 'status', 'preco',
+]
+
+
+def _prepare_rows(df_flights):
+    """Normaliza o DataFrame do FlightSearch para registros do modelo flights"""
+    df = df_flights.reindex(columns=INGESTED_COLUMNS)
+    df['departure_scheduled'] = pd.to_datetime(df['departure_scheduled'], utc=True)
+    df['arrival_scheduled'] = pd.to_datetime(df['arrival_scheduled'], utc=True)
+    df['departure_date'] = df['departure_scheduled'].dt.date
+    # Um mesmo voo repetido na carga é gravado uma única vez, com os dados mais recentes
+    df = df.drop_duplicates(subset=UPSERT_UNIQUE_FIELDS, keep='last')
+    df = df.astype(object).where(df.notna(), None)
+    for column in ('departure_scheduled', 'arrival_scheduled'):
+        df[column] = [value.to_pydatetime() if value is not None else None for value in df[column]]
+    return df.to_dict('records')
+
+
+def upsert_flights(df_flights, batch_size=1000):
+    """Grava os voos em lotes numa única transação, atualizando os que já existem.
+
+    Retorna o número de voos gravados (inseridos ou atualizados).
+    """
+    if df_flights is None or df_flights.empty:
+        return 0
+
+    objects = [flights(**row) for row in _prepare_rows(df_flights)]
+    with transaction.atomic():
+        flights.objects.bulk_create(
+            objects,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=UPSERT_UNIQUE_FIELDS,
+            update_fields=UPSERT_UPDATE_FIELDS,
+        )
+    return len(objects)
@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+
+from .airport_codes import resolver_stats
+
+logger = logging.getLogger('frontend.timing')
+
+# Limites superiores (ms) dos buckets dos histogramas de latência
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Medições da requisição em andamento; None quando a instrumentação está desligada
+_current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Etapas e contadores medidos durante uma requisição"""
+
+    def __init__(self):
+        self.stages = []
+        self.counters = {}
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def totals(self):
+        """Tempo total por etapa (ms), somando etapas repetidas, na ordem da primeira ocorrência"""
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0) + seconds * 1000
+        return totals
+
+
+class _NullStage:
+    """Contexto vazio usado quando não há medição ativa"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+@contextmanager
+def _timed_stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Mede o bloco como uma etapa da requisição atual.
+
+    Fora de uma requisição instrumentada retorna um contexto vazio, então o custo com a
+    instrumentação desligada é uma leitura de ContextVar.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return _NULL_STAGE
+    return _timed_stage(timings, name)
+
+
+def timed_stage(name):
+    """Decorador equivalente a envolver a função inteira em stage(name)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(counter, amount=1):
+    """Soma amount a um contador (acertos de cache, por exemplo) da requisição atual"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.counters[counter] = timings.counters.get(counter, 0) + amount
+
+
+class Histogram:
+    """Histograma de latências com buckets fixos"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum_ms = 0.0
+
+    def observe(self, milliseconds):
+        self.counts[bisect_left(self.buckets, milliseconds)] += 1
+        self.count += 1
+        self.sum_ms += milliseconds
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum_ms': self.sum_ms,
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class MetricsRegistry:
+    """Agrega, no processo, os histogramas por etapa e os contadores das requisições"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, timings, total_ms, path):
+        """Soma as etapas de uma requisição; o tempo total entra no histograma 'request:<path>'"""
+        with self._lock:
+            for name, milliseconds in list(timings.totals().items()) + [(f'request:{path}', total_ms)]:
+                self.histograms.setdefault(name, Histogram()).observe(milliseconds)
+            for counter, amount in timings.counters.items():
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'stages': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+
+
+metrics = MetricsRegistry()
+
+
+def server_timing_header(totals):
+    """Formata as etapas no cabeçalho Server-Timing (ex.: 'graph_cache;dur=1.2, render;dur=3.4')"""
+    return ', '.join(f'{name};dur={milliseconds:.1f}' for name, milliseconds in totals.items())
+
+
+class ServerTimingMiddleware:
+    """Mede as etapas de cada requisição quando FLIGHT_SEARCH_INSTRUMENTATION está ligado.
+
+    As etapas vão para o cabeçalho Server-Timing, para um log estruturado (JSON) no
+    logger 'frontend.timing' e para os histogramas servidos em /metrics/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.FLIGHT_SEARCH_INSTRUMENTATION:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        totals = timings.totals()
+        response['Server-Timing'] = server_timing_header({**totals, 'total': total_ms})
+        metrics.record(timings, total_ms, request.path)
+        logger.info(json.dumps({
+            'event': 'request_timings',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 3),
+            'stages_ms': {name: round(milliseconds, 3) for name, milliseconds in totals.items()},
+            'counters': timings.counters,
+        }))
+        return response
+
+
+def metrics_view(request):
+    """Histogramas por etapa, contadores agregados e taxas de acerto de cada nível do
+    resolvedor de códigos de aeroporto, apenas para acessos locais"""
+    if not settings.FLIGHT_SEARCH_INSTRUMENTATION or request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        raise Http404
+    return JsonResponse({**metrics.snapshot(), 'airport_codes': resolver_stats.snapshot()})
@@ -0,0 +1,111 @@
+import time
+from heapq import heappop, heappush
+from itertools import count
+
+
+def distances_to_targets(search_graph, target_nodes):
+    """Dijkstra reverso a partir dos nós de destino: custo mínimo de cada nó até o destino.
+
+    É a árvore de caminhos mínimos compartilhada por todos os desvios da busca dos k
+    itinerários; nós que não alcançam o destino ficam fora do dicionário.
+    """
+    distance = {node: 0 for node in target_nodes}
+    heap = [(0, next_id, node) for next_id, node in enumerate(target_nodes)]
+    counter = count(len(heap))
+    settled = set()
+
+    while heap:
+        cost, _, node = heappop(heap)
+        if node in settled:
+            continue
+        settled.add(node)
+        for predecessor, price, _ in search_graph.in_edges(node):
+            new_cost = cost + price
+            if new_cost < distance.get(predecessor, float('inf')):
+                distance[predecessor] = new_cost
+                heappush(heap, (new_cost, next(counter), predecessor))
+
+    return distance
+
+
+class CheapestPaths:
+    """Itinerários entre dois aeroportos em ordem crescente de preço, gerados sob demanda.
+
+    Best-first sobre desvios, no estilo de Eppstein: a distância de cada nó até o
+    destino (uma única árvore de caminhos mínimos reversa) é uma heurística exata, então
+    cada itinerário sai da fila assim que todos os mais baratos já saíram, sem refazer
+    buscas por desvio. Dois caminhos com a mesma sequência de voos diferem só nas
+    esperas e contam como o mesmo itinerário: cada par (sequência de voos, nó) é
+    expandido uma vez. max_expansions e time_budget (segundos) limitam a busca;
+    exhausted indica que um dos limites foi atingido.
+    """
+
+    def __init__(self, search_graph, source_nodes, target_nodes, max_expansions=None, time_budget=None):
+        self.search_graph = search_graph
+        self.source_nodes = list(source_nodes)
+        self.target_nodes = set(target_nodes)
+        self.max_expansions = max_expansions
+        self.time_budget = time_budget
+        self.expanded = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        """Gera (preço, arestas) de cada itinerário, do mais barato para o mais caro"""
+        if self.target_nodes.intersection(self.source_nodes):
+            return
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        remaining = distances_to_targets(self.search_graph, self.target_nodes)
+
+        # Sequências de voos internadas como ids: (sequência pai, aresta do voo) -> id
+        sequences = {}
+        labels = []  # (nó, preço, sequência, rótulo pai, aresta)
+        settled = set()
+        heap = []
+        counter = count()
+
+        def push(node, price, sequence, parent, edge):
+            estimate = remaining.get(node)
+            if estimate is None or (sequence, node) in settled:
+                return
+            labels.append((node, price, sequence, parent, edge))
+            heappush(heap, (price + estimate, next(counter), len(labels) - 1))
+
+        for node in self.source_nodes:
+            push(node, 0, 0, None, None)
+
+        while heap:
+            if self.max_expansions is not None and self.expanded >= self.max_expansions:
+                self.exhausted = True
+                return
+            if deadline is not None and self.expanded % 256 == 0 and time.perf_counter() > deadline:
+                self.exhausted = True
+                return
+
+            _, _, label = heappop(heap)
+            node, price, sequence, _, _ = labels[label]
+            if (sequence, node) in settled:
+                continue
+            settled.add((sequence, node))
+            self.expanded += 1
+
+            if node in self.target_nodes:
+                yield price, self._edges(labels, label)
+                continue
+
+            for neighbor, edge_price, is_connection, edge in self.search_graph.out_edges(node):
+                if is_connection:
+                    if sequence == 0:
+                        # Cada nó da origem já tem o próprio rótulo inicial
+                        continue
+                    push(neighbor, price + edge_price, sequence, label, edge)
+                else:
+                    next_sequence = sequences.setdefault((sequence, edge), len(sequences) + 1)
+                    push(neighbor, price + edge_price, next_sequence, label, edge)
+
+    @staticmethod
+    def _edges(labels, label):
+        edges = []
+        while labels[label][3] is not None:
+            edges.append(labels[label][4])
+            label = labels[label][3]
+        return edges[::-1]
@@ -0,0 +1,29 @@
+import importlib
+
+
+class LazyModule:
+    """Proxy de um módulo que só é importado no primeiro acesso a um de seus atributos.
+
+    Permite manter `pd.DataFrame`, `nx.DiGraph` etc. no código sem pagar o import de
+    bibliotecas pesadas no boot dos workers, quando a requisição não as usa.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        # Chamado só para atributos que não estão na instância, ou seja, os do módulo
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attribute)
+
+    @property
+    def loaded(self):
+        """Indica se o módulo já foi importado"""
+        return self._module is not None
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<LazyModule {self._name!r} ({state})>"
@@ -0,0 +1,70 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+
+class ReadWriteLock:
+    """Lock com vários leitores simultâneos ou um único escritor.
+
+    As buscas leem o grafo em paralelo; uma atualização incremental, que só troca o grafo
+    montado fora da trava, espera as buscas em andamento terminarem e, enquanto espera,
+    segura as novas, para que um fluxo contínuo de buscas não a adie para sempre. Leituras
+    longas (geradores, varreduras) guardam o search_graph e não seguram a trava. Uma leitura aninhada em outra do
+    mesmo thread não espera o escritor (que por sua vez espera a leitura externa); cada
+    thread conta as suas leituras em um threading.local.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def reading(self):
+        held = getattr(self._local, 'reads', 0)
+        if not held:
+            with self._condition:
+                while self._writing or self._writers_waiting:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.reads = held + 1
+        try:
+            yield
+        finally:
+            self._local.reads = held
+            if not held:
+                with self._condition:
+                    self._readers -= 1
+                    if not self._readers:
+                        self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._writers_waiting += 1
+            try:
+                while self._writing or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+                if not self._writers_waiting:
+                    # Libera os leitores retidos se este escritor desistiu da espera
+                    self._condition.notify_all()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+def reads_graph(method):
+    """Executa o método de FlightSearch com o grafo travado para leitura (ver apply_flight_delta)"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.graph_lock.reading():
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,60 @@
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Folga descontada dos limites para que erros de arredondamento nas somas de tarifas
+# nunca os tornem maiores que o custo real
+BOUND_TOLERANCE = 1e-6
+
+
+class AirportLowerBounds:
+    """Limites inferiores de tarifa entre aeroportos, usados como heurística do A*.
+
+    O grafo temporal é colapsado em um grafo de aeroportos, com uma aresta a -> b de
+    custo igual à menor tarifa entre todos os voos de a para b, ignorando horários.
+    A menor soma de tarifas nesse grafo (Floyd-Warshall) nunca supera o custo de um
+    itinerário real, então o limite é admissível; como cada voo custa pelo menos a
+    menor tarifa do seu trecho, ele também é consistente.
+    """
+
+    def __init__(self, airports, matrix):
+        self.airports = list(airports)
+        self.airport_index = {code: index for index, code in enumerate(self.airports)}
+        self.matrix = matrix
+
+    @classmethod
+    def from_flights(cls, df_flights):
+        """Calcula a matriz de limites a partir do df_flights do FlightSearch"""
+        n_flights = len(df_flights)
+        codes, airports = pd.factorize(pd.concat(
+            [df_flights['departure_iata'].astype(str), df_flights['arrival_iata'].astype(str)], ignore_index=True))
+        n_airports = len(airports)
+        prices = pd.to_numeric(df_flights['preco']).to_numpy(dtype='float64')
+
+        matrix = np.full((n_airports, n_airports), np.inf)
+        np.minimum.at(matrix, (codes[:n_flights], codes[n_flights:]), prices)
+        np.fill_diagonal(matrix, 0)
+        for middle in range(n_airports):
+            np.minimum(matrix, matrix[:, middle:middle + 1] + matrix[middle:middle + 1, :], out=matrix)
+        return cls(airports, np.maximum(matrix - BOUND_TOLERANCE, 0))
+
+    def to(self, destination):
+        """Limite de cada aeroporto até destination, como dicionário (aeroportos sem caminho ficam de fora)"""
+        column = self.airport_index.get(destination)
+        if column is None:
+            return {}
+        return {code: bound for code, bound in zip(self.airports, self.matrix[:, column].tolist())
+                if bound != np.inf}
+
+    def to_array(self, destination, airports):
+        """Limites até destination alinhados à ordem de airports (inf sem caminho)"""
+        column = self.airport_index.get(destination)
+        bounds = np.full(len(airports), np.inf)
+        if column is None:
+            return bounds
+        for position, code in enumerate(airports):
+            index = self.airport_index.get(str(code))
+            if index is not None:
+                bounds[position] = self.matrix[index, column]
+        return bounds
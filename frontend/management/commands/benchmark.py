@@ -0,0 +1,59 @@
+import json
+import platform
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from frontend.benchmarks import BENCHMARKS, temporary_test_database
+from frontend.FlightSearch import GRAPH_BACKENDS
+
+
+class Command(BaseCommand):
+    help = "Roda os benchmarks de busca de voos sobre dados sintéticos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks a rodar ({', '.join(BENCHMARKS)})")
+        parser.add_argument('--flights', type=int, help="Número de voos sintéticos")
+        parser.add_argument('--scales', help="Escalas do benchmark scales, separadas por vírgula (ex.: 1000,10000)")
+        parser.add_argument('--backend', choices=GRAPH_BACKENDS, help="Backend do grafo no benchmark scales")
+        parser.add_argument('--no-view', action='store_true', help="Não mede a view /search/ no benchmark scales")
+        parser.add_argument('--no-trace-memory', action='store_true',
+                            help="Não mede o pico de memória com tracemalloc no benchmark scales")
+        parser.add_argument('--output', help="Grava os resultados em um arquivo JSON")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+        kwargs = {}
+        if options['flights']:
+            kwargs['n_flights'] = options['flights']
+
+        scales_kwargs = {'view': not options['no_view'], 'trace_memory': not options['no_trace_memory']}
+        if options['scales']:
+            scales_kwargs['scales'] = tuple(int(scale) for scale in options['scales'].split(','))
+        if options['backend']:
+            scales_kwargs['backend'] = options['backend']
+
+        # A view grava voos no banco: o benchmark scales roda em um banco de teste descartável
+        uses_database = 'scales' in names and scales_kwargs['view']
+        results = []
+        with temporary_test_database() if uses_database else nullcontext():
+            for name in names:
+                result = BENCHMARKS[name](**kwargs, **(scales_kwargs if name == 'scales' else {}))
+                results.append(result)
+                self.stdout.write(json.dumps(result, indent=2, default=str))
+
+        if options['output']:
+            report = {
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, default=str)
+            self.stdout.write(f"Results saved to {options['output']}")
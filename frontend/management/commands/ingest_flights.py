@@ -0,0 +1,83 @@
+import gzip
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from requests.exceptions import RequestException
+
+from frontend.FlightSearch import FlightSearch
+from frontend.ingestion import upsert_flights
+from frontend.normalize import iter_flight_batches
+from frontend.response_cache import ResponseCache
+from frontend.synthetic import generate_flights
+
+# Voos do dump normalizados e gravados por vez, limitando a memória usada pelo comando
+DUMP_BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = "Busca voos da API AviationStack e grava no banco com upserts em lote"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Voos por INSERT")
+        parser.add_argument('--max-pages', type=int, default=10,
+                            help="Máximo de páginas buscadas na API (cada página consome a cota)")
+        parser.add_argument('--workers', type=int, default=4, help="Requisições simultâneas à API")
+        parser.add_argument('--synthetic', type=int, metavar='N',
+                            help="Grava N voos sintéticos em vez de chamar a API")
+        parser.add_argument('--from-file', metavar='PATH',
+                            help="Grava os voos de um dump JSON da API (.json ou .json.gz), lido aos poucos")
+        parser.add_argument('--cache-dir',
+                            help="Cache em disco das páginas da API (padrão: AVIATIONSTACK_CACHE_DIR)")
+        parser.add_argument('--replay', action='store_true',
+                            help="Usa só as páginas gravadas no cache, sem acessar a API")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        cache = None
+        dump = None
+        if options['synthetic']:
+            pages = [generate_flights(options['synthetic'])]
+        elif options['from_file']:
+            path = options['from_file']
+            try:
+                dump = (gzip.open if path.endswith('.gz') else open)(path, 'rb')
+            except OSError as e:
+                raise CommandError(f"Não foi possível abrir {path}: {e}")
+            pages = iter_flight_batches(dump, batch_size=DUMP_BATCH_SIZE)
+        else:
+            fs = FlightSearch()
+            cache_dir = options['cache_dir'] or fs.response_cache_dir
+            if cache_dir:
+                cache = ResponseCache(cache_dir, ttl=fs.response_cache_ttl, replay=options['replay'] or fs.replay)
+            elif options['replay'] or fs.replay:
+                raise CommandError("--replay requer --cache-dir ou AVIATIONSTACK_CACHE_DIR")
+            pages = fs.iter_flight_pages(max_pages=options['max_pages'], max_workers=options['workers'],
+                                         cache=cache)
+
+        count = 0
+        writing = 0.0
+        try:
+            # Cada página é gravada assim que chega, sem esperar as demais
+            for df_flights in pages:
+                page_start = time.perf_counter()
+                count += upsert_flights(df_flights, batch_size=options['batch_size'])
+                writing += time.perf_counter() - page_start
+        except RequestException as e:
+            raise CommandError(f"Não foi possível buscar os voos da API AviationStack: {e}")
+        except ValueError as e:
+            if dump is None:
+                raise
+            raise CommandError(f"Dump JSON inválido: {e}")
+        finally:
+            if dump is not None:
+                dump.close()
+
+        rate = count / writing if writing else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} voos gravados em {writing:.2f}s ({rate:.0f} linhas/s); "
+            f"total {time.perf_counter() - start:.2f}s"
+        ))
+        if cache is not None:
+            stats = cache.stats
+            self.stdout.write(f"Cache de respostas: {stats['hits']} páginas do disco, {stats['revalidated']} "
+                              f"revalidadas (304), {stats['misses']} baixadas")
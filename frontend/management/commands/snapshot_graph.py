@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from frontend.FlightSearch import FlightSearch
+from frontend.graph_cache import load_search_window, search_window_version
+
+
+class Command(BaseCommand):
+    help = "Constrói o grafo de busca a partir do banco e grava o snapshot usado pelos workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Diretório dos snapshots (padrão: FLIGHT_SEARCH_SNAPSHOT_DIR)")
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.FLIGHT_SEARCH_SNAPSHOT_DIR
+        if not directory:
+            raise CommandError("Set FLIGHT_SEARCH_SNAPSHOT_DIR or pass --directory")
+
+        start = time.perf_counter()
+        version = search_window_version()
+        fs = FlightSearch(load_search_window(), backend='csr')
+        if fs.df_flights.empty:
+            raise CommandError("No flights in the database. Run 'python manage.py ingest_flights' first.")
+        fs._process_flight_data()
+        if settings.FLIGHT_SEARCH_FARE_MATRIX:
+            # Calculada aqui, fora dos workers web, e mapeada por eles junto com o grafo
+            fs.build_fare_matrix(settings.FLIGHT_SEARCH_FARE_MATRIX_WORKERS)
+        path = fs.save_snapshot(directory, version)
+
+        elapsed = time.perf_counter() - start
+        graph = fs.csr_graph
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot with {graph.n_nodes} nodes and {graph.n_edges} edges saved to {path} in {elapsed:.1f}s"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0005_alter_flights_arrival_iata_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flights',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
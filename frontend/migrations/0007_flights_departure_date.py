@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:57
+
+from datetime import timezone
+
+from django.db import migrations, models
+
+
+def fill_departure_date(apps, schema_editor):
+    """Preenche departure_date e remove voos duplicados, mantendo o registro mais recente"""
+    flights = apps.get_model('frontend', 'flights')
+    seen = set()
+    duplicates = []
+    for flight in flights.objects.order_by('-id').iterator():
+        if flight.departure_scheduled is not None:
+            flight.departure_date = flight.departure_scheduled.astimezone(timezone.utc).date()
+        key = (flight.flight_iata, flight.departure_iata, flight.departure_date)
+        if None not in key and key in seen:
+            duplicates.append(flight.pk)
+            continue
+        seen.add(key)
+        flights.objects.filter(pk=flight.pk).update(departure_date=flight.departure_date)
+    flights.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0006_flights_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flights',
+            name='departure_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_departure_date, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='flights',
+            constraint=models.UniqueConstraint(fields=('flight_iata', 'departure_iata', 'departure_date'), name='unique_flight_per_departure_date'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0007_flights_departure_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flights',
+            index=models.Index(fields=['departure_iata', 'departure_scheduled'], name='flights_dep_iata_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flights',
+            index=models.Index(fields=['arrival_iata', 'arrival_scheduled'], name='flights_arr_iata_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flights',
+            index=models.Index(fields=['departure_scheduled'], name='flights_dep_sched_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+
+def create_deletions_row(apps, schema_editor):
+    apps.get_model('frontend', 'FlightDeletions').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0008_flights_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightDeletions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='flights',
+            index=models.Index(fields=['updated_at'], name='flights_updated_at_idx'),
+        ),
+        migrations.RunPython(create_deletions_row, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,19 @@
+from datetime import timezone as dt_timezone
+
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+def departure_date_of(departure_scheduled):
+    """Data (em UTC) da partida programada, usada na identidade do voo"""
+    if departure_scheduled is None:
+        return None
+    if departure_scheduled.tzinfo is not None:
+        departure_scheduled = departure_scheduled.astimezone(dt_timezone.utc)
+    return departure_scheduled.date()
+
 
 # Create your models here.
 class flights(models.Model):
@@ -11,15 +26,60 @@ class flights(models.Model):
     departure_airport = models.CharField(max_length=100, null=True, blank=True)
     departure_iata = models.CharField(max_length=10, null=True, blank=True)
     departure_scheduled = models.DateTimeField(null=True, blank=True)
+    departure_date = models.DateField(null=True, blank=True, editable=False)
     arrival_airport = models.CharField(max_length=100, null=True, blank=True)
     arrival_iata = models.CharField(max_length=10, null=True, blank=True)
     arrival_scheduled = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=50, null=True, blank=True)
     preco = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        constraints = [
+            # Identidade de um voo usada nos upserts da ingestão
+            models.UniqueConstraint(fields=['flight_iata', 'departure_iata', 'departure_date'],
+                                    name='unique_flight_per_departure_date'),
+        ]
+        indexes = [
+            models.Index(fields=['departure_iata', 'departure_scheduled'], name='flights_dep_iata_sched_idx'),
+            models.Index(fields=['arrival_iata', 'arrival_scheduled'], name='flights_arr_iata_sched_idx'),
+            # Janela de busca por horário de partida, sem filtro de aeroporto
+            models.Index(fields=['departure_scheduled'], name='flights_dep_sched_idx'),
+            # Token de versão (maior updated_at) e voos alterados desde a versão anterior
+            models.Index(fields=['updated_at'], name='flights_updated_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.departure_date = departure_date_of(self.departure_scheduled)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.flight_iata} - {self.airline_name}"
 
     def get_duration(self):
         duration = self.arrival_scheduled - self.departure_scheduled
-        return duration
\ No newline at end of file
+        return duration
+
+
+class FlightDeletions(models.Model):
+    """Contador de voos removidos da tabela flights, em uma única linha.
+
+    Junto com o maior id e o maior updated_at (lidos pelos índices) forma o token de
+    versão dos dados, sem contar as linhas da tabela a cada requisição.
+    """
+    count = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        row = cls.objects.filter(pk=1).values_list('count', flat=True).first()
+        return row or 0
+
+    @classmethod
+    def bump(cls):
+        cls.objects.get_or_create(pk=1)
+        cls.objects.filter(pk=1).update(count=F('count') + 1)
+
+
+@receiver(post_delete, sender=flights)
+def count_flight_deletion(sender, **kwargs):
+    FlightDeletions.bump()
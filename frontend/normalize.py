@@ -0,0 +1,171 @@
+import codecs
+import json
+import re
+
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Colunas de df_flights e o campo de onde vêm em cada voo da API: (seção do registro, campo)
+FLIGHT_FIELDS = {
+    'flight_iata': ('flight', 'iata'),
+    'flight_icao': ('flight', 'icao'),
+    'airline_name': ('airline', 'name'),
+    'airline_iata': ('airline', 'iata'),
+    'airline_icao': ('airline', 'icao'),
+    'flight_number': ('flight', 'number'),
+    'departure_airport': ('departure', 'airport'),
+    'departure_scheduled': ('departure', 'scheduled'),
+    'departure_iata': ('departure', 'iata'),
+    'arrival_airport': ('arrival', 'airport'),
+    'arrival_iata': ('arrival', 'iata'),
+    'arrival_scheduled': ('arrival', 'scheduled'),
+    'status': (None, 'flight_status'),
+}
+
+# Valor usado quando o campo não vem no registro
+FIELD_DEFAULTS = {'status': 'scheduled'}
+
+DATETIME_COLUMNS = ('departure_scheduled', 'arrival_scheduled')
+
+# Caracteres lidos por vez por iter_json_records
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'\s*')
+
+
+def normalize_flights(records, rng=None):
+    """Converte voos no formato da API em um DataFrame no formato de FlightSearch.df_flights.
+
+    Cada campo é extraído em uma passada sobre os registros, direto para um array; os
+    voos incompletos (algum campo vazio) saem com uma única máscara sobre as colunas e
+    os horários são convertidos de uma vez, coluna a coluna. O preço é simulado, como
+    no restante do projeto (rng: numpy Generator, padrão um novo a cada chamada).
+    """
+    records = records if isinstance(records, list) else list(records)
+    sections = {}
+    columns = {}
+    for column, (section, field) in FLIGHT_FIELDS.items():
+        if section is None:
+            items = records
+        else:
+            if section not in sections:
+                sections[section] = [record.get(section) or {} for record in records]
+            items = sections[section]
+        default = FIELD_DEFAULTS.get(column)
+        values = np.empty(len(records), dtype=object)
+        values[:] = [item.get(field, default) for item in items]
+        columns[column] = values
+
+    complete = np.ones(len(records), dtype=bool)
+    for values in columns.values():
+        complete &= values.astype(bool)
+    rows = np.flatnonzero(complete)
+
+    # Horários inválidos também descartam o voo; o DataFrame é montado uma única vez, no fim
+    datetimes = {}
+    for column in DATETIME_COLUMNS:
+        parsed = pd.to_datetime(columns[column][rows], utc=True, format='ISO8601', errors='coerce')
+        valid = ~parsed.isna()
+        datetimes = {name: times[valid] for name, times in datetimes.items()}
+        datetimes[column] = parsed[valid]
+        rows = rows[valid]
+    df_flights = pd.DataFrame({column: datetimes[column] if column in datetimes else values[rows]
+                               for column, values in columns.items()})
+
+    rng = rng if rng is not None else np.random.default_rng()
+    df_flights['preco'] = rng.integers(0, 100001, size=len(df_flights)) / 100  # Preço simulado
+    return df_flights
+
+
+class _JSONReader:
+    """Lê valores JSON de um arquivo aos pedaços, guardando em memória só o trecho ainda não lido"""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.buffer = ''
+        self.position = 0
+
+    def fill(self):
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            return False
+        if isinstance(chunk, bytes):
+            chunk = self.decode(chunk)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Próximo caractere que não é espaço"""
+        while True:
+            self.position = _whitespace.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON document, found {self.buffer[self.position]!r}")
+        self.position += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # Um número no fim do trecho pode continuar no próximo
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.position = end
+            return value
+
+
+def iter_json_records(stream, key='data', chunk_size=CHUNK_SIZE):
+    """Gera os elementos de um array JSON sem carregar o documento inteiro.
+
+    stream é um arquivo (texto ou binário UTF-8) com um array ou um objeto cujo campo
+    key é o array, como as respostas da API. Só um registro por vez é decodificado.
+    """
+    reader = _JSONReader(stream, chunk_size)
+    if reader.peek() == '{':
+        reader.position += 1
+        while True:
+            if reader.peek() == '}':
+                return
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.value()
+            if reader.peek() == ',':
+                reader.position += 1
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ']':
+            return
+        reader.expect(',')
+
+
+def iter_flight_batches(stream, batch_size=10000, key='data', rng=None):
+    """Lê um dump JSON da API aos poucos, gerando um DataFrame normalizado a cada batch_size voos"""
+    batch = []
+    for record in iter_json_records(stream, key=key):
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield normalize_flights(batch, rng=rng)
+            batch = []
+    if batch:
+        yield normalize_flights(batch, rng=rng)
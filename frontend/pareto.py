@@ -0,0 +1,89 @@
+from heapq import heappop, heappush
+from itertools import count
+
+# Horário de partida de um rótulo que ainda não saiu da origem
+NOT_DEPARTED = float('inf')
+
+
+def dominates(price, start, flights, other_price, other_start, other_flights):
+    """Um rótulo domina outro no mesmo nó se não é pior em preço, duração e número de voos.
+
+    No mesmo nó, a duração é o horário do nó menos o horário de partida, então partir
+    mais tarde é melhor.
+    """
+    return price <= other_price and start >= other_start and flights <= other_flights
+
+
+def pareto_search(search_graph, source_nodes, target_nodes, max_labels=100000):
+    """Busca multicritério (preço, duração total, número de voos) em uma única passada.
+
+    Os rótulos são expandidos em ordem de preço; um rótulo dominado por outro já fixado
+    no mesmo nó é descartado, assim como os que não podem mais gerar uma opção que não
+    seja dominada pelas já encontradas no destino. Os rótulos nos nós de destino formam
+    o conjunto de Pareto. Retorna (opções, truncado), com cada opção no formato
+    (preço, duração em ns, voos, arestas); truncado indica que max_labels foi atingido.
+    """
+    labels = []  # (nó, preço, partida, voos, rótulo pai, aresta)
+    bags = {}
+    results = []
+    heap = []
+    counter = count()
+
+    def push(node, price, start, flights, parent, edge):
+        for bag_price, bag_start, bag_flights in bags.get(node, ()):
+            if dominates(bag_price, bag_start, bag_flights, price, start, flights):
+                return
+        labels.append((node, price, start, flights, parent, edge))
+        heappush(heap, (price, -start, flights, next(counter), len(labels) - 1))
+
+    for node in source_nodes:
+        push(node, 0, NOT_DEPARTED, 0, None, None)
+
+    while heap:
+        if len(labels) > max_labels:
+            return _collect(labels, results), True
+
+        price, _, flights, _, label = heappop(heap)
+        node, _, start, _, _, _ = labels[label]
+        bag = bags.setdefault(node, [])
+        if any(dominates(*settled, price, start, flights) for settled in bag):
+            continue
+        bag.append((price, start, flights))
+
+        if node in target_nodes and flights:
+            duration = search_graph.time_ns(node) - start
+            if not any(result[1] <= duration and result[2] <= flights for result in results):
+                # Com preço igual, a nova opção pode dominar uma já aceita
+                results = [result for result in results
+                           if not dominates(price, -duration, flights, result[0], -result[1], result[2])]
+                results.append((price, duration, flights, label))
+            continue
+
+        if start != NOT_DEPARTED:
+            # Qualquer continuação chega depois deste nó e usa pelo menos mais um voo
+            elapsed = search_graph.time_ns(node) - start
+            if any(result[1] <= elapsed and result[2] <= flights + 1 for result in results):
+                continue
+
+        for neighbor, edge_price, is_connection, edge in search_graph.out_edges(node):
+            if is_connection:
+                if start == NOT_DEPARTED:
+                    # Cada nó da origem já tem o próprio rótulo inicial
+                    continue
+                push(neighbor, price + edge_price, start, flights, label, edge)
+            else:
+                departure = search_graph.time_ns(node) if start == NOT_DEPARTED else start
+                push(neighbor, price + edge_price, departure, flights + 1, label, edge)
+
+    return _collect(labels, results), False
+
+
+def _collect(labels, results):
+    options = []
+    for price, duration, flights, label in results:
+        edges = []
+        while labels[label][4] is not None:
+            edges.append(labels[label][5])
+            label = labels[label][4]
+        options.append((price, duration, flights, edges[::-1]))
+    return options
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+# Parâmetros que não entram na chave nem são gravados em disco
+SECRET_PARAMS = ('access_key',)
+
+# Validade, em segundos, das páginas gravadas; depois dela, as páginas com ETag ou
+# Last-Modified são revalidadas e as demais, baixadas de novo
+DEFAULT_TTL = 900
+
+
+class ResponseCacheMiss(requests.exceptions.RequestException):
+    """Página pedida no modo replay que não está gravada no cache"""
+
+
+class CachedResponse:
+    """Página gravada no cache, com os validadores HTTP da resposta original"""
+
+    def __init__(self, page, etag=None, last_modified=None, stored_at=0.0):
+        self.page = page
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    @property
+    def has_validators(self):
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        """Cabeçalhos If-None-Match/If-Modified-Since para revalidar a página"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Cache em disco das respostas JSON da API, uma página por arquivo gzip.
+
+    A chave é o hash da URL e dos parâmetros da requisição (sem a chave de acesso).
+    Cada página vale por ttl segundos, contados da data de modificação do arquivo; depois
+    disso, as que têm ETag ou Last-Modified são revalidadas com uma requisição
+    condicional. Com replay=True o cache nunca vai à rede: serve as páginas gravadas,
+    mesmo vencidas, e levanta ResponseCacheMiss para as demais.
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL, replay=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.replay = replay
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stored': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(url, params):
+        public = sorted((name, str(value)) for name, value in params.items() if name not in SECRET_PARAMS)
+        return hashlib.sha256(json.dumps([url, public]).encode()).hexdigest()
+
+    def _path(self, url, params):
+        return os.path.join(self.directory, f'{self.key(url, params)}.json.gz')
+
+    def get(self, url, params):
+        """Página gravada para a requisição, ou None"""
+        try:
+            with open(self._path(url, params), 'rb') as raw:
+                stored_at = os.fstat(raw.fileno()).st_mtime
+                with gzip.open(raw, 'rt', encoding='utf-8') as cache_file:
+                    entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        return CachedResponse(entry['page'], entry.get('etag'), entry.get('last_modified'), stored_at)
+
+    def is_fresh(self, cached):
+        """Se a página ainda está dentro do ttl e pode ser servida sem ir à rede"""
+        return time.time() - cached.stored_at < self.ttl
+
+    def put(self, url, params, page, headers=None):
+        """Grava a página (e os validadores dos cabeçalhos da resposta, se houver)"""
+        headers = headers or {}
+        entry = {
+            'url': url,
+            'params': {name: value for name, value in params.items() if name not in SECRET_PARAMS},
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'page': page,
+        }
+        path = self._path(url, params)
+        # Grava em um arquivo temporário e renomeia: leitores nunca veem uma página pela metade
+        descriptor, temporary = tempfile.mkstemp(prefix='.tmp-', dir=self.directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as cache_file:
+                json.dump(entry, cache_file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.count('stored')
+
+    def touch(self, url, params, cached):
+        """Renova a página depois de um 304 Not Modified, só atualizando a data do arquivo"""
+        try:
+            os.utime(self._path(url, params))
+        except FileNotFoundError:
+            self.put(url, params, cached.page, {'ETag': cached.etag, 'Last-Modified': cached.last_modified})
+
+    def count(self, event):
+        with self._lock:
+            self.stats[event] += 1
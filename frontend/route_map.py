@@ -0,0 +1,116 @@
+import io
+from functools import lru_cache
+
+from .lazy import LazyModule
+
+nx = LazyModule('networkx')
+pd = LazyModule('pandas')
+# Figure desenha sem pyplot: não depende de backend gráfico e pode ser usada por vários threads
+mpl_figure = LazyModule('matplotlib.figure')
+mpl_collections = LazyModule('matplotlib.collections')
+
+# Formatos servidos pelo mapa de rotas e seus content types
+ROUTE_MAP_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Semente do layout: a mesma malha de rotas sempre gera o mesmo desenho
+LAYOUT_SEED = 42
+
+# Até este número de rotas cada sentido vira uma seta com a menor tarifa; acima dele as
+# rotas são desenhadas como linhas sem sentido, que não poluem o mapa nem pesam no desenho
+MAX_DETAILED_ROUTES = 120
+
+# Curvatura das arestas, para que ida e volta entre dois aeroportos não se sobreponham
+EDGE_CURVATURE = 0.12
+
+
+def route_summary(df_flights):
+    """Uma linha por rota (origem, destino), com o número de voos e a menor tarifa"""
+    if df_flights is None or df_flights.empty:
+        return pd.DataFrame({'departure_iata': [], 'arrival_iata': [], 'flights': [], 'cheapest_fare': []})
+    grouped = df_flights.groupby(['departure_iata', 'arrival_iata'], observed=True, sort=True)['preco']
+    routes = grouped.agg(flights='count', cheapest_fare='min').reset_index()
+    routes['departure_iata'] = routes['departure_iata'].astype(str)
+    routes['arrival_iata'] = routes['arrival_iata'].astype(str)
+    return routes
+
+
+@lru_cache(maxsize=8)
+def airport_layout(airports, connections):
+    """Posição de cada aeroporto, calculada uma vez por malha de rotas.
+
+    airports e connections (pares de aeroportos, sem direção) são tuplas ordenadas, para
+    servirem de chave do cache. O spring_layout roda sobre um nó por aeroporto, não sobre
+    os nós (aeroporto, horário) do grafo temporal.
+    """
+    graph = nx.Graph()
+    graph.add_nodes_from(airports)
+    graph.add_edges_from(connections)
+    return nx.spring_layout(graph, seed=LAYOUT_SEED)
+
+
+def _draw_detailed_routes(ax, position, origins, destinations, routes):
+    max_flights = routes['flights'].max()
+    for origin, destination, n_flights, fare in zip(origins, destinations, routes['flights'], routes['cheapest_fare']):
+        (x1, y1), (x2, y2) = position[origin], position[destination]
+        ax.annotate('', xy=(x2, y2), xytext=(x1, y1),
+                    arrowprops={'arrowstyle': '-|>', 'connectionstyle': f'arc3,rad={EDGE_CURVATURE}',
+                                'color': 'steelblue', 'alpha': 0.6, 'lw': 0.5 + 3.5 * n_flights / max_flights,
+                                'shrinkA': 10, 'shrinkB': 10})
+        # Meio da curva arc3: ponto médio deslocado na perpendicular
+        x = (x1 + x2) / 2 + EDGE_CURVATURE / 2 * (y2 - y1)
+        y = (y1 + y2) / 2 - EDGE_CURVATURE / 2 * (x2 - x1)
+        ax.text(x, y, f"R${fare:.0f}", fontsize=7, color='firebrick', ha='center', va='center')
+
+
+def _draw_route_lines(ax, position, origins, destinations, routes):
+    # Ida e volta viram uma única linha, com a soma dos voos dos dois sentidos
+    flights_by_pair = {}
+    for origin, destination, n_flights in zip(origins, destinations, routes['flights']):
+        pair = (min(origin, destination), max(origin, destination))
+        flights_by_pair[pair] = flights_by_pair.get(pair, 0) + n_flights
+    max_flights = max(flights_by_pair.values())
+    ax.add_collection(mpl_collections.LineCollection(
+        [(position[a], position[b]) for a, b in flights_by_pair],
+        linewidths=[0.3 + 3.7 * n_flights / max_flights for n_flights in flights_by_pair.values()],
+        colors='steelblue', alpha=0.5))
+
+
+def render_route_map(routes, fmt='png', title="Rotas de voo"):
+    """Desenha o mapa de rotas de route_summary e retorna a imagem (bytes) no formato fmt.
+
+    A espessura de cada aresta segue o número de voos da rota e o tamanho de cada
+    aeroporto, o número de partidas. Com até MAX_DETAILED_ROUTES rotas, cada sentido
+    é uma seta com a menor tarifa escrita sobre ela; acima disso, uma linha por par.
+    """
+    if fmt not in ROUTE_MAP_FORMATS:
+        raise ValueError(f"Unsupported route map format: {fmt}")
+    figure = mpl_figure.Figure(figsize=(12, 9))
+    ax = figure.add_subplot()
+    ax.set_axis_off()
+    ax.set_title(title)
+    if routes.empty:
+        ax.text(0.5, 0.5, "Nenhum voo carregado", ha='center', va='center', transform=ax.transAxes)
+    else:
+        origins, destinations = routes['departure_iata'].tolist(), routes['arrival_iata'].tolist()
+        airports = tuple(sorted(set(origins) | set(destinations)))
+        connections = tuple(sorted({tuple(sorted(pair)) for pair in zip(origins, destinations) if pair[0] != pair[1]}))
+        position = airport_layout(airports, connections)
+
+        if len(routes) <= MAX_DETAILED_ROUTES:
+            _draw_detailed_routes(ax, position, origins, destinations, routes)
+        else:
+            _draw_route_lines(ax, position, origins, destinations, routes)
+
+        departures = routes.groupby('departure_iata')['flights'].sum()
+        max_departures = departures.max()
+        ax.scatter([position[airport][0] for airport in airports], [position[airport][1] for airport in airports],
+                   s=[200 + 800 * departures.get(airport, 0) / max_departures for airport in airports],
+                   color='skyblue', edgecolors='navy', zorder=3)
+        for airport in airports:
+            ax.text(*position[airport], airport, fontsize=8, ha='center', va='center', zorder=4)
+        ax.set_aspect('equal')
+        ax.margins(0.08)
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=fmt, bbox_inches='tight')
+    return buffer.getvalue()
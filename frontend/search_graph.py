@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+
+
+class NetworkxSearchGraph:
+    """Interface comum de busca sobre o grafo temporal networkx.
+
+    Os nós são as tuplas (aeroporto, horário) e as arestas são pares (nó, vizinho).
+    """
+
+    def __init__(self, graph, df_flights=None):
+        self.graph = graph
+        self.df_flights = df_flights
+        self._nodes_by_airport = None
+        self._flight_rows = None
+
+    def airport_nodes(self, code):
+        if self._nodes_by_airport is None:
+            nodes_by_airport = defaultdict(list)
+            for node in self.graph:
+                nodes_by_airport[node[0]].append(node)
+            self._nodes_by_airport = nodes_by_airport
+        return self._nodes_by_airport.get(code, [])
+
+    def airport(self, node):
+        return node[0]
+
+    def time_ns(self, node):
+        return node[1].value
+
+    def out_edges(self, node):
+        """Gera (vizinho, preço, é conexão, aresta) para cada aresta que sai do nó"""
+        for neighbor, edge_data in self.graph.adj[node].items():
+            yield neighbor, edge_data['weight'], edge_data.get('is_connection', False), (node, neighbor)
+
+    def in_edges(self, node):
+        """Gera (predecessor, preço, aresta) para cada aresta que chega ao nó"""
+        for predecessor, edge_data in self.graph.pred[node].items():
+            yield predecessor, edge_data['weight'], (predecessor, node)
+
+    def leg(self, edge):
+        """Trecho do itinerário correspondente a uma aresta"""
+        node1, node2 = edge
+        edge_data = self.graph[node1][node2]
+        return (node1, node2, edge_data.get('is_connection', False),
+                edge_data.get('flight_number'), edge_data.get('flight_id'), edge_data['weight'])
+
+    def flight_row(self, edge):
+        """Linha do voo de uma aresta no df_flights (-1 nas conexões)"""
+        if self._flight_rows is None:
+            # Como no grafo, o último voo entre os mesmos nós é o que vale
+            df = self.df_flights
+            keys = zip(df['departure_iata'], df['departure_scheduled'], df['arrival_iata'], df['arrival_scheduled'])
+            self._flight_rows = {((origin, departure), (destination, arrival)): row
+                                 for row, (origin, departure, destination, arrival) in enumerate(keys)}
+        return self._flight_rows.get(edge, -1)
+
+
+class CSRSearchGraph:
+    """Interface comum de busca sobre o grafo CSR; nós e arestas são ids inteiros"""
+
+    def __init__(self, graph, df_flights):
+        self.graph = graph
+        self.df_flights = df_flights
+        self._offsets = memoryview(graph.offsets)
+        self._targets = memoryview(graph.targets)
+        self._price = memoryview(graph.price)
+        self._is_connection = memoryview(graph.is_connection)
+        self._node_time = memoryview(graph.node_time)
+        self._node_airport = memoryview(graph.node_airport)
+        self._airport_codes = graph.airports.tolist()
+        self._reverse = None
+
+    def airport_nodes(self, code):
+        return self.graph.airport_nodes(code)
+
+    def airport(self, node):
+        return self._airport_codes[self._node_airport[node]]
+
+    def time_ns(self, node):
+        return self._node_time[node]
+
+    def out_edges(self, node):
+        for edge in range(self._offsets[node], self._offsets[node + 1]):
+            yield self._targets[edge], self._price[edge], self._is_connection[edge], edge
+
+    def in_edges(self, node):
+        if self._reverse is None:
+            self._reverse = self._reverse_index()
+        reverse_offsets, reverse_edges, edge_source = self._reverse
+        for position in range(reverse_offsets[node], reverse_offsets[node + 1]):
+            edge = reverse_edges[position]
+            yield edge_source[edge], self._price[edge], edge
+
+    def _reverse_index(self):
+        """CSR reverso: arestas agrupadas pelo nó de chegada, criado no primeiro uso"""
+        graph = self.graph
+        edge_source = np.repeat(np.arange(graph.n_nodes, dtype='int32'), np.diff(graph.offsets))
+        reverse_edges = np.argsort(graph.targets, kind='stable')
+        reverse_offsets = np.zeros(graph.n_nodes + 1, dtype='int64')
+        np.cumsum(np.bincount(graph.targets, minlength=graph.n_nodes), out=reverse_offsets[1:])
+        return memoryview(reverse_offsets), memoryview(reverse_edges), memoryview(edge_source)
+
+    def leg(self, edge):
+        graph = self.graph
+        source = graph.edge_source(edge)
+        target = int(graph.targets[edge])
+        node1 = (graph.airport_code(source), graph.timestamp(source))
+        node2 = (graph.airport_code(target), graph.timestamp(target))
+        if graph.is_connection[edge]:
+            return node1, node2, True, None, None, 0
+        row = self.df_flights.iloc[int(graph.flight_row[edge])]
+        return node1, node2, False, row['flight_number'], row.get('id'), row['preco']
+
+    def flight_row(self, edge):
+        return int(self.graph.flight_row[edge])
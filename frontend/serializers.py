@@ -0,0 +1,101 @@
+import math
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Número máximo de consultas aceitas em uma requisição do endpoint de lote
+MAX_BATCH_QUERIES = 1000
+
+# Número máximo de itinerários no modo streaming da API de busca
+MAX_STREAMED_ITINERARIES = 20
+
+
+def _json_value(value):
+    """Converte valores do pandas/NumPy em tipos aceitos pelo json"""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # Escalares NumPy (int64, float64, ...)
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def serialize_itinerary(itinerary):
+    """Itinerário de FlightSearch (voos e conexões) em dicionários serializáveis em JSON"""
+    return [{key: _json_value(value) for key, value in item.items()} for item in itinerary or []]
+
+
+def serialize_search_result(index, query, itinerary, cost):
+    """Resultado de uma consulta do lote; cost é None quando não há itinerário"""
+    found = bool(itinerary)
+    return {
+        'index': index,
+        'origin': query['origin'],
+        'destination': query['destination'],
+        'found': found,
+        'cost': _json_value(cost) if found else None,
+        'itinerary': serialize_itinerary(itinerary),
+    }
+
+
+def serialize_itinerary_option(rank, itinerary, cost):
+    """Um itinerário do modo streaming da API de busca"""
+    return {'rank': rank, 'cost': _json_value(cost), 'itinerary': serialize_itinerary(itinerary)}
+
+
+def serialize_search_error(index, query, message):
+    return {
+        'index': index,
+        'origin': query.get('origin'),
+        'destination': query.get('destination'),
+        'error': message,
+    }
+
+
+def parse_time(value, field):
+    """Converte um horário ISO 8601 do corpo ou da query string; sem fuso, usa o fuso do projeto"""
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise ValueError(f"Invalid datetime for '{field}': {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_batch_queries(payload, max_queries=MAX_BATCH_QUERIES):
+    """Valida o corpo do endpoint de lote e retorna as consultas normalizadas.
+
+    O corpo é {"queries": [{"origin": "GRU", "destination": "GIG", "depart_after":
+    "2025-10-01T08:00", "depart_before": "2025-10-01T20:00"}, ...]}; a janela é
+    opcional e horários sem fuso usam o fuso do projeto. Levanta ValueError com a
+    mensagem do primeiro problema encontrado.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get('queries'), list):
+        raise ValueError("Body must be a JSON object with a 'queries' list")
+    queries = payload['queries']
+    if not queries:
+        raise ValueError("'queries' must not be empty")
+    if len(queries) > max_queries:
+        raise ValueError(f"At most {max_queries} queries are accepted per request")
+
+    normalized = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError(f"Query {position} must be an object")
+        origin, destination = query.get('origin'), query.get('destination')
+        if not isinstance(origin, str) or not isinstance(destination, str):
+            raise ValueError(f"Query {position} needs 'origin' and 'destination' airport codes")
+        normalized.append({
+            'origin': origin.strip().upper(),
+            'destination': destination.strip().upper(),
+            'depart_after': parse_time(query.get('depart_after'), 'depart_after'),
+            'depart_before': parse_time(query.get('depart_before'), 'depart_before'),
+        })
+    return normalized
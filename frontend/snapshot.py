@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+
+from .csr_graph import CSRFlightGraph, column_timezone, epoch_ns
+from .fare_matrix import FareMatrix
+from .lazy import LazyModule
+
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+# Versão do formato em disco; snapshots de outro formato são ignorados
+SNAPSHOT_FORMAT = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+# Arrays do CSRFlightGraph gravados no snapshot (airport_offsets e airport_index são recalculados)
+GRAPH_ARRAYS = ('airports', 'node_airport', 'node_time', 'offsets', 'targets', 'price', 'flight_row',
+                'is_connection')
+
+# Colunas do df_flights usadas nas buscas e nos itinerários
+FLIGHT_ARRAYS = ('id', 'departure_scheduled', 'arrival_scheduled', 'preco')
+
+# Colunas de texto, gravadas como códigos inteiros e categorias para virarem
+# pandas.Categorical sem copiar os códigos
+FLIGHT_CATEGORIES = ('flight_number', 'departure_iata', 'arrival_iata')
+
+# Arrays da FareMatrix, gravados quando a tabela já foi calculada
+FARE_MATRIX_ARRAYS = ('airports', 'fares', 'itinerary_ids', 'itinerary_offsets', 'itinerary_rows')
+
+# Snapshots mantidos em disco além do atual (workers antigos ainda podem estar usando)
+SNAPSHOTS_KEPT = 2
+
+
+def snapshot_name(version):
+    """Nome do diretório do snapshot de uma versão dos dados"""
+    return 'flights-' + hashlib.sha1(repr(version).encode()).hexdigest()[:16]
+
+
+def _flight_arrays(df_flights):
+    """Colunas do df_flights como arrays de tipo fixo, que podem ser mapeados em memória"""
+    arrays = {
+        'departure_scheduled': epoch_ns(df_flights['departure_scheduled']),
+        'arrival_scheduled': epoch_ns(df_flights['arrival_scheduled']),
+        'preco': pd.to_numeric(df_flights['preco']).to_numpy(dtype='float64'),
+    }
+    if 'id' in df_flights:
+        arrays['id'] = df_flights['id'].to_numpy(dtype='int64')
+    else:
+        arrays['id'] = np.full(len(df_flights), -1, dtype='int64')
+    for name in FLIGHT_CATEGORIES:
+        codes, categories = pd.factorize(df_flights[name].astype(str))
+        arrays[f'{name}.codes'] = codes.astype('int32')
+        arrays[f'{name}.categories'] = np.asarray(categories, dtype='U')
+    return arrays
+
+
+def save_snapshot(flight_search, directory, version):
+    """Grava o grafo CSR e as colunas de voos do flight_search em directory/<versão>.
+
+    A fare_matrix, se já foi calculada, vai junto (ou é acrescentada depois, com
+    save_fare_matrix).
+
+    Cada array vira um .npy, descrito em um manifest.json com o formato e a versão dos
+    dados. O snapshot é montado em um diretório temporário e renomeado no final, então
+    um worker nunca enxerga um snapshot pela metade. Retorna o caminho do snapshot.
+    """
+    graph = flight_search.csr_graph
+    if graph is None:
+        graph = CSRFlightGraph.from_flights(flight_search.df_flights)
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, snapshot_name(version))
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=directory)
+    try:
+        arrays = {f'graph.{name}': getattr(graph, name) for name in GRAPH_ARRAYS}
+        arrays.update({f'flights.{name}': array for name, array in _flight_arrays(flight_search.df_flights).items()})
+        if flight_search._fare_matrix is not None:
+            arrays.update({f'fare_matrix.{name}': getattr(flight_search._fare_matrix, name)
+                           for name in FARE_MATRIX_ARRAYS})
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+        timezone_name = column_timezone(flight_search.df_flights['departure_scheduled'])
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': repr(version),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'tz': None if timezone_name is None else str(timezone_name),
+            'n_nodes': graph.n_nodes,
+            'n_edges': graph.n_edges,
+            'n_flights': len(flight_search.df_flights),
+            'arrays': {name: {'dtype': str(array.dtype), 'shape': list(array.shape)} for name, array in arrays.items()},
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+        if os.path.exists(path):
+            # Outro processo gravou a mesma versão antes; o conteúdo é o mesmo
+            shutil.rmtree(staging)
+        else:
+            os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _prune_snapshots(directory, keep=path)
+    return path
+
+
+def save_fare_matrix(fare_matrix, directory, version):
+    """Acrescenta a fare_matrix ao snapshot já gravado de uma versão; False se ele não existe.
+
+    Cada array é gravado em um arquivo temporário e renomeado, sem sobrescrever páginas
+    que outro worker tenha mapeado; o manifesto, que passa a listar a tabela, é
+    trocado por último, então quem o lê vê a tabela inteira ou nenhuma.
+    """
+    path = os.path.join(directory, snapshot_name(version))
+    manifest = read_manifest(path)
+    if manifest is None or manifest['version'] != repr(version):
+        return False
+
+    arrays = {f'fare_matrix.{name}': np.ascontiguousarray(getattr(fare_matrix, name)) for name in FARE_MATRIX_ARRAYS}
+    for name, array in arrays.items():
+        _replace_file(os.path.join(path, f'{name}.npy'),
+                      lambda staged: np.save(staged, array, allow_pickle=False))
+    manifest['arrays'].update({name: {'dtype': str(array.dtype), 'shape': list(array.shape)}
+                               for name, array in arrays.items()})
+    _replace_file(os.path.join(path, MANIFEST_NAME), lambda staged: json.dump(manifest, staged, indent=2), mode='w')
+    return True
+
+
+def _replace_file(path, write, mode='wb'):
+    """Grava um arquivo por meio de write(arquivo aberto) em um temporário renomeado para path"""
+    descriptor, staging = tempfile.mkstemp(prefix='.staging-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(descriptor, mode) as staged:
+            write(staged)
+        os.replace(staging, path)
+    except BaseException:
+        os.unlink(staging)
+        raise
+
+
+def _prune_snapshots(directory, keep):
+    """Remove snapshots antigos, mantendo o atual e os SNAPSHOTS_KEPT mais recentes"""
+    snapshots = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith('flights-')]
+    snapshots.sort(key=os.path.getmtime, reverse=True)
+    old = [path for path in snapshots if path != keep][SNAPSHOTS_KEPT:]
+    for path in old:
+        # Workers que ainda mapeiam os arquivos continuam lendo-os até fecharem
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _datetimes(epoch_ns_values, tz):
+    """Horários a partir de nanossegundos desde a época, sem passar por objetos Python"""
+    utc = pd.DatetimeIndex(np.asarray(epoch_ns_values).view('datetime64[ns]')).tz_localize('UTC')
+    return utc.tz_convert(tz)
+
+
+def read_manifest(path):
+    """Manifesto de um snapshot, ou None se não existe ou é de outro formato"""
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def load_snapshot(directory, version):
+    """Carrega o snapshot de uma versão dos dados como (grafo CSR, df_flights), ou None.
+
+    Os arrays são abertos com np.load(mmap_mode='r'): nada é lido até ser usado, e
+    todos os workers do host compartilham as mesmas páginas do cache do sistema.
+    """
+    path = os.path.join(directory, snapshot_name(version))
+    manifest = read_manifest(path)
+    if manifest is None or manifest['version'] != repr(version):
+        return None
+
+    def load(name):
+        return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+
+    tz = manifest['tz']
+    graph = CSRFlightGraph(**{name: load(f'graph.{name}') for name in GRAPH_ARRAYS}, tz=tz)
+    flight_arrays = {name: load(f'flights.{name}') for name in FLIGHT_ARRAYS}
+    categories = {
+        name: pd.Categorical.from_codes(load(f'flights.{name}.codes'), load(f'flights.{name}.categories').tolist())
+        for name in FLIGHT_CATEGORIES
+    }
+    df_flights = pd.DataFrame({
+        'id': flight_arrays['id'],
+        'flight_number': categories['flight_number'],
+        'departure_iata': categories['departure_iata'],
+        'arrival_iata': categories['arrival_iata'],
+        'departure_scheduled': _datetimes(flight_arrays['departure_scheduled'], tz),
+        'arrival_scheduled': _datetimes(flight_arrays['arrival_scheduled'], tz),
+        'preco': flight_arrays['preco'],
+    }, copy=False)
+    return graph, df_flights
+
+
+def load_fare_matrix(directory, version):
+    """Carrega a FareMatrix gravada no snapshot de uma versão dos dados, ou None se não foi gravada"""
+    path = os.path.join(directory, snapshot_name(version))
+    manifest = read_manifest(path)
+    if manifest is None or manifest['version'] != repr(version) or 'fare_matrix.fares' not in manifest['arrays']:
+        return None
+    return FareMatrix(**{name: np.load(os.path.join(path, f'fare_matrix.{name}.npy'), mmap_mode='r',
+                                       allow_pickle=False)
+                         for name in FARE_MATRIX_ARRAYS})
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Hubs e aeroportos regionais usados na malha sintética
+HUB_AIRPORTS = ['GRU', 'GIG', 'BSB', 'CNF', 'VCP']
+REGIONAL_AIRPORTS = [
+    'POA', 'REC', 'SSA', 'FOR', 'CWB', 'BEL', 'MAO', 'FLN', 'GYN', 'NAT',
+    'MCZ', 'VIX', 'CGB', 'CGR', 'SLZ', 'THE', 'JPA', 'AJU', 'PMW', 'IGU',
+]
+AIRLINES = [('LATAM Airlines', 'LA', 'TAM'), ('GOL', 'G3', 'GLO'), ('Azul', 'AD', 'AZU')]
+
+
+def generate_flights(n_flights, days=1, seed=42, start='2025-10-01'):
+    """Gera uma malha hub-and-spoke determinística no formato de FlightSearch.df_flights.
+
+    Metade dos voos liga hubs a aeroportos regionais, um terço liga hubs entre si
+    e o restante liga aeroportos regionais diretamente. Os horários são
+    distribuídos entre 05:00 e 23:00 de cada dia, em intervalos de 5 minutos.
+    """
+    rng = np.random.default_rng(seed)
+    hubs = np.array(HUB_AIRPORTS)
+    regionals = np.array(REGIONAL_AIRPORTS)
+
+    kind = rng.choice(3, size=n_flights, p=[0.5, 1 / 3, 1 / 6])
+    hub = rng.integers(len(hubs), size=n_flights)
+    other_hub = (hub + rng.integers(1, len(hubs), size=n_flights)) % len(hubs)
+    regional = rng.integers(len(regionals), size=n_flights)
+    other_regional = (regional + rng.integers(1, len(regionals), size=n_flights)) % len(regionals)
+    random_hub, other_hub = hubs[hub], hubs[other_hub]
+    random_regional, other_regional = regionals[regional], regionals[other_regional]
+
+    outbound = rng.random(n_flights) < 0.5
+    origin = np.where(kind == 0, np.where(outbound, random_hub, random_regional),
+                      np.where(kind == 1, random_hub, random_regional))
+    destination = np.where(kind == 0, np.where(outbound, random_regional, random_hub),
+                           np.where(kind == 1, other_hub, other_regional))
+
+    day = rng.integers(days, size=n_flights)
+    slot = rng.integers(0, 18 * 12, size=n_flights)
+    departure = (pd.Timestamp(start, tz='UTC') + pd.Timedelta(hours=5)
+                 + pd.to_timedelta(day, unit='D') + pd.to_timedelta(slot * 5, unit='min'))
+    duration = pd.to_timedelta(rng.integers(9, 49, size=n_flights) * 5, unit='min')
+    arrival = departure + duration
+
+    airline = rng.integers(len(AIRLINES), size=n_flights)
+    number = rng.integers(1000, 10000, size=n_flights).astype(str)
+    airline_name = np.array([name for name, _, _ in AIRLINES])[airline]
+    airline_iata = np.array([iata for _, iata, _ in AIRLINES])[airline]
+    airline_icao = np.array([icao for _, _, icao in AIRLINES])[airline]
+    # Preço proporcional à duração, com ruído, como o preço simulado de FlightSearch
+    price = np.round(duration.total_seconds().to_numpy() / 60 * rng.uniform(2, 8, size=n_flights), 2)
+
+    return pd.DataFrame({
+        'flight_iata': np.char.add(airline_iata, number),
+        'flight_icao': np.char.add(airline_icao, number),
+        'airline_name': airline_name,
+        'airline_iata': airline_iata,
+        'airline_icao': airline_icao,
+        'flight_number': number,
+        'departure_airport': origin,
+        'departure_scheduled': departure,
+        'departure_iata': origin,
+        'arrival_airport': destination,
+        'arrival_iata': destination,
+        'arrival_scheduled': arrival,
+        'status': 'scheduled',
+        'preco': price,
+    })
+
+
+def api_pages(df_flights, limit=100):
+    """Converte voos sintéticos em páginas no formato da API AviationStack"""
+    records = []
+    for row in df_flights.to_dict('records'):
+        records.append({
+            'flight_status': row['status'],
+            'departure': {'airport': row['departure_airport'], 'iata': row['departure_iata'],
+                          'scheduled': row['departure_scheduled'].isoformat()},
+            'arrival': {'airport': row['arrival_airport'], 'iata': row['arrival_iata'],
+                        'scheduled': row['arrival_scheduled'].isoformat()},
+            'airline': {'name': row['airline_name'], 'iata': row['airline_iata'], 'icao': row['airline_icao']},
+            'flight': {'number': row['flight_number'], 'iata': row['flight_iata'], 'icao': row['flight_icao']},
+        })
+
+    total = len(records)
+    return [
+        {'pagination': {'limit': limit, 'offset': offset, 'count': len(records[offset:offset + limit]),
+                        'total': total},
+         'data': records[offset:offset + limit]}
+        for offset in range(0, max(total, 1), limit)
+    ]
@@ -1,3 +1,1343 @@
-from django.test import TestCase
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import networkx as nx
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .airport_codes import llm_answer_cache, match_airport_codes, resolver_stats
+from .aviationstack import AviationStackClient
+from .batch import WORKER_START_METHOD, batch_pool_for, close_batch_pool
+from .benchmarks import bench_scales, bench_startup
+from .fare_matrix import FareMatrix
+from .FlightSearch import FlightSearch, MIN_CONNECTION_TIME
+from .flight_table import SEARCH_COLUMNS, compact_flights, concat_flights, memory_by_column
+from .graph_cache import (FlightGraphCache, flight_graph_cache, flights_data_version, load_flights_dataframe,
+                          load_flights_delta, search_window_version)
+from .ingestion import upsert_flights
+from .instrumentation import metrics, stage
+from .locks import ReadWriteLock
+from .models import flights
+from .normalize import iter_flight_batches, iter_json_records, normalize_flights
+from .response_cache import ResponseCache, ResponseCacheMiss
+from .route_map import route_summary
+from .snapshot import load_snapshot
+from .synthetic import api_pages
+
+
+def make_flights(n_flights, airports=('GRU', 'GIG', 'BSB', 'CNF', 'POA', 'REC'), seed=0):
+    """Gera um DataFrame pequeno e determinístico no formato de FlightSearch.df_flights"""
+    rng = random.Random(seed)
+    start = pd.Timestamp('2025-10-01 05:00', tz='UTC')
+    rows = []
+    for i in range(n_flights):
+        origin, destination = rng.sample(airports, 2)
+        # Horários em múltiplos de 15 minutos geram empates e intervalos de exatamente 1h
+        departure = start + pd.Timedelta(minutes=15 * rng.randint(0, 80))
+        arrival = departure + pd.Timedelta(minutes=15 * rng.randint(3, 16))
+        rows.append({
+            'flight_iata': f'XX{i}',
+            'flight_icao': f'XXX{i}',
+            'airline_name': 'Teste',
+            'airline_iata': 'XX',
+            'airline_icao': 'XXX',
+            'flight_number': str(1000 + i),
+            'departure_airport': origin,
+            'departure_scheduled': departure,
+            'departure_iata': origin,
+            'arrival_airport': destination,
+            'arrival_iata': destination,
+            'arrival_scheduled': arrival,
+            'status': 'scheduled',
+            'preco': rng.randint(5000, 100000) / 100,
+        })
+    return pd.DataFrame(rows)
+
+
+def brute_force_connection_graph(df_flights):
+    """Reproduz a construção original O(N²) do grafo temporal, usada como referência"""
+    graph = nx.DiGraph()
+    for _, row in df_flights.iterrows():
+        graph.add_edge((row['departure_iata'], row['departure_scheduled']),
+                       (row['arrival_iata'], row['arrival_scheduled']),
+                       weight=row['preco'], flight_number=row['flight_number'])
+    nodes = list(graph.nodes())
+    for node1, node2 in itertools.product(nodes, nodes):
+        if node1[0] == node2[0] and node1[1] < node2[1] and node2[1] - node1[1] >= MIN_CONNECTION_TIME:
+            graph.add_edge(node1, node2, weight=0, is_connection=True)
+    return graph
+
+
+class TimeAwareGraphTests(SimpleTestCase):
+    def build(self, df_flights):
+        fs = FlightSearch(df_flights)
+        fs._create_time_aware_graph()
+        return fs
+
+    def test_connection_reachability_matches_pairwise_rule(self):
+        df_flights = make_flights(60)
+        graph = self.build(df_flights).time_aware_graph
+        reference = brute_force_connection_graph(df_flights)
+
+        self.assertEqual(set(graph.nodes()), set(reference.nodes()))
+        waits = graph.edge_subgraph(
+            [(u, v) for u, v, data in graph.edges(data=True) if data.get('is_connection')])
+        for node1, node2 in reference.edges():
+            if reference[node1][node2].get('is_connection'):
+                self.assertTrue(nx.has_path(waits, node1, node2))
+        for node1, node2 in waits.edges():
+            self.assertTrue(reference.has_edge(node1, node2))
+
+    def test_cheapest_costs_match_pairwise_rule(self):
+        df_flights = make_flights(80, seed=3)
+        fs = self.build(df_flights)
+        reference = FlightSearch(df_flights)
+        reference.time_aware_graph = brute_force_connection_graph(df_flights)
+
+        airports = sorted(set(df_flights['departure_iata']) | set(df_flights['arrival_iata']))
+        for origin, destination in itertools.permutations(airports, 2):
+            _, cost = fs.find_cheapest_path(origin, destination)
+            _, expected = reference.find_cheapest_path(origin, destination)
+            self.assertAlmostEqual(cost, expected, places=6)
+
+    def test_csr_backend_matches_networkx_backend(self):
+        df_flights = make_flights(120, seed=7)
+        fs = self.build(df_flights)
+        csr = FlightSearch(df_flights, backend='csr')
+        csr._create_time_aware_graph()
+
+        self.assertEqual(csr.csr_graph.n_nodes, fs.time_aware_graph.number_of_nodes())
+        self.assertEqual(csr.csr_graph.n_edges, fs.time_aware_graph.number_of_edges())
+        airports = sorted(set(df_flights['departure_iata']) | set(df_flights['arrival_iata']))
+        for origin, destination in itertools.permutations(airports, 2):
+            itinerary, cost = csr.find_cheapest_path(origin, destination)
+            expected_itinerary, expected_cost = fs.find_cheapest_path(origin, destination)
+            self.assertAlmostEqual(cost, expected_cost, places=6)
+            if expected_itinerary:
+                flights_only = [item for item in itinerary if not item.get('connection')]
+                self.assertEqual(flights_only[0]['from'], origin)
+                self.assertEqual(flights_only[-1]['to'], destination)
+                for leg, next_leg in zip(flights_only, flights_only[1:]):
+                    self.assertTrue(next_leg['departure'] == leg['arrival']
+                                    or next_leg['departure'] - leg['arrival'] >= MIN_CONNECTION_TIME)
+
+    def test_astar_matches_dijkstra_with_fewer_expansions(self):
+        df_flights = make_flights(150, airports=('GRU', 'GIG', 'BSB', 'CNF', 'POA', 'REC', 'SSA', 'FOR'), seed=9)
+        for backend in ('networkx', 'csr'):
+            fs = FlightSearch(df_flights, backend=backend)
+            fs._create_time_aware_graph()
+            for origin, destination in itertools.permutations(('GRU', 'POA', 'REC', 'FOR'), 2):
+                dijkstra_stats, astar_stats = {}, {}
+                _, expected = fs.find_cheapest_path(origin, destination, heuristic=False, stats=dijkstra_stats)
+                _, cost = fs.find_cheapest_path(origin, destination, stats=astar_stats)
+                self.assertAlmostEqual(cost, expected, places=6)
+                self.assertLessEqual(astar_stats['nodes_expanded'], dijkstra_stats['nodes_expanded'])
+
+    def test_astar_never_expands_airports_with_infinite_bounds(self):
+        df_flights = make_flights(2)
+        df_flights[['departure_iata', 'arrival_iata']] = [('GRU', 'BSB'), ('BSB', 'REC')]
+        df_flights['departure_scheduled'] = [pd.Timestamp('2025-10-01 06:00', tz='UTC'),
+                                             pd.Timestamp('2025-10-01 12:00', tz='UTC')]
+        df_flights['arrival_scheduled'] = df_flights['departure_scheduled'] + pd.Timedelta(hours=2)
+        # BSB marcado como sem caminho até REC: nenhum caminho pode passar por ele, mesmo
+        # antes de a busca conhecer algum custo até o destino
+        bounds = {'GRU': 0.0, 'BSB': float('inf'), 'REC': 0.0}
+        for backend in ('networkx', 'csr'):
+            fs = FlightSearch(df_flights, backend=backend)
+            fs._create_time_aware_graph()
+            sources = fs.search_graph().airport_nodes('GRU')
+            stats = {}
+            if backend == 'csr':
+                airport_bounds = np.array([bounds[code] for code in fs.csr_graph.airports])
+                self.assertIsNone(fs.csr_graph.shortest_path(sources, 'REC', airport_bounds, stats))
+            else:
+                self.assertIsNone(fs._dijkstra_to_airport(sources, 'REC', bounds, stats))
+            self.assertEqual(stats['nodes_expanded'], len(sources))
+
+    def test_super_source_search_matches_pairwise_search(self):
+        fs = self.build(make_flights(80, seed=5))
+        for origin, destination in [('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'CNF')]:
+            itinerary, cost = fs.find_cheapest_path(origin, destination)
+            expected_itinerary, expected_cost = fs.find_cheapest_path(origin, destination, mode='pairwise')
+            self.assertAlmostEqual(cost, expected_cost, places=6)
+            self.assertEqual(itinerary[0]['from'], origin)
+            self.assertEqual(itinerary[-1]['to'], destination)
+            self.assertEqual(sum(item.get('price', 0) for item in itinerary), cost)
+            self.assertFalse(any(a.get('connection') and b.get('connection')
+                                 for a, b in zip(itinerary, itinerary[1:])))
+
+
+class DepartureWindowTests(SimpleTestCase):
+    def test_window_matches_multi_source_dijkstra_without_origin_waits(self):
+        df_flights = make_flights(120, seed=8)
+        networkx_search = FlightSearch(df_flights)
+        networkx_search._create_time_aware_graph()
+        csr_search = FlightSearch(df_flights, backend='csr')
+        csr_search._create_time_aware_graph()
+        graph = networkx_search.time_aware_graph
+        depart_after = pd.Timestamp('2025-10-01 08:00', tz='UTC')
+        depart_before = pd.Timestamp('2025-10-01 14:00', tz='UTC')
+
+        for origin, destination in [('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'CNF')]:
+            reference = graph.copy()
+            reference.remove_edges_from([(u, v) for u, v, data in graph.edges(data=True)
+                                         if data.get('is_connection') and u[0] == origin])
+            sources = [node for node in graph if node[0] == origin and depart_after <= node[1] <= depart_before]
+            lengths = nx.multi_source_dijkstra_path_length(reference, sources) if sources else {}
+            expected = min((cost for node, cost in lengths.items() if node[0] == destination), default=float('inf'))
+
+            for fs in (networkx_search, csr_search):
+                itinerary, cost = fs.find_cheapest_path(origin, destination, depart_after=depart_after,
+                                                        depart_before=depart_before)
+                self.assertAlmostEqual(cost, expected, places=6)
+                if itinerary:
+                    self.assertTrue(depart_after <= itinerary[0]['departure'] <= depart_before)
+
+        with self.assertRaises(ValueError):
+            networkx_search.find_cheapest_path('GRU', 'GIG', mode='pairwise', depart_after=depart_after)
+
+
+def brute_force_journeys(df_flights, origin, destination, max_legs=3):
+    """Enumera todas as sequências de até max_legs voos válidas entre origem e destino"""
+    flights_list = df_flights.to_dict('records')
+    journeys = []
+
+    def extend(journey):
+        last = journey[-1]
+        if last['arrival_iata'] == destination:
+            journeys.append(journey)
+            return
+        if len(journey) == max_legs:
+            return
+        for flight in flights_list:
+            if (flight['departure_iata'] == last['arrival_iata']
+                    and flight['departure_scheduled'] - last['arrival_scheduled'] >= MIN_CONNECTION_TIME):
+                extend(journey + [flight])
+
+    for flight in flights_list:
+        if flight['departure_iata'] == origin:
+            extend([flight])
+    return journeys
+
+
+class ConnectionScanTests(SimpleTestCase):
+    def setUp(self):
+        self.df_flights = make_flights(50, airports=('GRU', 'GIG', 'BSB', 'CNF'), seed=13)
+        self.fs = FlightSearch(self.df_flights)
+
+    def flight_legs(self, itinerary):
+        legs = [item for item in itinerary if not item.get('connection')]
+        for leg, next_leg in zip(legs, legs[1:]):
+            self.assertEqual(leg['to'], next_leg['from'])
+            self.assertGreaterEqual(next_leg['departure'] - leg['arrival'], MIN_CONNECTION_TIME)
+        return legs
+
+    def test_earliest_arrival_matches_brute_force(self):
+        depart_after = pd.Timestamp('2025-10-01 09:00', tz='UTC')
+        for origin, destination in itertools.permutations(['GRU', 'GIG', 'BSB', 'CNF'], 2):
+            journeys = [journey for journey in brute_force_journeys(self.df_flights, origin, destination)
+                        if journey[0]['departure_scheduled'] >= depart_after]
+            itinerary, cost = self.fs.find_earliest_arrival_path(origin, destination, depart_after)
+            if not journeys:
+                self.assertIsNone(itinerary)
+                continue
+            legs = self.flight_legs(itinerary)
+            self.assertGreaterEqual(legs[0]['departure'], depart_after)
+            self.assertEqual(legs[-1]['arrival'], min(journey[-1]['arrival_scheduled'] for journey in journeys))
+            self.assertEqual(cost, sum(leg['price'] for leg in legs))
+
+    def test_latest_departure_matches_brute_force(self):
+        arrive_by = pd.Timestamp('2025-10-01 20:00', tz='UTC')
+        for origin, destination in itertools.permutations(['GRU', 'GIG', 'BSB', 'CNF'], 2):
+            journeys = [journey for journey in brute_force_journeys(self.df_flights, origin, destination)
+                        if journey[-1]['arrival_scheduled'] <= arrive_by]
+            itinerary, _ = self.fs.find_latest_departure_path(origin, destination, arrive_by)
+            if not journeys:
+                self.assertIsNone(itinerary)
+                continue
+            legs = self.flight_legs(itinerary)
+            self.assertLessEqual(legs[-1]['arrival'], arrive_by)
+            self.assertEqual(legs[0]['departure'], max(journey[0]['departure_scheduled'] for journey in journeys))
+
+
+class ParetoSearchTests(SimpleTestCase):
+    def test_options_are_non_dominated_and_cover_every_journey(self):
+        df_flights = make_flights(70, seed=11)
+        for backend in ('networkx', 'csr'):
+            fs = FlightSearch(df_flights, backend=backend)
+            fs._create_time_aware_graph()
+            for origin, destination in [('GRU', 'GIG'), ('POA', 'REC'), ('BSB', 'CNF')]:
+                options = fs.find_pareto_paths(origin, destination)
+                _, cheapest = fs.find_cheapest_path(origin, destination)
+                self.assertAlmostEqual(options[0]['cost'], cheapest, places=6)
+
+                criteria = [(option['cost'], option['duration_hours'], option['stops']) for option in options]
+                for a, b in itertools.permutations(criteria, 2):
+                    self.assertFalse(a[0] <= b[0] + 1e-9 and a[1] <= b[1] and a[2] <= b[2])
+
+                for journey in brute_force_journeys(df_flights, origin, destination):
+                    price = sum(flight['preco'] for flight in journey)
+                    hours = (journey[-1]['arrival_scheduled'] - journey[0]['departure_scheduled']) / pd.Timedelta(hours=1)
+                    self.assertTrue(any(cost <= price + 1e-9 and duration <= hours and stops <= len(journey) - 1
+                                        for cost, duration, stops in criteria))
+
+
+class KCheapestPathsTests(SimpleTestCase):
+    def all_itinerary_costs(self, fs, origin, destination):
+        """Enumera no grafo todas as sequências de voos de origem a destino e seus custos"""
+        graph = fs.time_aware_graph
+        costs = {}
+
+        def extend(node, flights_taken, cost):
+            if node[0] == destination and flights_taken:
+                costs[flights_taken] = cost
+                return
+            for neighbor, data in graph.adj[node].items():
+                if data.get('is_connection'):
+                    if flights_taken:
+                        extend(neighbor, flights_taken, cost)
+                else:
+                    extend(neighbor, flights_taken + (data['flight_id'],), cost + data['weight'])
+
+        for node in graph:
+            if node[0] == origin:
+                extend(node, (), 0)
+        return sorted(costs.values())
+
+    def test_k_cheapest_matches_enumeration(self):
+        df_flights = make_flights(30, airports=('GRU', 'GIG', 'BSB', 'CNF'), seed=2)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        fs = FlightSearch(df_flights)
+        fs._create_time_aware_graph()
+        csr = FlightSearch(df_flights, backend='csr')
+        csr._create_time_aware_graph()
+
+        for origin, destination in [('GRU', 'GIG'), ('BSB', 'CNF')]:
+            expected = self.all_itinerary_costs(fs, origin, destination)[:10]
+            for search in (fs, csr):
+                paths = search.find_k_cheapest_paths(origin, destination, 10)
+                self.assertEqual(len(paths), len(expected))
+                for (itinerary, cost), expected_cost in zip(paths, expected):
+                    self.assertAlmostEqual(cost, expected_cost, places=6)
+                    self.assertEqual(itinerary[0]['from'], origin)
+                    self.assertEqual(itinerary[-1]['to'], destination)
+                sequences = [tuple(item['flight_id'] for item in itinerary if not item.get('connection'))
+                             for itinerary, _ in paths]
+                self.assertEqual(len(set(sequences)), len(sequences))
+                self.assertAlmostEqual(paths[0][1], search.find_cheapest_path(origin, destination)[1], places=6)
+
+    def test_expansion_budget_stops_the_search(self):
+        fs = FlightSearch(make_flights(80, seed=5))
+        fs._create_time_aware_graph()
+        self.assertLess(len(fs.find_k_cheapest_paths('GRU', 'GIG', 50, max_expansions=5)), 50)
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+class FlightGraphCacheTests(TestCase):
+    def create_flights(self, df_flights):
+        for row in df_flights.to_dict('records'):
+            flights.objects.create(**row)
+
+    def test_rebuilds_only_when_data_version_changes(self):
+        self.create_flights(make_flights(10))
+        cache = FlightGraphCache()
+
+        fs = cache.get()
+        self.assertIs(cache.get(), fs)
+        self.assertEqual(len(fs.df_flights), 10)
+
+        flights.objects.filter(pk=flights.objects.first().pk).update(preco=1)
+        self.assertIs(cache.get(), fs)  # update() não altera updated_at nem a contagem
+        flights.objects.first().save()
+        rebuilt = cache.get()
+        self.assertIsNot(rebuilt, fs)
+        self.assertIs(cache.get(), rebuilt)
+
+    def test_serves_previous_graph_while_rebuilding(self):
+        versions = iter([1, 2, 2, 2])
+        building = threading.Event()
+        release = threading.Event()
+        builds = []
+
+        def loader():
+            builds.append(len(builds))
+            if len(builds) == 2:
+                building.set()
+                release.wait(5)
+            return make_flights(5)
+
+        cache = FlightGraphCache(loader=loader, version_loader=lambda: next(versions))
+        first = cache.get()
+        results = []
+        rebuild = threading.Thread(target=lambda: results.append(cache.get()))
+        rebuild.start()
+        building.wait(5)
+        self.assertIs(cache.get(), first)
+        release.set()
+        rebuild.join(5)
+        self.assertIsNot(results[0], first)
+        self.assertIs(cache.get(), results[0])
+
+    def test_small_changes_patch_the_current_graph(self):
+        upsert_flights(make_flights(60, seed=2))
+        cache = FlightGraphCache(delta_loader=load_flights_delta)
+        fs = cache.get()
+        graph_version = fs.graph_version
+
+        cancelled = flights.objects.order_by('id').first()
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        new_flights = make_flights(3, seed=50)
+        new_flights['flight_iata'] = ['NEW0', 'NEW1', 'NEW2']
+        upsert_flights(new_flights)
+
+        self.assertIs(cache.get(), fs)
+        self.assertGreater(fs.graph_version, graph_version)
+        self.assertNotIn(cancelled.pk, set(fs.df_flights['id']))
+        rebuilt = FlightSearch(load_flights_dataframe())
+        rebuilt._create_time_aware_graph()
+        self.assertEqual(set(fs.time_aware_graph.edges), set(rebuilt.time_aware_graph.edges))
+
+    def test_delta_refreshes_the_fare_matrix_in_the_background(self):
+        df_flights = make_flights(60, seed=2)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        changed = df_flights.head(3).copy()
+        changed['preco'] = 1.0
+        version = ['v1']
+        cache = FlightGraphCache(loader=lambda: df_flights.copy(), version_loader=lambda: version[0],
+                                 backend='networkx', delta_loader=lambda old, new: (changed, []))
+        fs = cache.get()
+        fs.fare_matrix()
+
+        version[0] = 'v2'
+        with mock.patch.object(FlightSearch, 'refresh_fare_matrix') as refresh:
+            self.assertIs(cache.get(), fs)
+        refresh.assert_called_once_with()
+        self.assertIsNone(fs._fare_matrix)
+
+        _, cost = fs.find_cheapest_path('GRU', 'REC')
+        with fs._fare_matrix_lock:  # enquanto outro thread recalcula a tabela, a resposta é ao vivo
+            self.assertEqual(fs.cheapest_fare('GRU', 'REC'), cost)
+        fs.refresh_fare_matrix().join()
+        self.assertIsNotNone(fs._fare_matrix)
+        self.assertAlmostEqual(fs.cheapest_fare('GRU', 'REC'), cost, places=6)
+
+
+class FlightLoaderTests(TestCase):
+    def test_window_loads_only_departures_inside_it(self):
+        df_flights = make_flights(40)
+        upsert_flights(df_flights)
+        window_start = pd.Timestamp('2025-10-01 09:00', tz='UTC')
+
+        loaded = load_flights_dataframe(window_start, window_hours=6)
+
+        expected = df_flights[(df_flights['departure_scheduled'] >= window_start)
+                              & (df_flights['departure_scheduled'] < window_start + pd.Timedelta(hours=6))]
+        self.assertEqual(sorted(loaded['flight_iata']), sorted(expected['flight_iata']))
+        self.assertEqual(str(loaded['departure_scheduled'].dtype), 'datetime64[ns, UTC]')
+        self.assertEqual(loaded['preco'].dtype, 'float64')
+        self.assertEqual(len(load_flights_dataframe()), 40)
+
+    def test_empty_table_loads_empty_dataframe(self):
+        self.assertTrue(load_flights_dataframe(window_hours=48).empty)
+
+    @override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+    @skipUnless(connection.vendor == 'sqlite', "query plans are checked on SQLite only")
+    def test_version_token_and_delta_use_indexes(self):
+        upsert_flights(make_flights(40))
+        with CaptureQueriesContext(connection) as queries:
+            version = flights_data_version()
+            load_flights_delta(version, version)
+        self.assertEqual(len(queries), 2)
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+                self.assertIn('flights_updated_at_idx', plan)
+                self.assertNotIn('SCAN frontend_flights', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+    def test_deleted_flights_change_the_version_and_force_a_rebuild(self):
+        upsert_flights(make_flights(40))
+        version = flights_data_version()
+        flights.objects.filter(pk__in=flights.objects.order_by('id').values('id')[:2]).delete()
+
+        new_version = flights_data_version()
+        self.assertEqual(new_version[0], version[0] + 2)
+        self.assertIsNone(load_flights_delta(version, new_version))
+
+
+class IngestionTests(TestCase):
+    def test_upsert_updates_existing_flights_instead_of_duplicating(self):
+        df_flights = make_flights(20)
+        self.assertEqual(upsert_flights(df_flights, batch_size=7), 20)
+        prices = dict(flights.objects.values_list('flight_iata', 'preco'))
+
+        refetch = df_flights.copy()
+        refetch['status'] = 'active'
+        refetch['preco'] = 1.0
+        refetch.loc[0, 'arrival_scheduled'] += pd.Timedelta(minutes=30)
+        upsert_flights(refetch)
+
+        self.assertEqual(flights.objects.count(), 20)
+        self.assertFalse(flights.objects.exclude(status='active').exists())
+        self.assertEqual(dict(flights.objects.values_list('flight_iata', 'preco')), prices)
+        self.assertEqual(flights.objects.get(flight_iata='XX0').arrival_scheduled,
+                         refetch.loc[0, 'arrival_scheduled'])
+
+    def test_ingest_command_streams_a_gzip_dump(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'flights.json.gz')
+        with gzip.open(path, 'wt') as dump:
+            json.dump(api_pages(make_flights(25), limit=100)[0], dump)
+
+        call_command('ingest_flights', from_file=path, stdout=io.StringIO())
+
+        self.assertEqual(flights.objects.count(), 25)
+
+
+class StubAviationStackServer(ThreadingHTTPServer):
+    """Servidor HTTP local que serve páginas gravadas da API AviationStack"""
+
+    def __init__(self, pages, fail_once_offsets=(), etags=False):
+        self.pages = {page['pagination']['offset']: page for page in pages}
+        self.fail_once_offsets = set(fail_once_offsets)
+        self.etags = etags
+        self.requested_offsets = []
+        self.not_modified = 0
+        super().__init__(('127.0.0.1', 0), StubAviationStackHandler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/v1/flights'
+
+
+class StubAviationStackHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        offset = int(parse_qs(urlparse(self.path).query)['offset'][0])
+        self.server.requested_offsets.append(offset)
+        if offset in self.server.fail_once_offsets:
+            self.server.fail_once_offsets.discard(offset)
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        etag = f'"page-{offset}"'
+        if self.server.etags and self.headers.get('If-None-Match') == etag:
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.pages[offset]).encode()
+        self.send_response(200)
+        if self.server.etags:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AviationStackClientTests(SimpleTestCase):
+    def start_server(self, pages, **kwargs):
+        server = StubAviationStackServer(pages, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_walks_all_pages_and_retries_rate_limited_ones(self):
+        server = self.start_server(api_pages(make_flights(95), limit=10), fail_once_offsets=[30])
+        client = AviationStackClient('key', url=server.url, limit=10, max_workers=3, backoff_factor=0)
+
+        pages = list(client.iter_pages())
+
+        self.assertEqual(sorted(page['pagination']['offset'] for page in pages), list(range(0, 100, 10)))
+        self.assertEqual(sum(len(page['data']) for page in pages), 95)
+        self.assertEqual(server.requested_offsets.count(30), 2)
+
+    def test_max_pages_limits_requests(self):
+        server = self.start_server(api_pages(make_flights(95), limit=10))
+        client = AviationStackClient('key', url=server.url, limit=10, max_pages=3, backoff_factor=0)
+
+        self.assertEqual(len(list(client.iter_pages())), 3)
+        self.assertEqual(len(server.requested_offsets), 3)
+
+    def test_fetch_flights_builds_dataframe_from_pages(self):
+        df_flights = make_flights(25)
+        server = self.start_server(api_pages(df_flights, limit=10))
+        fs = FlightSearch()
+        fs.url = server.url
+
+        fetched = fs.fetch_flights(build_graph=False)
+
+        self.assertEqual(sorted(fetched['flight_iata']), sorted(df_flights['flight_iata']))
+        self.assertEqual(fetched['departure_scheduled'].min(), df_flights['departure_scheduled'].min())
+
+    def test_cached_pages_are_revalidated_with_conditional_requests(self):
+        server = self.start_server(api_pages(make_flights(25), limit=10), etags=True)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache = ResponseCache(directory)
+        client = AviationStackClient('secret-key', url=server.url, limit=10, backoff_factor=0, cache=cache)
+
+        def fetch():
+            return sorted(client.iter_pages(), key=lambda page: page['pagination']['offset'])
+
+        first = fetch()
+        self.assertEqual(fetch(), first)  # dentro do ttl: nenhuma requisição
+        self.assertEqual(len(server.requested_offsets), 3)
+        self.assertEqual(cache.stats['hits'], 3)
+
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+        contents = {}
+        expired = time.time() - cache.ttl - 1
+        for path in paths:
+            os.utime(path, (expired, expired))
+            with open(path, 'rb') as cache_file:
+                contents[path] = cache_file.read()
+        self.assertEqual(fetch(), first)  # vencidas: revalidadas com requisições condicionais
+        self.assertEqual(server.not_modified, 3)
+        self.assertEqual(cache.stats['misses'], 3)
+        self.assertEqual(cache.stats['revalidated'], 3)
+        for path in paths:
+            with open(path, 'rb') as cache_file:
+                self.assertEqual(cache_file.read(), contents[path])  # o 304 não regrava a página
+            self.assertLess(time.time() - os.path.getmtime(path), cache.ttl)
+        self.assertEqual(fetch(), first)
+        self.assertEqual(cache.stats['hits'], 6)
+        for name in os.listdir(cache.directory):
+            with gzip.open(os.path.join(cache.directory, name), 'rt') as cache_file:
+                self.assertNotIn('secret-key', cache_file.read())
+
+    def test_replay_serves_recorded_pages_without_the_network(self):
+        server = self.start_server(api_pages(make_flights(25), limit=10))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        recorded = list(AviationStackClient('key', url=server.url, limit=10, backoff_factor=0,
+                                            cache=ResponseCache(directory, ttl=0)).iter_pages())
+        server.shutdown()
+
+        replay = ResponseCache(directory, ttl=0, replay=True)
+        client = AviationStackClient('other-key', url=server.url, limit=10, backoff_factor=0, cache=replay)
+        replayed = list(client.iter_pages())
+
+        self.assertEqual(sum(len(page['data']) for page in replayed), sum(len(page['data']) for page in recorded))
+        self.assertEqual(replay.stats['hits'], 3)
+        with self.assertRaises(ResponseCacheMiss):
+            client.fetch_page(offset=1000)
+
+
+class NormalizeTests(SimpleTestCase):
+    def test_incomplete_flights_are_dropped_and_times_parsed(self):
+        records = api_pages(make_flights(5), limit=10)[0]['data']
+        records[1]['arrival']['iata'] = None
+        records[2]['departure']['scheduled'] = 'not a date'
+        del records[3]['airline']
+        del records[4]['flight_status']
+
+        df_flights = normalize_flights(records)
+
+        self.assertEqual(list(df_flights['flight_iata']), ['XX0', 'XX4'])
+        self.assertEqual(list(df_flights['status']), ['scheduled', 'scheduled'])
+        self.assertEqual(str(df_flights['departure_scheduled'].dtype), 'datetime64[ns, UTC]')
+        self.assertTrue(((df_flights['preco'] >= 0) & (df_flights['preco'] <= 1000)).all())
+
+    def test_incremental_reader_matches_json_loads(self):
+        page = api_pages(make_flights(30), limit=50)[0]
+        page['data'][0]['airline']['name'] = 'Aérea São João'
+        dump = json.dumps(page, ensure_ascii=False).encode()
+
+        # Trechos pequenos cortam registros, números e caracteres UTF-8 ao meio
+        records = list(iter_json_records(io.BytesIO(dump), chunk_size=7))
+        self.assertEqual(records, page['data'])
+        self.assertEqual(list(iter_json_records(io.StringIO(json.dumps(page['data'])), chunk_size=5)), page['data'])
+
+        batches = list(iter_flight_batches(io.BytesIO(dump), batch_size=8))
+        self.assertEqual([len(batch) for batch in batches], [8, 8, 8, 6])
+        self.assertEqual(batches[0].loc[0, 'airline_name'], 'Aérea São João')
+
+
+class FakeGeminiModel:
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        return type('Response', (), {'text': self.answer})()
+
+
+class AirportCodeResolverTests(SimpleTestCase):
+    def setUp(self):
+        llm_answer_cache.clear()
+        resolver_stats.reset()
+        self.fs = FlightSearch(make_flights(30))
+        self.fs.gemini_model = FakeGeminiModel("Start: POA\nDestination: REC")
+
+    def test_match_airport_codes(self):
+        known = {'GRU', 'GIG', 'BSB'}
+        self.assertEqual(match_airport_codes("GRU para GIG", known), ('GRU', 'GIG'))
+        self.assertEqual(match_airport_codes("Quero ir de BSB até o GIG amanhã", known), ('BSB', 'GIG'))
+        self.assertIsNone(match_airport_codes("para GIG saindo de GRU", known))
+        self.assertIsNone(match_airport_codes("GRU para XYZ", known))
+        self.assertEqual(match_airport_codes("GRU → GIG", known), ('GRU', 'GIG'))
+        self.assertIsNone(match_airport_codes("gru para gig", known))
+        self.assertIsNone(match_airport_codes("GRU GIG", known))
+        self.assertIsNone(match_airport_codes("GRU para GIG ou BSB", known))
+
+    def test_reversed_phrasings_defer_to_the_model(self):
+        known = {'GRU', 'GIG', 'REC'}
+        self.assertIsNone(match_airport_codes("Preciso chegar em GIG saindo de GRU", known))
+        self.assertIsNone(match_airport_codes("quero ir a Recife (REC) vindo de GRU", known))
+        # Palavras comuns em minúsculas não viram códigos
+        self.assertEqual(match_airport_codes("the flight for GRU to GIG", {'GRU', 'GIG', 'THE', 'FOR'}),
+                         ('GRU', 'GIG'))
+
+    def test_known_codes_skip_the_model(self):
+        self.assertEqual(self.fs.extract_airport_codes("GRU para GIG"), ('GRU', 'GIG'))
+        self.assertEqual(self.fs.gemini_model.calls, 0)
+
+    def test_reversed_order_goes_to_the_model(self):
+        self.fs.gemini_model = FakeGeminiModel("Start: GRU\nDestination: GIG")
+        self.assertEqual(self.fs.extract_airport_codes("Preciso chegar em GIG saindo de GRU"), ('GRU', 'GIG'))
+        self.assertEqual(self.fs.gemini_model.calls, 1)
+
+    def test_model_answers_are_cached_by_normalized_text(self):
+        self.assertEqual(self.fs.extract_airport_codes("De Porto Alegre a Recife"), ('POA', 'REC'))
+        self.assertEqual(self.fs.extract_airport_codes("  de porto alegre   a  recife "), ('POA', 'REC'))
+        self.assertEqual(self.fs.gemini_model.calls, 1)
+
+        stats = resolver_stats.snapshot()
+        self.assertEqual(stats['lookups'], 2)
+        self.assertEqual(stats['llm']['hits'], 1)
+        self.assertEqual(stats['cache']['hit_rate'], 0.5)
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+class SearchFlightsViewTests(TestCase):
+    def setUp(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+
+    def test_itinerary_is_loaded_with_a_single_query(self):
+        self.client.get('/search/', {'query': 'GRU para REC'})  # aquece o cache do grafo
+
+        with self.assertNumQueries(2):  # token de versão + voos do itinerário
+            response = self.client.get('/search/', {'query': 'GRU para REC'})
+
+        itinerary = response.context['itinerary']
+        self.assertTrue(response.context['has_results'])
+        self.assertEqual(itinerary[0].departure_iata, 'GRU')
+        self.assertEqual(itinerary[-1].arrival_iata, 'REC')
+        self.assertAlmostEqual(float(sum(flight.preco for flight in itinerary)),
+                               float(response.context['cheapest_cost']), places=2)
+
+    def test_alternatives_come_from_a_single_pareto_search(self):
+        expected = self.client.get('/search/', {'query': 'GRU para REC'}).context['cheapest_cost']
+
+        with mock.patch.object(FlightSearch, 'find_cheapest_path') as find_cheapest_path:
+            response = self.client.get('/search/', {'query': 'GRU para REC', 'alternativas': '1'})
+
+        find_cheapest_path.assert_not_called()
+        options = response.context['options']
+        self.assertTrue(options)
+        self.assertAlmostEqual(response.context['cheapest_cost'], options[0]['cost'], places=2)
+        self.assertAlmostEqual(float(response.context['cheapest_cost']), float(expected), places=2)
+        self.assertEqual(response.context['itinerary'][0].departure_iata, 'GRU')
+
+
+class ScaleBenchmarkTests(TestCase):
+    def test_reports_every_stage(self):
+        result = bench_scales(scales=(300,), backend='csr')
+        entry = result['scales'][0]
+        for stage in ('generate', 'process_flight_data', 'create_time_aware_graph', 'hub_query',
+                      'regional_query', 'ingest', 'search_view_cold', 'search_view_warm'):
+            self.assertGreaterEqual(entry[stage]['seconds'], 0)
+        self.assertGreater(entry['create_time_aware_graph']['peak_bytes'], 0)
+        self.assertEqual(entry['search_view_warm']['status'], 200)
+        json.dumps(result)
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None, FLIGHT_SEARCH_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        metrics.reset()
+        resolver_stats.reset()
+        self.addCleanup(flight_graph_cache.invalidate)
+
+    def test_search_reports_stages_and_metrics(self):
+        with self.assertLogs('frontend.timing', level='INFO') as logs:
+            response = self.client.get('/search/', {'query': 'GRU para REC'})
+            self.client.get('/search/', {'query': 'GRU para REC'})
+
+        stages = [entry.split(';')[0] for entry in response['Server-Timing'].split(', ')]
+        for name in ('db_version', 'db_read', 'dataframe', 'graph_build', 'graph_cache',
+                     'airport_codes', 'cheapest_path', 'itinerary_db', 'render', 'total'):
+            self.assertIn(name, stages)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/search/')
+        self.assertEqual(record['counters']['graph_cache_miss'], 1)
+
+        snapshot = self.client.get('/metrics/').json()
+        self.assertEqual(snapshot['counters']['graph_cache_miss'], 1)
+        self.assertEqual(snapshot['counters']['graph_cache_hit'], 1)
+        self.assertEqual(snapshot['counters']['airport_codes_regex'], 2)
+        self.assertEqual(snapshot['stages']['request:/search/']['count'], 2)
+        self.assertEqual(snapshot['stages']['graph_build']['count'], 1)
+        self.assertEqual(snapshot['airport_codes']['regex']['hits'], 2)
+        self.assertEqual(snapshot['airport_codes']['regex']['hit_rate'], 1.0)
+
+    @override_settings(FLIGHT_SEARCH_INSTRUMENTATION=False)
+    def test_disabled_instrumentation_adds_nothing(self):
+        response = self.client.get('/search/', {'query': 'GRU para REC'})
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        self.assertIs(stage('render'), stage('graph_build'))
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_url_import_does_not_load_heavy_modules(self):
+        self.assertEqual(bench_startup(repeat=1)['heavy_modules_loaded'], [])
+
+
+class GraphSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.df_flights = make_flights(80, seed=4)
+        self.df_flights['id'] = range(1, len(self.df_flights) + 1)
+
+    def test_snapshot_round_trip_is_memory_mapped(self):
+        fs = FlightSearch(self.df_flights.copy(), backend='csr')
+        fs._create_time_aware_graph()
+        fs.save_snapshot(self.directory, 'v1')
+
+        loaded = FlightSearch.from_snapshot(self.directory, 'v1')
+        self.assertIsInstance(loaded.csr_graph.targets, np.memmap)
+        self.assertIsNone(load_snapshot(self.directory, 'v2'))
+        airports = sorted(set(self.df_flights['departure_iata']) | set(self.df_flights['arrival_iata']))
+        for origin, destination in itertools.permutations(airports, 2):
+            itinerary, cost = loaded.find_cheapest_path(origin, destination)
+            expected_itinerary, expected_cost = fs.find_cheapest_path(origin, destination)
+            self.assertAlmostEqual(cost, expected_cost, places=6)
+            if expected_itinerary:
+                self.assertEqual([item.get('flight_id') for item in itinerary],
+                                 [item.get('flight_id') for item in expected_itinerary])
+
+    def test_cache_builds_once_and_other_workers_map_the_snapshot(self):
+        FlightGraphCache(loader=lambda: self.df_flights.copy(), version_loader=lambda: 'v1',
+                         snapshot_dir=self.directory).get()
+
+        def fail():
+            raise AssertionError("the snapshot should be used instead of the database")
+
+        fs = FlightGraphCache(loader=fail, version_loader=lambda: 'v1', snapshot_dir=self.directory).get()
+        self.assertEqual(fs.backend, 'csr')
+        self.assertIsInstance(fs.csr_graph.offsets, np.memmap)
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None, FLIGHT_SEARCH_BATCH_WORKERS=2)
+class BatchSearchViewTests(TestCase):
+    def setUp(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+        self.addCleanup(close_batch_pool)
+
+    def post(self, payload):
+        return self.client.post('/api/search/batch/', json.dumps(payload), content_type='application/json')
+
+    def test_streams_one_result_per_query(self):
+        queries = [
+            {'origin': 'GRU', 'destination': 'REC'},
+            {'origin': 'poa', 'destination': 'GIG', 'depart_after': '2025-10-01T06:00:00+00:00',
+             'depart_before': '2025-10-01T12:00:00+00:00'},
+            {'origin': 'XXX', 'destination': 'GIG'},
+        ]
+        response = self.post({'queries': queries})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        results = sorted((json.loads(line) for line in b''.join(response.streaming_content).splitlines()),
+                         key=lambda result: result['index'])
+
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        fs = flight_graph_cache.get()
+        _, cost = fs.find_cheapest_path('GRU', 'REC')
+        self.assertAlmostEqual(results[0]['cost'], cost, places=6)
+        _, cost = fs.find_cheapest_path('POA', 'GIG', depart_after=pd.Timestamp('2025-10-01 06:00', tz='UTC'),
+                                        depart_before=pd.Timestamp('2025-10-01 12:00', tz='UTC'))
+        self.assertEqual(results[1]['found'], cost != float('inf'))
+        self.assertFalse(results[2]['found'])
+
+    def test_rejects_invalid_payload(self):
+        self.assertEqual(self.post({'queries': [{'origin': 'GRU'}]}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/batch/').status_code, 405)
+
+
+class BatchSearchPoolTests(SimpleTestCase):
+    def test_request_pools_are_created_in_the_background_without_fork(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.addCleanup(close_batch_pool)
+        df_flights = make_flights(60, seed=11)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        fs = FlightSearch(df_flights, backend='csr')
+        fs._create_time_aware_graph()
+        fs.save_snapshot(directory, 'v1')
+        queries = [{'origin': 'GRU', 'destination': 'REC', 'depart_after': None, 'depart_before': None}]
+
+        pool = batch_pool_for(fs, 2, (directory, 'v1'))
+        self.assertIsNone(pool._pool)  # enquanto o pool é criado, a consulta roda no próprio processo
+        expected = list(pool.imap(queries))
+        for thread in threading.enumerate():
+            if thread.name == 'batch-pool':
+                thread.join()
+
+        pool = batch_pool_for(fs, 2, (directory, 'v1'))
+        self.assertEqual(pool._pool._ctx.get_start_method(), WORKER_START_METHOD)
+        self.assertNotEqual(WORKER_START_METHOD, 'fork')
+        self.assertIs(batch_pool_for(fs, 2, (directory, 'v1')), pool)
+        self.assertEqual(list(pool.imap(queries)), expected)
+
+    def join_pool_threads(self):
+        for thread in threading.enumerate():
+            if thread.name == 'batch-pool':
+                thread.join()
+
+    def test_pool_without_a_snapshot_dir_spreads_queries_over_its_workers(self):
+        self.addCleanup(close_batch_pool)
+        df_flights = make_flights(300, seed=12)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        fs = FlightSearch(df_flights)
+        fs._create_time_aware_graph()
+        pairs = list(itertools.permutations(sorted(set(df_flights['departure_iata'])), 2))
+        queries = [{'origin': origin, 'destination': destination, 'depart_after': None, 'depart_before': None}
+                   for origin, destination in pairs * 20]
+
+        batch_pool_for(fs, 2)
+        self.join_pool_threads()
+        pool = batch_pool_for(fs, 2)
+        self.assertIsNotNone(pool._pool)  # o grafo foi gravado em um snapshot temporário
+        results = sorted(pool.imap(queries), key=lambda result: result['index'])
+
+        self.assertGreater(len(pool.worker_pids), 1)
+        self.assertNotIn(os.getpid(), pool.worker_pids)
+        for (origin, destination), result in zip(pairs, results):
+            _, cost = fs.find_cheapest_path(origin, destination)
+            self.assertEqual(result['found'], cost != float('inf'))
+            if result['found']:
+                self.assertAlmostEqual(result['cost'], cost, places=6)
+
+        # Enquanto o pool da nova versão é criado, o anterior continua respondendo
+        fs.apply_flight_delta(cancelled=[1, 2, 3])
+        self.assertIs(batch_pool_for(fs, 2), pool)
+        self.join_pool_threads()
+        self.assertIsNot(batch_pool_for(fs, 2), pool)
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+class SearchApiTests(TestCase):
+    def setUp(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+
+    def test_json_matches_find_cheapest_path_without_orm_lookups(self):
+        self.client.get('/api/search/', {'origin': 'GRU', 'destination': 'REC'})  # aquece o cache do grafo
+
+        with self.assertNumQueries(1):  # só o token de versão
+            data = self.client.get('/api/search/', {'query': 'GRU para REC'}).json()
+
+        _, cost = flight_graph_cache.get().find_cheapest_path('GRU', 'REC')
+        self.assertTrue(data['found'])
+        self.assertAlmostEqual(data['cost'], cost, places=6)
+        self.assertEqual(data['itinerary'][0]['from'], 'GRU')
+        self.assertEqual(data['itinerary'][-1]['to'], 'REC')
+
+    def test_ndjson_streams_itineraries_in_price_order(self):
+        response = self.client.get('/api/search/', {'origin': 'GRU', 'destination': 'REC', 'format': 'ndjson', 'k': 4})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        options, summary = lines[:-1], lines[-1]
+        self.assertTrue(summary['done'])
+        self.assertEqual(summary['count'], len(options))
+        costs = [option['cost'] for option in options]
+        self.assertEqual(costs, sorted(costs))
+        _, cost = flight_graph_cache.get().find_cheapest_path('GRU', 'REC')
+        self.assertAlmostEqual(costs[0], cost, places=6)
+
+    def test_ndjson_stream_does_not_hold_the_graph_lock(self):
+        fs = flight_graph_cache.get()
+        expected = [cost for _, cost in fs.find_k_cheapest_paths('GRU', 'REC', 5)]
+        response = self.client.get('/api/search/', {'origin': 'GRU', 'destination': 'REC', 'format': 'ndjson'})
+        lines = iter(response.streaming_content)
+        first = json.loads(next(lines))
+
+        # Com o cliente parado no meio da resposta, uma atualização do grafo não espera
+        cancelled = fs.df_flights['id'].tolist()[:10]
+        updater = threading.Thread(target=fs.apply_flight_delta, kwargs={'cancelled': cancelled})
+        updater.start()
+        updater.join(timeout=5)
+        self.assertFalse(updater.is_alive())
+        self.assertFalse(fs.df_flights['id'].isin(cancelled).any())
+
+        # e o restante da resposta continua vindo do grafo em que a busca começou
+        rest = [json.loads(line) for line in lines]
+        self.assertTrue(rest[-1]['done'])
+        costs = [option['cost'] for option in [first] + rest[:-1]]
+        self.assertEqual(len(costs), len(expected))
+        for cost, expected_cost in zip(costs, expected):
+            self.assertAlmostEqual(cost, expected_cost, places=6)
+
+    def test_unresolved_airports_are_rejected(self):
+        self.assertEqual(self.client.get('/api/search/', {'origin': 'GRU'}).status_code, 400)
+
+
+class FareMatrixTests(TestCase):
+    def test_fares_match_live_search_on_both_backends(self):
+        df_flights = make_flights(120, seed=7)
+        airports = sorted(set(df_flights['departure_iata']) | set(df_flights['arrival_iata']))
+        for backend, processes in (('networkx', 1), ('csr', 2)):
+            fs = FlightSearch(df_flights.copy(), backend=backend)
+            fs._create_time_aware_graph()
+            fs.build_fare_matrix(processes)
+            for origin, destination in itertools.permutations(airports, 2):
+                _, expected = fs.find_cheapest_path(origin, destination)
+                self.assertAlmostEqual(fs.cheapest_fare(origin, destination), expected, places=6)
+                itinerary, cost = fs.cheapest_fare_itinerary(origin, destination)
+                if itinerary:
+                    self.assertAlmostEqual(cost, expected, places=6)
+                    self.assertEqual((itinerary[0]['from'], itinerary[-1]['to']), (origin, destination))
+            self.assertIsNone(fs.cheapest_fare('GRU', 'XXX'))
+
+    def test_snapshot_keeps_the_fare_matrix(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        fs = FlightSearch(make_flights(60, seed=3), backend='csr')
+        fs._create_time_aware_graph()
+        fs.build_fare_matrix(1)
+        fs.save_snapshot(directory, 'v1')
+
+        loaded = FlightSearch.from_snapshot(directory, 'v1')
+        self.assertIsInstance(loaded._fare_matrix.fares, np.memmap)
+        self.assertEqual(loaded.cheapest_fare('GRU', 'REC'), fs.cheapest_fare('GRU', 'REC'))
+
+    def join_fare_matrix_threads(self):
+        for thread in threading.enumerate():
+            if thread.name == 'fare-matrix':
+                thread.join(timeout=10)
+
+    @override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None, FLIGHT_SEARCH_FARE_MATRIX=True)
+    def test_api_uses_live_search_until_the_background_matrix_is_ready(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+        started = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+        sweeps = []
+        from_search_graph = FareMatrix.from_search_graph
+
+        def slow_sweep(*args):
+            sweeps.append(threading.current_thread().name)
+            started.set()
+            release.wait(timeout=10)
+            return from_search_graph(*args)
+
+        with mock.patch.object(FareMatrix, 'from_search_graph', side_effect=slow_sweep):
+            data = self.client.get('/api/fare/', {'origin': 'GRU', 'destination': 'REC'}).json()
+            self.assertTrue(started.wait(timeout=5))
+            fs = flight_graph_cache.get()
+            self.assertIsNone(fs._fare_matrix)  # a primeira resposta veio de uma busca ao vivo
+            release.set()
+            self.join_fare_matrix_threads()
+        self.assertEqual(sweeps, ['fare-matrix'])  # nunca no thread da requisição
+        self.assertIsNotNone(fs._fare_matrix)
+        _, cost = fs.find_cheapest_path('GRU', 'REC')
+        self.assertAlmostEqual(data['cost'], cost, places=6)
+
+        with mock.patch.object(FlightSearch, 'find_cheapest_path') as live:
+            data = self.client.get('/api/fare/', {'origin': 'GRU', 'destination': 'REC'}).json()
+        live.assert_not_called()
+        self.assertAlmostEqual(data['cost'], cost, places=6)
+
+        depart_after = pd.Timestamp('2025-10-01 20:00', tz='UTC')
+        data = self.client.get('/api/fare/', {'origin': 'GRU', 'destination': 'REC',
+                                              'depart_after': depart_after.isoformat()}).json()
+        itinerary, cost = fs.find_cheapest_path('GRU', 'REC', depart_after=depart_after)
+        self.assertEqual(data['found'], bool(itinerary))
+        if itinerary:
+            self.assertAlmostEqual(data['cost'], cost, places=6)
+            self.assertGreaterEqual(itinerary[0]['departure'], depart_after)
+
+    @override_settings(FLIGHT_SEARCH_FARE_MATRIX=True)
+    def test_background_matrix_is_added_to_the_cache_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        df_flights = make_flights(60, seed=3)
+        cache = FlightGraphCache(loader=lambda: df_flights.copy(), version_loader=lambda: 'v1',
+                                 snapshot_dir=directory)
+        fs = cache.get()
+        self.join_fare_matrix_threads()
+
+        loaded = FlightSearch.from_snapshot(directory, 'v1')
+        self.assertIsInstance(loaded._fare_matrix.fares, np.memmap)
+        self.assertEqual(loaded.cheapest_fare('GRU', 'REC'), fs.cheapest_fare('GRU', 'REC'))
+
+    @override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+    def test_api_defaults_to_live_search(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+
+        data = self.client.get('/api/fare/', {'origin': 'GRU', 'destination': 'REC'}).json()
+        fs = flight_graph_cache.get()
+        self.assertIsNone(fs._fare_matrix)
+        _, cost = fs.find_cheapest_path('GRU', 'REC')
+        self.assertAlmostEqual(data['cost'], cost, places=6)
+
+    @override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None, FLIGHT_SEARCH_FARE_MATRIX=True,
+                       FLIGHT_SEARCH_FARE_MATRIX_WORKERS=2)
+    def test_snapshot_command_builds_the_fare_matrix(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        upsert_flights(make_flights(60, seed=11))
+
+        call_command('snapshot_graph', directory=directory, stdout=io.StringIO())
+        fs = FlightSearch.from_snapshot(directory, search_window_version())
+        self.assertIsInstance(fs._fare_matrix.fares, np.memmap)
+        _, cost = fs.find_cheapest_path('GRU', 'REC')
+        self.assertAlmostEqual(fs.cheapest_fare('GRU', 'REC'), cost, places=6)
+
+
+class ReadWriteLockTests(SimpleTestCase):
+    def test_writer_is_not_starved_by_continuous_readers(self):
+        lock = ReadWriteLock()
+        stop = threading.Event()
+
+        def read():
+            while not stop.is_set():
+                with lock.reading():
+                    time.sleep(0.005)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        self.addCleanup(lambda: [reader.join() for reader in readers])
+        self.addCleanup(stop.set)
+        time.sleep(0.02)
+
+        acquired = threading.Event()
+
+        def write():
+            with lock.writing():
+                acquired.set()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        writer.join(timeout=5)
+        self.assertTrue(acquired.is_set())
+
+    def test_nested_read_does_not_wait_for_a_waiting_writer(self):
+        lock = ReadWriteLock()
+        writer_waiting = threading.Event()
+        steps = []
+
+        def write():
+            writer_waiting.set()
+            with lock.writing():
+                steps.append('write')
+
+        with lock.reading():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer_waiting.wait()
+            while not lock._writers_waiting:
+                time.sleep(0.001)
+            with lock.reading():
+                steps.append('nested read')
+        writer.join(timeout=5)
+        self.assertEqual(steps, ['nested read', 'write'])
+
+
+class FlightDeltaTests(SimpleTestCase):
+    def graph_edges(self, fs):
+        return {(u, v, tuple(sorted(data.items()))) for u, v, data in fs.time_aware_graph.edges(data=True)}
+
+    def test_patched_graph_matches_a_full_rebuild(self):
+        df_flights = make_flights(150, seed=8)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        inserted = make_flights(20, seed=80)
+        inserted['id'] = range(1000, 1020)
+        # Voos entre os mesmos nós de voos existentes: o último encobre o anterior
+        shadowing = df_flights.iloc[:4].copy()
+        shadowing['id'] = range(2000, 2004)
+        updated = df_flights.iloc[10:20].copy()
+        updated['preco'] += 5
+        updated.loc[updated.index[:3], 'status'] = 'cancelled'
+
+        fs = FlightSearch(df_flights.copy())
+        fs._create_time_aware_graph()
+        for delta in ({'inserted': pd.concat([inserted, shadowing]), 'updated': updated, 'cancelled': [30, 31, 32]},
+                      {'cancelled': [2000, 2001]}):
+            graph_version = fs.graph_version
+            fs.apply_flight_delta(**delta)
+            self.assertEqual(fs.graph_version, graph_version + 1)
+            rebuilt = FlightSearch(fs.df_flights.copy())
+            rebuilt._create_time_aware_graph()
+            self.assertEqual(self.graph_edges(fs), self.graph_edges(rebuilt))
+        self.assertFalse(fs.df_flights['id'].isin([11, 12, 13, 30, 2000]).any())
+
+    def test_delta_leaves_the_previous_graph_unchanged(self):
+        df_flights = make_flights(150, seed=8)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        shadowing = df_flights.iloc[:4].copy()
+        shadowing['id'] = range(2000, 2004)
+        shadowing['preco'] = 1.0
+        fs = FlightSearch(df_flights.copy())
+        fs._create_time_aware_graph()
+        previous = fs.search_graph()
+        edges = self.graph_edges(fs)
+
+        fs.apply_flight_delta(inserted=shadowing, cancelled=[30, 31, 32])
+
+        self.assertIsNot(fs.search_graph(), previous)
+        self.assertEqual({(u, v, tuple(sorted(data.items()))) for u, v, data in previous.graph.edges(data=True)},
+                         edges)
+
+    def test_search_is_not_blocked_by_a_fare_sweep_and_a_delta(self):
+        df_flights = make_flights(80, seed=9)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        fs = FlightSearch(df_flights.copy())
+        fs._create_time_aware_graph()
+        sweeping = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+        from_search_graph = FareMatrix.from_search_graph
+
+        def slow_sweep(*args):
+            sweeping.set()
+            release.wait(timeout=10)
+            return from_search_graph(*args)
+
+        with mock.patch.object(FareMatrix, 'from_search_graph', side_effect=slow_sweep):
+            refresh = fs.refresh_fare_matrix()
+            self.assertTrue(sweeping.wait(timeout=5))
+            delta = threading.Thread(target=fs.apply_flight_delta, kwargs={'cancelled': [1, 2, 3]})
+            delta.start()
+            delta.join(timeout=5)
+            self.assertFalse(delta.is_alive())
+
+            searched = threading.Event()
+            search = threading.Thread(target=lambda: (fs.find_cheapest_path('GRU', 'REC'), searched.set()))
+            search.start()
+            self.assertTrue(searched.wait(timeout=5))
+            release.set()
+            refresh.join(timeout=5)
+        # A tabela calculada sobre o grafo anterior é descartada
+        self.assertIsNone(fs._fare_matrix)
+
+    def test_csr_backend_rebuilds_its_arrays(self):
+        df_flights = make_flights(80, seed=9)
+        df_flights['id'] = range(1, len(df_flights) + 1)
+        fs = FlightSearch(df_flights.copy(), backend='csr')
+        fs._create_time_aware_graph()
+        fs.apply_flight_delta(cancelled=[1, 2, 3])
+
+        expected = FlightSearch(df_flights[~df_flights['id'].isin([1, 2, 3])].reset_index(drop=True), backend='csr')
+        expected._create_time_aware_graph()
+        self.assertEqual(fs.csr_graph.n_edges, expected.csr_graph.n_edges)
+        self.assertAlmostEqual(fs.find_cheapest_path('GRU', 'REC')[1], expected.find_cheapest_path('GRU', 'REC')[1])
+
+
+class FlightTableTests(SimpleTestCase):
+    def test_compact_table_keeps_search_results(self):
+        df_flights = make_flights(120, seed=21)
+        full = FlightSearch(df_flights.copy())
+        full._create_time_aware_graph()
+        # Preços como Decimal, como vêm do ORM
+        df_flights['preco'] = [Decimal(str(price)) for price in df_flights['preco']]
+        compact = FlightSearch(df_flights.copy())
+        compact._process_flight_data()
+
+        self.assertEqual(list(compact.df_flights.columns), [column for column in SEARCH_COLUMNS if column != 'id'])
+        self.assertEqual(str(compact.df_flights['departure_iata'].dtype), 'category')
+        self.assertTrue(compact.df_flights['departure_iata'].cat.categories.equals(
+            compact.df_flights['arrival_iata'].cat.categories))
+        self.assertEqual(compact.df_flights['preco'].dtype, 'float64')
+        self.assertLess(sum(memory_by_column(compact.df_flights).values()),
+                        sum(memory_by_column(df_flights).values()) / 3)
+        for origin, destination in (('GRU', 'REC'), ('POA', 'GIG')):
+            self.assertEqual(compact.find_cheapest_path(origin, destination),
+                             full.find_cheapest_path(origin, destination))
+
+    def test_concat_unions_categories(self):
+        first = compact_flights(make_flights(10, airports=('GRU', 'GIG')))
+        second = make_flights(5, airports=('POA', 'REC'), seed=3)
+
+        merged = concat_flights([first, second])
+
+        self.assertEqual(len(merged), 15)
+        self.assertEqual(list(merged['departure_iata'].cat.categories), ['GIG', 'GRU', 'POA', 'REC'])
+        self.assertEqual(list(merged['departure_iata'].iloc[10:]), list(second['departure_iata']))
+        self.assertEqual(str(merged['flight_number'].dtype), 'category')
+
+
+@override_settings(FLIGHT_SEARCH_WINDOW_HOURS=None)
+class RouteMapTests(TestCase):
+    def setUp(self):
+        upsert_flights(make_flights(60, seed=11))
+        flight_graph_cache.invalidate()
+        self.addCleanup(flight_graph_cache.invalidate)
+
+    def test_routes_collapse_to_one_row_per_airport_pair(self):
+        df_flights = make_flights(60, seed=11)
+        routes = route_summary(compact_flights(df_flights))
+
+        pairs = df_flights.groupby(['departure_iata', 'arrival_iata'])['preco']
+        self.assertEqual(len(routes), pairs.ngroups)
+        self.assertEqual(routes['flights'].sum(), 60)
+        cheapest = pairs.min()
+        for row in routes.itertuples():
+            self.assertEqual(row.cheapest_fare, cheapest[(row.departure_iata, row.arrival_iata)])
+
+    def test_view_serves_cached_images_revalidated_by_etag(self):
+        response = self.client.get('/routes/map.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+
+        fs = flight_graph_cache.get()
+        self.assertIs(fs.plot_routes('png'), fs.plot_routes('png'))
+        revalidated = self.client.get('/routes/map.png', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        svg = self.client.get('/routes/map.svg')
+        self.assertIn(b'<svg', svg.content)
+        self.assertNotEqual(svg['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/routes/map.gif').status_code, 404)
@@ -1,8 +1,14 @@
 from django.urls import path
 
 from . import views
+from .instrumentation import metrics_view
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("search/", views.search_flights, name="search_flights"),
+    path("api/search/", views.search_api, name="search_api"),
+    path("api/search/batch/", views.batch_search, name="batch_search"),
+    path("api/fare/", views.fare_api, name="fare_api"),
+    path("routes/map.<str:fmt>", views.route_map, name="route_map"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
\ No newline at end of file
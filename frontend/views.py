@@ -1,111 +1,203 @@
+import hashlib
+import json
+from itertools import islice
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.utils import timezone
-from .FlightSearch import FlightSearch
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .batch import batch_pool_for
+from .graph_cache import flight_graph_cache
+from .instrumentation import stage
 from .models import flights
-import requests
-import os
-from random import randint
-import pandas as pd
-from datetime import datetime
+from .route_map import ROUTE_MAP_FORMATS
+from .serializers import (MAX_STREAMED_ITINERARIES, parse_batch_queries, parse_time, serialize_itinerary,
+                          serialize_itinerary_option)
 
 def index(request):
     return render(request, 'frontend/index.html')
 
 def search_flights(request):
     query = request.GET.get('query', '')
+    show_options = request.GET.get('alternativas') == '1'
     
-    # Inicializa o FlightSearch
-    fs = FlightSearch()
-
-    # Verifica se já existem voos no banco
-    existing_flights = flights.objects.all()
-    
-    
-    if not existing_flights.exists():
-        # Se não existem voos, busca da API e salva no banco
-        df_flights = fs.fetch_flights()
-        if df_flights is not None and not df_flights.empty:
-            # Converte o DataFrame em registros do modelo
-            for _, row in df_flights.iterrows():
-                flights.objects.create(
-                    flight_iata=row.get('flight_iata', ''),
-                    flight_icao=row.get('flight_icao', ''),
-                    flight_number=row.get('flight_number', ''),
-
-                    airline_name=row.get('airline_name', ''),
-                    airline_iata=row.get('airline_iata', ''),
-                    airline_icao=row.get('airline_icao', ''),
-
-                    departure_airport=row.get('departure_airport', ''),
-                    departure_iata=row.get('departure_iata', ''),
-                    departure_scheduled=row.get('departure_scheduled'),
-
-                    arrival_airport=row.get('arrival_airport', ''),
-                    arrival_iata=row.get('arrival_iata', ''),
-                    arrival_scheduled=row.get('arrival_scheduled'),
-
-                    status=row.get('flight_status'),
-                    preco=row.get('Preco', randint(0, 100000)/100)
-                )
-
-    # Converte os resultados para o formato do df_flights
-    flights_data = []
-    for flight in existing_flights:
-        flights_data.append({
-            'flight_iata': flight.flight_iata,
-            'flight_icao': flight.flight_icao,
-            'airline_name': flight.airline_name,
-            'airline_iata': flight.airline_iata,
-            'airline_icao': flight.airline_icao,
-            'flight_number': flight.flight_number,
-            'departure_airport': flight.departure_airport,
-            'departure_iata': flight.departure_iata,
-            'departure_scheduled': flight.departure_scheduled,
-            'arrival_airport': flight.arrival_airport,
-            'arrival_iata': flight.arrival_iata,
-            'arrival_scheduled': flight.arrival_scheduled,
-            'status': flight.status,
-            'preco': flight.preco
-        })
-    
-    # Cria um DataFrame com os dados formatados
-    df_flights = pd.DataFrame(flights_data)
-    
-    # Configura o FlightSearch com os dados do banco
-    fs.df_flights = df_flights
-    fs._process_flight_data()  # Processa os dados e cria o grafo
+    # Usa o grafo compartilhado do processo, reconstruído só quando os dados mudam
+    with stage('graph_cache'):
+        fs = flight_graph_cache.get()
+    if fs.df_flights is None or fs.df_flights.empty:
+        # A ingestão roda fora da requisição
+        print("No flights in the database. Run 'python manage.py ingest_flights' first.")
     
     # Encontra o caminho mais barato se necessário
     path = None
     cost = None
+    options = []
     if query:
         # Aqui você pode usar o modelo Gemini para extrair os códigos dos aeroportos da query
         origin_code, dest_code = fs.extract_airport_codes(query)
         if origin_code and dest_code:
-            path, cost = fs.find_cheapest_path(origin_code, dest_code)
+            if show_options:
+                # Opções não dominadas em preço, duração e escalas, em uma única busca; a
+                # primeira (ordem de preço) é a mais barata e vira o resultado principal
+                options = fs.find_pareto_paths(origin_code, dest_code)
+                if options:
+                    path, cost = options[0]['itinerary'], options[0]['cost']
+            else:
+                path, cost = fs.find_cheapest_path(origin_code, dest_code)
             if path:
                 print(f"Cheapest path found with cost: R${cost:.2f}")
 
     itinerary = []
     if path:
-        for item in path:
-            if not item.get('connection'):
-                # É um voo, vamos buscar no banco de dados
-                flight_obj = flights.objects.filter(
-                    flight_number=item['flight_number']
-                ).first()
-                
-                if flight_obj:
-                    itinerary.append(flight_obj)
-
-            
-    
+        # Os trechos trazem a chave primária do voo: uma única consulta para todo o itinerário
+        flight_ids = [int(item['flight_id']) for item in path if not item.get('connection')]
+        with stage('itinerary_db'):
+            flights_by_id = flights.objects.in_bulk(flight_ids)
+        itinerary = [flights_by_id[flight_id] for flight_id in flight_ids if flight_id in flights_by_id]
+
     # Passa os dados para o template
     context = {
         'itinerary': itinerary,  # Lista de voos e conexões
         'cheapest_cost': cost,   # Custo total
         'has_results': bool(path),  # Se encontrou algum caminho
+        'options': options,      # Alternativas não dominadas (preço, duração, escalas)
         'search_query': query    # Query original
     }
     
-    return render(request, 'frontend/results.html', context)
\ No newline at end of file
+    with stage('render'):
+        return render(request, 'frontend/results.html', context)
+
+
+@csrf_exempt
+@require_POST
+def batch_search(request):
+    """Busca o caminho mais barato de uma lista de pares (origem, destino, janela de partida).
+
+    As consultas são distribuídas em um pool de processos que compartilha o grafo, e os
+    resultados voltam em NDJSON, uma linha por consulta, na ordem em que terminam.
+    """
+    try:
+        queries = parse_batch_queries(json.loads(request.body), settings.FLIGHT_SEARCH_BATCH_MAX_QUERIES)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    with stage('graph_cache'):
+        fs = flight_graph_cache.get()
+    snapshot = None
+    if settings.FLIGHT_SEARCH_SNAPSHOT_DIR and fs.backend == 'csr':
+        snapshot = (settings.FLIGHT_SEARCH_SNAPSHOT_DIR, flight_graph_cache.version)
+    pool = batch_pool_for(fs, settings.FLIGHT_SEARCH_BATCH_WORKERS, snapshot)
+
+    lines = (json.dumps(result) + '\n' for result in pool.imap(queries))
+    return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+def search_api(request):
+    """Busca de itinerários em JSON, com os mesmos dados de find_cheapest_path.
+
+    Aceita query (texto livre) ou origin e destination, além de depart_after e
+    depart_before opcionais. Com format=ndjson (ou Accept: application/x-ndjson),
+    transmite em NDJSON até k itinerários, do mais barato ao mais caro, um por linha
+    à medida que a busca os encontra, seguidos de uma linha final com o total.
+    """
+    query = request.GET.get('query', '')
+    origin_code = request.GET.get('origin', '').strip().upper()
+    dest_code = request.GET.get('destination', '').strip().upper()
+    try:
+        depart_after = parse_time(request.GET.get('depart_after'), 'depart_after')
+        depart_before = parse_time(request.GET.get('depart_before'), 'depart_before')
+        k = max(1, min(int(request.GET.get('k', 5)), MAX_STREAMED_ITINERARIES))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    with stage('graph_cache'):
+        fs = flight_graph_cache.get()
+    if query and not (origin_code and dest_code):
+        origin_code, dest_code = fs.extract_airport_codes(query)
+    if not origin_code or not dest_code:
+        return JsonResponse({'error': "Could not identify origin and destination airports"}, status=400)
+
+    streaming = (request.GET.get('format') == 'ndjson'
+                 or 'application/x-ndjson' in request.headers.get('Accept', ''))
+    if streaming:
+        # Cada itinerário é enviado assim que a busca o encontra; o gerador percorre o
+        # grafo da versão atual sem travá-lo, então um cliente lento não segura atualizações
+        paths = fs.iter_cheapest_paths(origin_code, dest_code, depart_after=depart_after, depart_before=depart_before)
+
+        def lines():
+            count = 0
+            try:
+                for count, (itinerary, cost) in enumerate(islice(paths, k), start=1):
+                    yield json.dumps(serialize_itinerary_option(count, itinerary, cost)) + '\n'
+            finally:
+                paths.close()
+            yield json.dumps({'done': True, 'origin': origin_code, 'destination': dest_code, 'count': count}) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    itinerary, cost = fs.find_cheapest_path(origin_code, dest_code, depart_after=depart_after,
+                                            depart_before=depart_before)
+    return JsonResponse({
+        'query': query,
+        'origin': origin_code,
+        'destination': dest_code,
+        'found': bool(itinerary),
+        'cost': float(cost) if itinerary else None,
+        'itinerary': serialize_itinerary(itinerary),
+    })
+
+
+def fare_api(request):
+    """Menor tarifa entre origin e destination, sem itinerário.
+
+    Com FLIGHT_SEARCH_FARE_MATRIX e sem janela de partida, a resposta vem da tabela de
+    tarifas mínimas (O(1)); caso contrário, de uma busca ao vivo.
+    """
+    origin_code = request.GET.get('origin', '').strip().upper()
+    dest_code = request.GET.get('destination', '').strip().upper()
+    try:
+        depart_after = parse_time(request.GET.get('depart_after'), 'depart_after')
+        depart_before = parse_time(request.GET.get('depart_before'), 'depart_before')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not origin_code or not dest_code:
+        return JsonResponse({'error': "Parameters 'origin' and 'destination' are required"}, status=400)
+
+    with stage('graph_cache'):
+        fs = flight_graph_cache.get()
+    with stage('fare_lookup'):
+        cost = fs.cheapest_fare(origin_code, dest_code, depart_after=depart_after, depart_before=depart_before,
+                                live=not settings.FLIGHT_SEARCH_FARE_MATRIX)
+    found = cost is not None and cost != float('inf')
+    return JsonResponse({
+        'origin': origin_code,
+        'destination': dest_code,
+        'found': found,
+        'cost': float(cost) if found else None,
+    })
+
+
+def route_map(request, fmt):
+    """Mapa das rotas entre aeroportos, em PNG ou SVG.
+
+    A imagem é desenhada uma vez por versão do grafo. O ETag segue essa versão, então o
+    navegador revalida com If-None-Match e recebe 304 enquanto o grafo não muda.
+    """
+    content_type = ROUTE_MAP_FORMATS.get(fmt)
+    if content_type is None:
+        return JsonResponse({'error': f"Unsupported route map format '{fmt}'"}, status=404)
+
+    with stage('graph_cache'):
+        fs = flight_graph_cache.get()
+    version = repr((flight_graph_cache.version, fs.graph_version, fmt))
+    etag = quote_etag(hashlib.sha1(version.encode()).hexdigest()[:16])
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    response = HttpResponse(fs.plot_routes(fmt), content_type=content_type)
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
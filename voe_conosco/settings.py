@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'frontend.instrumentation.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -122,6 +123,30 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Flight search
+# Backend do grafo temporal usado nas buscas: 'networkx' ou 'csr' (arrays NumPy)
+FLIGHT_SEARCH_BACKEND = getenv("FLIGHT_SEARCH_BACKEND", "networkx")
+
+# Horas de voos, a partir de agora, carregadas no grafo de busca (0 carrega a tabela inteira)
+FLIGHT_SEARCH_WINDOW_HOURS = int(getenv("FLIGHT_SEARCH_WINDOW_HOURS", "48")) or None
+
+# Diretório dos snapshots do grafo (arrays NumPy mapeados em memória por todos os workers).
+# Vazio desliga os snapshots; com snapshots o grafo usa sempre o backend CSR
+FLIGHT_SEARCH_SNAPSHOT_DIR = getenv("FLIGHT_SEARCH_SNAPSHOT_DIR", "") or None
+
+# Processos que atendem o endpoint de busca em lote (0 = um por núcleo) e consultas por requisição
+FLIGHT_SEARCH_BATCH_WORKERS = int(getenv("FLIGHT_SEARCH_BATCH_WORKERS", "0")) or None
+FLIGHT_SEARCH_BATCH_MAX_QUERIES = int(getenv("FLIGHT_SEARCH_BATCH_MAX_QUERIES", "1000"))
+
+# Responde /api/fare/ com a tabela de tarifas mínimas entre todos os pares de aeroportos
+# (consultas em O(1)), gravada por snapshot_graph ou calculada em segundo plano depois de
+# cada construção do grafo, em vez de uma busca ao vivo; e os processos da varredura em snapshot_graph (0 = um por núcleo)
+FLIGHT_SEARCH_FARE_MATRIX = getenv("FLIGHT_SEARCH_FARE_MATRIX", "false").lower() in ("1", "true", "yes")
+FLIGHT_SEARCH_FARE_MATRIX_WORKERS = int(getenv("FLIGHT_SEARCH_FARE_MATRIX_WORKERS", "0")) or None
+
+# Mede as etapas das requisições (cabeçalho Server-Timing, log 'frontend.timing' e /metrics/)
+FLIGHT_SEARCH_INSTRUMENTATION = getenv("FLIGHT_SEARCH_INSTRUMENTATION", "false").lower() in ("1", "true", "yes")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 